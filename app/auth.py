@@ -1,14 +1,24 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.config import settings
+from app.metrics import LatencyHistogram
 from app.models import User
+from app.timing import timed
 
 
+logger = logging.getLogger(__name__)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
@@ -22,33 +32,188 @@ fake_users_db = {
         "username": "demo",
         "hashed_password": DEMO_PASSWORD_HASH,
         "disabled": False,
+        "tier": "default",
     }
 }
 
 
+def _bcrypt_verify(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def _select_password_verifier() -> Callable[[str, str], bool]:
+    """Choose passlib or direct bcrypt once, using a cheap low-cost probe hash"""
+    probe_hash = bcrypt.hashpw(b"probe", bcrypt.gensalt(rounds=4)).decode()
+    try:
+        if pwd_context.verify("probe", probe_hash):
+            return pwd_context.verify
+    except Exception as e:
+        logger.warning(f"passlib bcrypt backend unusable ({str(e)}), verifying with bcrypt directly")
+    return _bcrypt_verify
+
+
+_password_verifier = _select_password_verifier()
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password with fallback to direct bcrypt if passlib fails"""
+    """Verify password with the backend selected at startup"""
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return _password_verifier(plain_password, hashed_password)
     except Exception:
-        # Fallback to direct bcrypt verification if passlib has compatibility issues
+        return False
+
+
+class LoginThrottledError(Exception):
+    """Raised when too many password verifications are already pending"""
+
+
+class PasswordVerifier:
+    """Runs bcrypt checks on a small dedicated thread pool.
+    
+    bcrypt releases the GIL while hashing, so verification runs in parallel
+    with the event loop instead of stalling in-flight inference responses.
+    At most ``max_pending`` checks may be queued or running; beyond that
+    logins are rejected rather than piling up.
+    """
+    
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-verify")
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait_ms = LatencyHistogram()
+        self.verify_ms = LatencyHistogram()
+        self.lock = threading.Lock()
+    
+    def _timed_verify(self, plain_password: str, hashed_password: str, submitted_at: float) -> bool:
+        started = time.perf_counter()
+        with self.lock:
+            self.running += 1
+            self.queue_wait_ms.record((started - submitted_at) * 1000)
+        try:
+            return verify_password(plain_password, hashed_password)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.verify_ms.record((time.perf_counter() - started) * 1000)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise LoginThrottledError("Too many concurrent logins, please retry")
+        self.pending += 1
         try:
-            return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-        except Exception:
-            return False
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, self._timed_verify, plain_password, hashed_password, time.perf_counter()
+            )
+        finally:
+            self.pending -= 1
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+    
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "max_workers": self.max_workers,
+                "pending": self.pending,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "queue_wait_ms": self.queue_wait_ms.summary(),
+                "verify_ms": self.verify_ms.summary(),
+            }
+
+
+password_verifier = PasswordVerifier(
+    max_workers=settings.LOGIN_MAX_CONCURRENCY,
+    max_pending=settings.LOGIN_MAX_PENDING,
+)
 
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class VerifiedTokenCache:
+    """Bounded LRU of already-verified bearer tokens.
+    
+    Keyed by the SHA-256 digest of the token so raw credentials are not kept
+    in memory. Entries are honoured only until the token's own ``exp``.
+    """
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.tokens: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+    
+    def get(self, token: str) -> Optional[str]:
+        digest = self._digest(token)
+        with self.lock:
+            entry = self.tokens.get(digest)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self.tokens[digest]
+                self.misses += 1
+                return None
+            self.tokens.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, token: str, username: str, expires_at: float):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.tokens[self._digest(token)] = (username, expires_at)
+            if len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+    
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.tokens), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = VerifiedTokenCache(max_size=settings.AUTH_TOKEN_CACHE_SIZE)
+_user_cache: Dict[str, User] = {}
+
+
 def get_user(username: str) -> Optional[User]:
+    user = _user_cache.get(username)
+    if user is not None:
+        return user
     if username in fake_users_db:
         user_dict = fake_users_db[username]
-        return User(**user_dict)
+        user = _user_cache[username] = User(**user_dict)
+        return user
     return None
 
 
+def invalidate_user(username: str):
+    """Drop a cached user record; call after changing or disabling a user"""
+    _user_cache.pop(username, None)
+
+
+def clear_auth_caches():
+    """Forget every cached user record and verified token (e.g. on key rotation)"""
+    _user_cache.clear()
+    token_cache.clear()
+
+
 def authenticate_user(username: str, password: str) -> Optional[User]:
     user = get_user(username)
     if not user:
@@ -58,6 +223,16 @@ def authenticate_user(username: str, password: str) -> Optional[User]:
     return user
 
 
+async def authenticate_user_async(username: str, password: str) -> Optional[User]:
+    """Like authenticate_user, but verifies the password off the event loop"""
+    user = get_user(username)
+    if not user:
+        return None
+    if not await password_verifier.verify(password, fake_users_db[username]["hashed_password"]):
+        return None
+    return user
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -69,22 +244,31 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+def user_from_token(token: str) -> User:
+    """Validate a bearer token and return its user, or raise HTTP 401"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        username: str = payload.get("sub")
+    with timed("auth"):
+        username = token_cache.get(token)
         if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = get_user(username)
+            try:
+                payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+                username = payload.get("sub")
+                if username is None:
+                    raise credentials_exception
+            except JWTError:
+                raise credentials_exception
+            if "exp" in payload:
+                token_cache.put(token, username, float(payload["exp"]))
+        
+        user = get_user(username)
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    return user_from_token(credentials.credentials)
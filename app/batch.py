@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import orjson
+import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from app.auth import get_current_user
+from app.config import settings
+from app.inference import run_inference
+from app.models import InferenceRequest, User
+from app.rate_limiter import rate_limiter
+from app.llm_service import BackendUnavailableError, ollama_service
+from app.scheduler import QueueFullError
+from app.state_backend import offload
+from app.token_budget import apply_max_tokens, estimate_tokens, token_budget
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines", "application/jsonlines")
+
+# Queue item: (index, raw JSON value or parse error message)
+BatchItem = Tuple[int, Any]
+
+
+def _line(data: dict) -> bytes:
+    return orjson.dumps(data) + b"\n"
+
+
+async def _read_json_array(http_request: Request) -> List[Any]:
+    try:
+        body = orjson.loads(await http_request.body())
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON body: {str(e)}")
+    if isinstance(body, dict):
+        body = body.get("prompts")
+    if not isinstance(body, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a JSON array of prompts or an object with a 'prompts' array",
+        )
+    if len(body) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {settings.BATCH_MAX_ITEMS} prompts",
+        )
+    return body
+
+
+async def _queue_items(body: List[Any], items: asyncio.Queue) -> int:
+    for index, value in enumerate(body):
+        await items.put((index, value))
+    return len(body)
+
+
+async def _read_jsonl(http_request: Request, items: asyncio.Queue) -> int:
+    """Parse a JSONL upload line by line, queueing prompts as they arrive"""
+    count = 0
+    buffer = b""
+    
+    async def emit(raw: bytes):
+        nonlocal count
+        raw = raw.strip()
+        if not raw:
+            return
+        if count >= settings.BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch exceeds {settings.BATCH_MAX_ITEMS} prompts",
+            )
+        try:
+            value = orjson.loads(raw)
+        except orjson.JSONDecodeError as e:
+            value = ValueError(f"Invalid JSON line: {str(e)}")
+        await items.put((count, value))
+        count += 1
+    
+    async for chunk in http_request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            await emit(raw)
+    await emit(buffer)
+    return count
+
+
+class _UploadStreamingResponse(StreamingResponse):
+    """StreamingResponse that starts while the request body is still arriving.
+    
+    Starlette watches ``receive`` for a disconnect while it streams, which
+    would swallow the chunks of an upload that has not been read yet; the
+    watch only starts once ``uploaded`` is set.
+    """
+    
+    def __init__(self, content: AsyncIterator[bytes], uploaded: asyncio.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.uploaded = uploaded
+    
+    async def listen_for_disconnect(self, receive):
+        await self.uploaded.wait()
+        await super().listen_for_disconnect(receive)
+
+
+def _parse_item(value: Any) -> InferenceRequest:
+    if isinstance(value, Exception):
+        raise value
+    if isinstance(value, str):
+        value = {"prompt": value}
+    if not isinstance(value, dict):
+        raise ValueError("Each item must be a prompt string or an object with a 'prompt' field")
+    if "prompt" not in value:
+        raise ValueError("Item is missing 'prompt'")
+    return InferenceRequest(
+        prompt=value.get("prompt"), options=value.get("options"), model=value.get("model"), max_tokens=value.get("max_tokens")
+    )
+
+
+async def _process_item(index: int, value: Any, user: User, charge_per_item: bool) -> dict:
+    item_id = value.get("id") if isinstance(value, dict) else None
+    result: Dict[str, Any] = {"index": index}
+    if item_id is not None:
+        result["id"] = item_id
+    
+    try:
+        request = _parse_item(value)
+        model = ollama_service.resolve_model(request.model)
+        if charge_per_item:
+            limit = await offload(rate_limiter.acquire, user.username, user.tier)
+            if not limit.allowed:
+                result.update(error="Rate limit exceeded", retry_after=round(limit.retry_after, 2))
+                return result
+        options = apply_max_tokens(request.options, request.max_tokens)
+        estimate = estimate_tokens(request.prompt, options)
+        token_limit = await offload(token_budget.reserve, user.username, user.tier, estimate)
+        if token_limit is not None and not token_limit.allowed:
+            result.update(error="Token budget exceeded", retry_after=round(token_limit.retry_after, 2))
+            return result
+        inference = await run_inference(request.prompt, options, user, model=model, reserved_tokens=estimate)
+        result.update(response=inference.response, cache=inference.cache_status, latency_ms=round(inference.latency_ms, 2))
+    except ValidationError as e:
+        result["error"] = f"Invalid item: {e.errors()[0]['msg']}"
+    except (QueueFullError, BackendUnavailableError) as e:
+        result.update(error=str(e), retry_after=round(e.retry_after, 2))
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+@router.post("/v1/infer/batch")
+async def infer_batch(http_request: Request, current_user: User = Depends(get_current_user)):
+    """Run many prompts with bounded parallelism, streaming NDJSON results in completion order.
+    
+    Accepts a JSON array (of prompt strings or ``{"prompt", "options", "model", "max_tokens", "id"}``
+    objects), an object with a ``prompts`` array, or a JSONL upload
+    (``Content-Type: application/x-ndjson``). Each result line carries the
+    item's ``index`` in the upload.
+    """
+    charge_per_item = settings.BATCH_RATE_LIMIT_MODE == "item"
+    headers = {}
+    if not charge_per_item:
+        headers = (await offload(rate_limiter.check_rate_limit, current_user.username, current_user.tier)).headers()
+    
+    start = time.perf_counter()
+    # Both queues are bounded: results stream out while the upload is still
+    # being read, so a large upload never piles up in memory
+    items: asyncio.Queue = asyncio.Queue(maxsize=settings.BATCH_MAX_CONCURRENCY * 2)
+    results: asyncio.Queue = asyncio.Queue(maxsize=settings.BATCH_MAX_CONCURRENCY * 2)
+    uploaded = asyncio.Event()
+    
+    # A JSON array has to be parsed whole anyway, so it is read up front and a
+    # malformed one is still answered with 400/413; a JSONL upload is read
+    # line by line inside the stream
+    content_type = http_request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_MEDIA_TYPES:
+        read = lambda: _read_jsonl(http_request, items)
+    else:
+        body = await _read_json_array(http_request)
+        uploaded.set()
+        read = lambda: _queue_items(body, items)
+    
+    async def worker():
+        while True:
+            index, value = await items.get()
+            try:
+                await results.put(await _process_item(index, value, current_user, charge_per_item))
+            finally:
+                items.task_done()
+    
+    async def feed() -> int:
+        # Ends the result stream with None once every item is answered, or
+        # with the error that stopped the upload
+        try:
+            total = await read()
+        except Exception as e:
+            await results.put(e)
+            return 0
+        finally:
+            uploaded.set()
+        await items.join()
+        await results.put(None)
+        return total
+    
+    async def result_stream() -> AsyncIterator[bytes]:
+        workers = [asyncio.create_task(worker()) for _ in range(settings.BATCH_MAX_CONCURRENCY)]
+        feeder = asyncio.create_task(feed())
+        errors = 0
+        try:
+            while (result := await results.get()) is not None:
+                if isinstance(result, Exception):
+                    # Too late for an error status; report it as the last line
+                    detail = result.detail if isinstance(result, HTTPException) else str(result)
+                    yield _line({"error": detail})
+                    return
+                errors += "error" in result
+                yield _line(result)
+            total = feeder.result()
+            yield _line({"summary": {
+                "total": total,
+                "succeeded": total - errors,
+                "failed": errors,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+            }})
+            logger.info(
+                f"Batch of {total} prompts completed",
+                extra={"user_id": current_user.username, "status": "success" if not errors else "partial"},
+            )
+        finally:
+            feeder.cancel()
+            for task in workers:
+                task.cancel()
+    
+    return _UploadStreamingResponse(result_stream(), uploaded, media_type="application/x-ndjson", headers=headers)
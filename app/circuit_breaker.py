@@ -0,0 +1,104 @@
+import logging
+import time
+from app.prometheus_metrics import CIRCUIT_STATE
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Fail fast in front of a backend that keeps failing.
+    
+    ``failure_threshold`` consecutive failures open the circuit and calls are
+    refused without touching the backend. After ``reset_timeout`` seconds the
+    circuit half-opens and lets up to ``half_open_requests`` trial calls
+    through: a success closes it again, a failure re-opens it.
+    """
+    
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, half_open_requests: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self.consecutive_failures = 0
+        self.opened = 0
+        CIRCUIT_STATE.labels(backend=name).set(0)
+    
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+    
+    def available(self) -> bool:
+        """Whether a call would be let through, without reserving it"""
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and self._trials < self.half_open_requests)
+    
+    def acquire(self) -> bool:
+        """Reserve a call; False means the circuit refuses it"""
+        if not self.available():
+            return False
+        if self._state == HALF_OPEN:
+            self._trials += 1
+        return True
+    
+    def release(self):
+        """Return a reservation whose call ended without a verdict (e.g. cancelled)"""
+        if self._state == HALF_OPEN and self._trials:
+            self._trials -= 1
+    
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self._state != CLOSED:
+            self._transition(CLOSED)
+    
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._state == HALF_OPEN:
+            self.trip("trial call failed")
+        elif self.consecutive_failures >= self.failure_threshold:
+            self.trip(f"{self.consecutive_failures} consecutive failures")
+    
+    def trip(self, reason: str):
+        """Open the circuit now, restarting the reset timeout"""
+        self._opened_at = time.monotonic()
+        if self._state != OPEN:
+            self.opened += 1
+            logger.warning(f"Circuit for {self.name} opened: {reason}")
+            self._transition(OPEN)
+    
+    def half_open(self):
+        """Let trial calls through without waiting out the reset timeout"""
+        if self._state == OPEN:
+            self._transition(HALF_OPEN)
+    
+    def retry_after(self) -> float:
+        """Seconds until the circuit will let a call through"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+    
+    def _transition(self, state: str):
+        if state == CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+        self._state = state
+        self._trials = 0
+        CIRCUIT_STATE.labels(backend=self.name).set(_STATE_VALUES[state])
+    
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "retry_after_seconds": round(self.retry_after(), 2),
+        }
@@ -0,0 +1,139 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class _Flight:
+    """A single in-flight upstream call shared by every identical request"""
+    
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class _Broadcast:
+    """Fan out the chunks of one upstream stream to many subscribers.
+    
+    Chunks are buffered for the lifetime of the stream so that subscribers
+    joining late replay the output from the first token.
+    """
+    
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Future] = None
+        self._changed = asyncio.Event()
+    
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    async def produce(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+    
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class RequestCoalescer:
+    """Single-flight deduplication of identical concurrent generations.
+    
+    Requests with the same key (model, prompt and options) await one upstream
+    call and share its result. The upstream call is cancelled only once every
+    waiter has gone away.
+    """
+    
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.upstream_calls = 0
+        self.coalesced_requests = 0
+        self.upstream_streams = 0
+        self.coalesced_streams = 0
+    
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Await the shared result for ``key``; returns (result, coalesced)"""
+        flight = self._flights.get(key)
+        coalesced = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+            self.upstream_calls += 1
+        else:
+            self.coalesced_requests += 1
+        
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), coalesced
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                self._forget(self._flights, key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+    
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> Tuple[AsyncIterator[str], bool]:
+        """Join the shared token stream for ``key``; returns (chunks, coalesced)"""
+        broadcast = self._streams.get(key)
+        coalesced = broadcast is not None
+        if broadcast is None:
+            broadcast = _Broadcast()
+            broadcast.task = asyncio.ensure_future(broadcast.produce(factory()))
+            self._streams[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self._forget(self._streams, key, broadcast))
+            self.upstream_streams += 1
+        else:
+            self.coalesced_streams += 1
+        return self._subscribe(key, broadcast), coalesced
+    
+    async def _subscribe(self, key: str, broadcast: _Broadcast) -> AsyncIterator[str]:
+        broadcast.subscribers += 1
+        try:
+            async for chunk in broadcast.subscribe():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.task.done():
+                self._forget(self._streams, key, broadcast)
+                broadcast.task.cancel()
+    
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, entry: Any):
+        if registry.get(key) is entry:
+            del registry[key]
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "in_flight_streams": len(self._streams),
+            "upstream_calls": self.upstream_calls,
+            "coalesced_requests": self.coalesced_requests,
+            "upstream_streams": self.upstream_streams,
+            "coalesced_streams": self.coalesced_streams,
+        }
+
+
+request_coalescer = RequestCoalescer()
@@ -0,0 +1,123 @@
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import zstandard
+except ImportError:  # optional: without it only gzip is offered
+    zstandard = None
+
+
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+# Streamed bodies worth compressing; token streams (text/plain, SSE) are
+# left alone since their tiny chunks would only grow
+STREAM_MEDIA_TYPES = ("application/x-ndjson",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick zstd or gzip from an Accept-Encoding header, preferring zstd"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip())
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Incremental encoder whose output can be flushed after every chunk"""
+    
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._sync = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            # wbits 31: deflate inside a gzip container
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._sync = zlib.Z_SYNC_FLUSH
+    
+    def compress(self, data: bytes, final: bool = False) -> bytes:
+        out = self._obj.compress(data)
+        # A sync flush ends each chunk on a byte boundary the client can decode
+        # immediately, so NDJSON lines are not held back in the encoder
+        return out + (self._obj.flush() if final else self._obj.flush(self._sync))
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing large responses with zstd or gzip.
+    
+    Complete bodies are compressed once they reach ``minimum_size`` bytes.
+    Streamed NDJSON bodies (batch results) are compressed chunk by chunk
+    with a flush after each, whatever their size; other streams pass through.
+    """
+    
+    def __init__(self, app, minimum_size: int = 1024, stream_media_types: tuple = STREAM_MEDIA_TYPES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.stream_media_types = stream_media_types
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                # First body chunk: decide how to send the whole response
+                headers = MutableHeaders(raw=start_message["headers"])
+                media_type = headers.get("content-type", "").split(";")[0].strip()
+                if "content-encoding" in headers or (
+                    not more_body and len(body) < self.minimum_size
+                ) or (more_body and media_type not in self.stream_media_types):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    body = compressor.compress(body, final=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+        
+        await self.app(scope, receive, send_wrapper)
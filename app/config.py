@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -7,19 +7,135 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str = "your-secret-key-change-this-in-production"
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_TOKEN_CACHE_SIZE: int = 4096  # verified tokens kept in memory; 0 disables
+    LOGIN_MAX_CONCURRENCY: int = 2  # threads running bcrypt checks
+    LOGIN_MAX_PENDING: int = 32  # queued + running checks before logins get 503
     
     # Ollama Configuration
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     OLLAMA_MODEL: str = "gemma:2b"
+    OLLAMA_TIMEOUT: float = 60.0  # seconds, per request
+    OLLAMA_CONNECT_TIMEOUT: float = 5.0
+    OLLAMA_HEALTH_TIMEOUT: float = 5.0
+    OLLAMA_MAX_CONNECTIONS: int = 256
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS: int = 64
+    OLLAMA_KEEPALIVE_EXPIRY: float = 30.0  # seconds an idle connection stays pooled
+    OLLAMA_KEEP_ALIVE: str = "30m"  # how long Ollama keeps a model loaded ("-1" = forever, "" = Ollama's default)
+    # Backends as JSON: [{"name": "gpu-1", "url": "http://10.0.0.5:11434",
+    # "models": ["gemma:2b", "llama3"], "weight": 2, "num_parallel": 4}, ...];
+    # empty means a single backend at OLLAMA_BASE_URL serving OLLAMA_MODEL
+    OLLAMA_BACKENDS: List[Dict[str, Any]] = []
+    
+    # Backend health: background probes and a circuit breaker per backend
+    HEALTH_PROBE_INTERVAL: float = 5.0  # seconds between /api/tags probes
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 3  # consecutive failures that open the circuit
+    CIRCUIT_BREAKER_RESET_TIMEOUT: float = 15.0  # seconds open before trial calls are let through
+    CIRCUIT_BREAKER_HALF_OPEN_REQUESTS: int = 1  # concurrent trial calls while half-open
+    
+    # Model warmup: /ready reports ready once every model is loaded and warmed
+    WARMUP_ENABLED: bool = True
+    WARMUP_PROMPTS: List[str] = ["Hello!"]
+    WARMUP_TIMEOUT: float = 300.0  # seconds per load or warm prompt; cold loads can be slow
+    KEEP_WARM_INTERVAL: float = 240.0  # ping models idle this long; 0 disables
     
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = 10
     RATE_LIMIT_WINDOW: int = 60  # seconds
+    RATE_LIMIT_TIERS: Dict[str, int] = {}  # tier -> requests per window
+    RATE_LIMIT_USER_OVERRIDES: Dict[str, int] = {}  # username -> requests per window
+    RATE_LIMIT_EVICT_INTERVAL: int = 60  # seconds between idle bucket sweeps
+    
+    # Token budgets: Ollama prompt + completion tokens per user per window
+    TOKEN_BUDGET_PER_WINDOW: int = 0  # 0 disables token budgets
+    TOKEN_BUDGET_WINDOW: int = 3600  # seconds
+    TOKEN_BUDGET_TIERS: Dict[str, int] = {}  # tier -> tokens per window
+    TOKEN_BUDGET_USER_OVERRIDES: Dict[str, int] = {}  # username -> tokens per window
+    TOKEN_ESTIMATE_CHARS_PER_TOKEN: float = 4.0  # prompt length to tokens, for admission
+    TOKEN_ESTIMATE_COMPLETION: int = 256  # completion tokens assumed without max_tokens
+    MAX_TOKENS_LIMIT: int = 4096  # largest max_tokens a request may ask for
+    
+    # Response Cache
+    PROMPT_CACHE_ENABLED: bool = True
+    PROMPT_CACHE_MAX_ENTRIES: int = 1024
+    PROMPT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    PROMPT_CACHE_TTL: float = 3600  # seconds
+    
+    # Persistent second cache tier on local disk, kept across restarts
+    DISK_CACHE_ENABLED: bool = False
+    DISK_CACHE_DIR: str = "cache"
+    DISK_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # segment size that triggers compaction
+    DISK_CACHE_TTL: float = 7 * 24 * 3600  # seconds
+    
+    # Semantic cache: answer paraphrased prompts from earlier generations (needs numpy)
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_EMBED_MODEL: str = "nomic-embed-text"  # must be pulled on every backend
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # minimum cosine similarity for a hit
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 10000  # rows preallocated in the vector matrix
+    SEMANTIC_CACHE_TTL: float = 3600  # seconds
+    SEMANTIC_CACHE_EMBED_TIMEOUT: float = 2.0  # seconds; on timeout the request skips the semantic tier
+    
+    # Conversation sessions: Ollama context kept per session for follow-up turns
+    SESSION_MAX_SESSIONS: int = 10000
+    SESSION_MAX_BYTES: int = 256 * 1024 * 1024
+    SESSION_TTL: float = 1800  # seconds idle before a session is dropped
+    SESSION_MAX_CONTEXT_TOKENS: int = 8192  # a session whose context grows past this takes no more turns
+    
+    # Upstream scheduling: keep in step with Ollama's OLLAMA_NUM_PARALLEL
+    OLLAMA_NUM_PARALLEL: int = 4  # per backend, unless the backend sets num_parallel
+    SCHEDULER_MAX_QUEUE_WAIT: float = 30.0  # seconds; beyond this, fail fast with 503
+    SCHEDULER_MAX_QUEUE_SIZE: int = 1000
+    SCHEDULER_INITIAL_SERVICE_TIME: float = 2.0  # seconds, seed for the service time estimate
+    SCHEDULER_TIER_PRIORITIES: Dict[str, int] = {}  # tier -> priority, lower is served first
+    
+    # Diagnostics: per-stage timing, event-loop monitoring and sampled profiling
+    SERVER_TIMING_ENABLED: bool = True  # per-stage breakdown in a Server-Timing response header
+    LOOP_MONITOR_INTERVAL: float = 0.1  # seconds between event-loop lag samples; 0 disables
+    LOOP_BLOCK_THRESHOLD: float = 0.25  # seconds the loop may stall before its stack is logged
+    PROFILE_SAMPLE_RATE: float = 0.0  # fraction of requests profiled; changeable at /debug/profiling
+    PROFILE_KEEP: int = 20  # most recent profiles kept
+    PROFILE_TOP_FUNCTIONS: int = 30
+    DEBUG_USERS: List[str] = []  # users allowed to use /debug endpoints
+    
+    # Request deadlines: clients send their timeout in seconds, capped by the maximum
+    REQUEST_TIMEOUT_HEADER: str = "X-Request-Timeout"
+    REQUEST_TIMEOUT_DEFAULT: float = 60.0  # seconds, when the client sends none
+    REQUEST_TIMEOUT_MAX: float = 120.0
+    
+    # Batch inference
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_MAX_CONCURRENCY: int = 8  # prompts of one batch in flight at once
+    BATCH_RATE_LIMIT_MODE: str = "batch"  # "batch": one charge per batch, "item": one per prompt
+    
+    # WebSocket channel: many prompts multiplexed over one authenticated connection
+    WS_MAX_IN_FLIGHT: int = 16  # prompts running at once per connection; more are rejected
+    WS_SEND_QUEUE_SIZE: int = 256  # outgoing messages buffered before producers wait on the client
+    WS_MAX_MESSAGE_BYTES: int = 64 * 1024
+    WS_AUTH_TIMEOUT: float = 10.0  # seconds to send the auth message when no header was given
+    
+    # Share one upstream generation between identical concurrent requests
+    COALESCE_REQUESTS: bool = True
+    
+    # State backend for rate limiter, metrics and cache: "memory" (per process)
+    # or "shared" (one state server per host, shared by all uvicorn workers)
+    STATE_BACKEND: str = "memory"
+    STATE_BACKEND_ADDRESS: str = "127.0.0.1:50055"  # host:port or Unix socket path
+    STATE_BACKEND_CONNECT_TIMEOUT: float = 5.0
+    STATE_BACKEND_FLUSH_INTERVAL: float = 1.0  # seconds between merges of a worker's request metrics
+    
+    # Response compression (zstd when the zstandard package is installed, else gzip)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes; smaller complete bodies are sent as is
     
     # API Configuration
     API_VERSION: str = "v1"
     LOG_LEVEL: str = "INFO"
     
+    # Logging: records are written by a background thread in batches
+    LOG_QUEUE_SIZE: int = 10000  # records buffered before the policy applies
+    LOG_QUEUE_POLICY: str = "drop"  # "drop": discard and count, "block": wait for room
+    LOG_BATCH_SIZE: int = 256  # max records per write
+    LOG_SUCCESS_SAMPLE_RATE: float = 1.0  # fraction of INFO success records kept
+    
     model_config = SettingsConfigDict(
         env_file=".env",
         case_sensitive=True
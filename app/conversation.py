@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import math
+import time
+import weakref
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from app.auth import get_current_user
+from app.config import settings
+from app.deadlines import CLIENT_CLOSED_REQUEST, ClientDisconnectedError, Deadline, DeadlineExceededError, run_with_deadline
+from app.llm_service import BackendUnavailableError, UnknownModelError, ollama_service
+from app.metrics import metrics_tracker
+from app.models import ChatRequest, ChatResponse, User
+from app.rate_limiter import rate_limiter
+from app.scheduler import QueueFullError, priority_for, scheduled_generate_result
+from app.serialization import FastJSONResponse
+from app.sessions import session_store
+from app.state_backend import offload
+from app.timing import stage_timings, timed
+from app.token_budget import HEADER_PREFIX as TOKEN_HEADER_PREFIX, apply_max_tokens, estimate_tokens, settle_tokens, token_budget
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# One turn at a time per session, or concurrent turns would fork its context
+_turn_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _turn_lock(session_id: str) -> asyncio.Lock:
+    lock = _turn_locks.get(session_id)
+    if lock is None:
+        lock = _turn_locks[session_id] = asyncio.Lock()
+    return lock
+
+
+def _session_full() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"Session context exceeded {settings.SESSION_MAX_CONTEXT_TOKENS} tokens; start a new session",
+    )
+
+
+@router.post("/v1/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, http_request: Request, current_user: User = Depends(get_current_user)):
+    """Send the next message of a conversation; only the new message goes upstream.
+    
+    Without ``session_id`` a new session is started. Follow-up turns pass the
+    context Ollama returned last time and prefer the backend that produced it.
+    The request deadline covers the queue and the upstream call, like ``/infer``.
+    """
+    deadline = Deadline.from_request(http_request)
+    session = None
+    if request.session_id:
+        session = await offload(session_store.get, request.session_id, current_user.username)
+        if session is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found or expired")
+        if session["full"]:
+            raise _session_full()
+    
+    try:
+        model = ollama_service.resolve_model(request.model or (session["model"] if session else None))
+    except UnknownModelError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if session and model != session["model"]:
+        # Context tokens only mean something to the model that produced them
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Session uses model {session['model']}; start a new session to switch models",
+        )
+    
+    with timed("rate_limit"):
+        rate_limit = await offload(rate_limiter.check_rate_limit, current_user.username, current_user.tier)
+        headers = rate_limit.headers()
+        options = apply_max_tokens(request.options, request.max_tokens)
+        estimate = estimate_tokens(request.message, options)
+        token_limit = await offload(token_budget.check_budget, current_user.username, current_user.tier, estimate)
+        if token_limit is not None:
+            headers.update(token_limit.headers(TOKEN_HEADER_PREFIX))
+    http_request.state.model = model
+    
+    session_id = request.session_id or session_store.new_id()
+    start_time = time.time()
+    async with _turn_lock(session_id):
+        if session:
+            # Re-read under the lock in case a concurrent turn just finished
+            session = await offload(session_store.get, session_id, current_user.username) or session
+            if session["full"]:
+                settle_tokens(current_user.username, current_user.tier, model, estimate)
+                raise _session_full()
+        context = session["context"] if session else []
+        try:
+            ollama_service.check_available(model)
+            result = await run_with_deadline(
+                scheduled_generate_result(
+                    current_user.username,
+                    priority_for(current_user.tier),
+                    request.message,
+                    options,
+                    model,
+                    context=context,
+                    prefer=session["backend"] if session else None,
+                    deadline=deadline,
+                ),
+                deadline,
+                http_request,
+            )
+        except (DeadlineExceededError, ClientDisconnectedError) as e:
+            # Counted by run_with_deadline; the turn never reached the session
+            settle_tokens(current_user.username, current_user.tier, model, estimate)
+            metrics_tracker.record_request((time.time() - start_time) * 1000, success=False)
+            code = status.HTTP_504_GATEWAY_TIMEOUT if isinstance(e, DeadlineExceededError) else CLIENT_CLOSED_REQUEST
+            raise HTTPException(status_code=code, detail=str(e))
+        except asyncio.CancelledError:
+            # The server dropped the request; return the reservation before unwinding
+            settle_tokens(current_user.username, current_user.tier, model, estimate)
+            metrics_tracker.record_request((time.time() - start_time) * 1000, success=False)
+            raise
+        except (QueueFullError, BackendUnavailableError) as e:
+            settle_tokens(current_user.username, current_user.tier, model, estimate)
+            metrics_tracker.record_request((time.time() - start_time) * 1000, success=False)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+            )
+        except Exception as e:
+            settle_tokens(current_user.username, current_user.tier, model, estimate)
+            latency_ms = (time.time() - start_time) * 1000
+            metrics_tracker.record_request(latency_ms, success=False)
+            logger.error(
+                f"Chat turn failed: {str(e)}",
+                extra={"user_id": current_user.username, "prompt_length": len(request.message), "latency_ms": round(latency_ms, 2), "status": "error"},
+            )
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Inference failed: {str(e)}"
+            )
+        
+        # Settle before saving, so a cancellation from here on cannot leave the
+        # reservation held. Only the new message is evaluated; reused context
+        # tokens cost nothing
+        settle_tokens(
+            current_user.username, current_user.tier, model, estimate,
+            result.get("prompt_eval_count", 0), result.get("eval_count", 0),
+        )
+        turn, context_full = await offload(
+            session_store.save,
+            session_id,
+            current_user.username,
+            model,
+            result.get("context") or [],
+            result.get("backend"),
+            reused_tokens=len(context),
+            evaluated_tokens=result.get("prompt_eval_count", 0),
+        )
+    
+    response_text = result.get("response", "")
+    latency_ms = (time.time() - start_time) * 1000
+    metrics_tracker.record_request(latency_ms, success=True)
+    logger.info(
+        "Chat turn completed successfully",
+        extra={
+            "user_id": current_user.username,
+            "model": model,
+            "prompt_length": len(request.message),
+            "response_length": len(response_text),
+            "latency_ms": round(latency_ms, 2),
+            "status": "success",
+            "timings": stage_timings(),
+        },
+    )
+    return FastJSONResponse(
+        {"session_id": session_id, "response": response_text, "turn": turn, "context_full": context_full},
+        headers=headers,
+    )
+
+
+@router.get("/v1/chat/{session_id}")
+async def get_session(session_id: str, current_user: User = Depends(get_current_user)):
+    """Size and turn count of one of the caller's sessions"""
+    info = await offload(session_store.info, session_id, current_user.username)
+    if info is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found or expired")
+    return info
+
+
+@router.delete("/v1/chat/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(session_id: str, current_user: User = Depends(get_current_user)):
+    """End a session and free its context"""
+    if not await offload(session_store.delete, session_id, current_user.username):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found or expired")
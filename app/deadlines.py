@@ -0,0 +1,120 @@
+import asyncio
+import math
+import time
+from typing import Any, Awaitable
+from fastapi import HTTPException, Request, status
+from app.config import settings
+from app.metrics import metrics_tracker
+from app.prometheus_metrics import REQUESTS_ABANDONED, REQUESTS_DEADLINE_EXCEEDED
+
+# Not a registered status; the nginx convention for "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request runs out of time before its response is ready"""
+    
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Request deadline of {timeout:g}s exceeded in {stage}")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the client goes away before its response is ready"""
+    
+    def __init__(self, stage: str):
+        super().__init__(f"Client disconnected in {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Time budget of one request.
+    
+    ``stage`` names the step the request is in ("admission", "cache",
+    "queue", "upstream") and is updated as it moves along, so a miss can be
+    attributed to the stage that ran out of time.
+    """
+    
+    __slots__ = ("timeout", "expires_at", "stage")
+    
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self.stage = "admission"
+    
+    @classmethod
+    def from_request(cls, http_request: Request) -> "Deadline":
+        """Deadline from the client's timeout header, capped by ``REQUEST_TIMEOUT_MAX``"""
+        raw = http_request.headers.get(settings.REQUEST_TIMEOUT_HEADER)
+        timeout = settings.REQUEST_TIMEOUT_DEFAULT
+        if raw is not None:
+            try:
+                timeout = float(raw)
+            except ValueError:
+                timeout = math.nan
+            if not timeout > 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"{settings.REQUEST_TIMEOUT_HEADER} must be a positive number of seconds",
+                )
+        return cls(min(timeout, settings.REQUEST_TIMEOUT_MAX))
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def enter(self, stage: str):
+        """Move to ``stage``, failing fast if no time is left"""
+        self.stage = stage
+        if self.remaining() <= 0:
+            raise DeadlineExceededError(stage, self.timeout)
+
+
+async def _disconnected(http_request: Request):
+    # The body has been read, so the next message is the disconnect
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def run_with_deadline(work: Awaitable[Any], deadline: Deadline, http_request: Request) -> Any:
+    """Await ``work`` until it finishes, the deadline passes or the client disconnects.
+    
+    In the latter two cases ``work`` is cancelled, which releases its queue
+    slot and closes the upstream connection so Ollama stops generating, and
+    DeadlineExceededError or ClientDisconnectedError is raised. Only call once
+    the request body has been read.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_disconnected(http_request))
+    try:
+        await asyncio.wait({task, watcher}, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    
+    if task.done():
+        try:
+            return task.result()
+        except DeadlineExceededError as e:
+            # Rejected up front by a stage that could not finish in time
+            _record_deadline_exceeded(e.stage)
+            raise
+    
+    stage = deadline.stage
+    task.cancel()
+    # Let the work unwind (refunds, slot release) before answering
+    await asyncio.wait({task})
+    if watcher.done() and not watcher.cancelled():
+        REQUESTS_ABANDONED.labels(stage=stage).inc()
+        metrics_tracker.record_cutoff(deadline_exceeded=False)
+        raise ClientDisconnectedError(stage)
+    _record_deadline_exceeded(stage)
+    raise DeadlineExceededError(stage, deadline.timeout)
+
+
+def _record_deadline_exceeded(stage: str):
+    REQUESTS_DEADLINE_EXCEEDED.labels(stage=stage).inc()
+    metrics_tracker.record_cutoff(deadline_exceeded=True)
+
@@ -0,0 +1,236 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from starlette.datastructures import MutableHeaders
+from app.auth import get_current_user
+from app.config import settings
+from app.metrics import LatencyHistogram
+from app.models import ProfilingConfig, User
+from app.prometheus_metrics import LOOP_BLOCKED, LOOP_LAG, STAGE_LATENCY
+from app.timing import begin_request, current_timing, end_request
+
+router = APIRouter(prefix="/debug")
+logger = logging.getLogger(__name__)
+
+# Frames of the event loop thread shown when it is caught blocked
+BLOCKED_STACK_FRAMES = 15
+
+
+class RequestProfiler:
+    """cProfile a random sample of requests, keeping the most recent reports.
+    
+    At most one request is profiled at a time. The profiler sees the whole
+    event loop thread, so other requests interleaved with the sampled one
+    show up in its report too.
+    """
+    
+    def __init__(self, sample_rate: float, keep: int, top: int):
+        self.sample_rate = sample_rate
+        self.top = top
+        self.profiles: deque = deque(maxlen=keep)
+        self.profiled = 0
+        self._active = False
+    
+    def start(self) -> Optional[cProfile.Profile]:
+        if self._active or not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) already owns the thread
+            return None
+        self._active = True
+        return profile
+    
+    def finish(self, profile: cProfile.Profile, route: str, status_code: int, duration: float):
+        profile.disable()
+        self._active = False
+        self.profiled += 1
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(self.top)
+        self.profiles.append({
+            "route": route,
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "profiled_at": datetime.utcnow().isoformat(),
+            "stats": report.getvalue(),
+        })
+    
+    def stats(self) -> dict:
+        return {"sample_rate": self.sample_rate, "profiled": self.profiled, "kept": len(self.profiles)}
+
+
+class StageStats:
+    """Per-stage latency histograms of this worker, for /metrics"""
+    
+    def __init__(self):
+        self.stages: Dict[str, LatencyHistogram] = {}
+    
+    def record(self, route: str, stages: Dict[str, float]):
+        for stage, seconds in stages.items():
+            STAGE_LATENCY.labels(route=route, stage=stage).observe(seconds)
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.record(seconds * 1000)
+    
+    def stats(self) -> dict:
+        return {stage: histogram.summary() for stage, histogram in self.stages.items()}
+
+
+class TimingMiddleware:
+    """ASGI middleware giving every request a per-stage timing breakdown.
+    
+    Code along the request path records stages with ``app.timing.timed``;
+    the breakdown is sent as a ``Server-Timing`` header, aggregated into
+    per-stage histograms and, for sampled requests, profiled with cProfile.
+    """
+    
+    def __init__(self, app, header: bool = True):
+        self.app = app
+        self.header = header
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        token = begin_request()
+        timing = current_timing()
+        profile = request_profiler.start()
+        status_code = 500
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.header and timing.stages:
+                    MutableHeaders(scope=message).append("Server-Timing", timing.header())
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_request(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            if profile is not None:
+                request_profiler.finish(profile, route, status_code, time.perf_counter() - timing.start)
+            stage_stats.record(route, timing.stages)
+
+
+class LoopMonitor:
+    """Measure event-loop lag and catch the code that blocks the loop.
+    
+    A task sleeps for ``interval`` and records how late it wakes up. A
+    watchdog thread checks that task's heartbeat; when the loop has not run
+    it for ``block_threshold`` seconds, it logs the stack the loop thread is
+    stuck in, which names the blocking call.
+    """
+    
+    def __init__(self, interval: float, block_threshold: float):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.lag_ms = LatencyHistogram()
+        self.blocked = 0
+        self._heartbeat = time.perf_counter()
+        self._reported_heartbeat: Optional[float] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+    
+    def start(self):
+        if self.interval <= 0:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample())
+        if self.block_threshold > 0:
+            threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+    
+    async def _sample(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self._heartbeat = now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self.lag_ms.record(lag * 1000)
+            LOOP_LAG.observe(lag)
+    
+    def _watch(self):
+        while not self._stop.wait(self.block_threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.perf_counter() - heartbeat - self.interval
+            if stalled < self.block_threshold or heartbeat == self._reported_heartbeat:
+                continue
+            # Report each stall once, with the stack the loop is stuck in
+            self._reported_heartbeat = heartbeat
+            self.blocked += 1
+            LOOP_BLOCKED.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame, limit=BLOCKED_STACK_FRAMES)) if frame is not None else ""
+            logger.warning(f"Event loop blocked for over {stalled * 1000:.0f}ms in:\n{stack}")
+    
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "lag_ms": self.lag_ms.summary(),
+            "blocked": self.blocked,
+        }
+
+
+def timing_stats() -> dict:
+    """This worker's stage timings, loop lag and profiling state, for /metrics"""
+    return {
+        "stages_ms": stage_stats.stats(),
+        "event_loop": loop_monitor.stats(),
+        "profiling": request_profiler.stats(),
+    }
+
+
+def _require_debug_user(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.username not in settings.DEBUG_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Debug endpoints are not enabled for this user")
+    return current_user
+
+
+@router.get("/profiling")
+async def get_profiling(current_user: User = Depends(_require_debug_user)):
+    """Profiling state of this worker and its most recent request profiles"""
+    return {**request_profiler.stats(), "profiles": list(request_profiler.profiles)}
+
+
+@router.put("/profiling")
+async def set_profiling(config: ProfilingConfig, current_user: User = Depends(_require_debug_user)):
+    """Change the profiled fraction of requests at runtime; 0 turns profiling off"""
+    request_profiler.sample_rate = config.sample_rate
+    logger.info(f"Request profiling sample rate set to {config.sample_rate} by {current_user.username}")
+    return request_profiler.stats()
+
+
+@router.delete("/profiling", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_profiles(current_user: User = Depends(_require_debug_user)):
+    request_profiler.profiles.clear()
+
+
+# Per worker: profiles and timings describe the process that serves the call
+request_profiler = RequestProfiler(settings.PROFILE_SAMPLE_RATE, settings.PROFILE_KEEP, settings.PROFILE_TOP_FUNCTIONS)
+stage_stats = StageStats()
+loop_monitor = LoopMonitor(settings.LOOP_MONITOR_INTERVAL, settings.LOOP_BLOCK_THRESHOLD)
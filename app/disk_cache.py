@@ -0,0 +1,473 @@
+"""Persistent second response-cache tier on local disk.
+
+Entries are appended to a segment file. A fixed-size open-addressing hash
+index (key prefix -> offset, length, expiry, model version) lives in its own
+file and is memory-mapped, so a restart only maps the index and replays the
+records appended after its last update instead of reading the whole segment.
+When the segment outgrows ``max_bytes`` it is compacted down to the most
+recently written live entries.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.config import settings
+from app.state_backend import shared
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b"LLMSEG01"
+INDEX_MAGIC = b"LLMIDX01"
+
+# magic, segment id
+SEGMENT_HEADER = struct.Struct("<8sQ")
+# crc32, key, expires_at, model tag, model version tag, value length
+RECORD_HEADER = struct.Struct("<I32sIIII")
+# magic, segment id, slot count, live entries, used slots (live + tombstones), indexed until
+INDEX_HEADER = struct.Struct("<8sQQQQQ")
+INDEX_HEADER_SIZE = 64
+# key prefix, offset, record length, expires_at, model tag, model version tag
+SLOT = struct.Struct("<16sQIIII")
+Slot = Tuple[bytes, int, int, int, int, int]
+
+EMPTY = 0
+TOMBSTONE = 1  # offsets inside the segment header never hold a record
+MAX_LOAD_FACTOR = 0.7
+COMPACT_TARGET = 0.5  # fraction of max_bytes kept by a compaction
+
+
+def _tag(text: str) -> int:
+    return zlib.crc32(text.encode())
+
+
+def _lock_exclusive(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class DiskCache:
+    """Append-only, mmap-indexed response cache; thread-safe, one process per directory"""
+    
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: float, initial_slots: int = 65536):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.initial_slots = initial_slots
+        self.segment_path = os.path.join(directory, "segment.dat")
+        self.index_path = os.path.join(directory, "index.idx")
+        self.lock = threading.Lock()
+        self.available = False
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.writes = 0
+        self.compactions = 0
+        self.open_ms = 0.0
+        self.replayed = 0
+        self._opened = False
+        self._lock_fd: Optional[int] = None
+        self._segment = None
+        self._segment_id = 0
+        self._segment_size = 0
+        self._index_file = None
+        self._index: Optional[mmap.mmap] = None
+        self._slots = 0
+        self._live = 0
+        self._used = 0
+        # model tag -> version tag of the latest write, so compaction drops stale entries
+        self._versions: Dict[int, int] = {}
+    
+    def open(self) -> bool:
+        """Map the index and replay the segment tail; False if the tier is unusable"""
+        with self.lock:
+            return self._ensure_open()
+    
+    def _ensure_open(self) -> bool:
+        if self._opened:
+            return self.available
+        self._opened = True
+        start = time.perf_counter()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_fd = os.open(os.path.join(self.directory, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            if not _lock_exclusive(self._lock_fd):
+                os.close(self._lock_fd)
+                self._lock_fd = None
+                logger.warning(
+                    f"Disk cache {self.directory} is in use by another process; disk tier disabled here "
+                    "(set STATE_BACKEND=shared to share it between workers)"
+                )
+                return False
+            self._open_segment()
+            if not self._load_index():
+                self._rebuild_index()
+        except OSError as e:
+            logger.error(f"Disk cache unavailable: {str(e)}")
+            return False
+        self.available = True
+        self.open_ms = (time.perf_counter() - start) * 1000
+        logger.info(
+            f"Disk cache opened with {self._live} entries ({self._segment_size} bytes) "
+            f"in {self.open_ms:.1f}ms, replayed {self.replayed} records"
+        )
+        return True
+    
+    def _open_segment(self):
+        if not os.path.exists(self.segment_path):
+            open(self.segment_path, "wb").close()
+        self._segment = open(self.segment_path, "r+b")
+        header = self._segment.read(SEGMENT_HEADER.size)
+        if len(header) < SEGMENT_HEADER.size or SEGMENT_HEADER.unpack(header)[0] != SEGMENT_MAGIC:
+            self._reset_segment()
+        else:
+            self._segment_id = SEGMENT_HEADER.unpack(header)[1]
+            self._segment_size = self._segment.seek(0, os.SEEK_END)
+    
+    def _reset_segment(self):
+        self._segment_id = int.from_bytes(os.urandom(8), "little")
+        self._segment.seek(0)
+        self._segment.truncate()
+        self._segment.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, self._segment_id))
+        self._segment.flush()
+        self._segment_size = SEGMENT_HEADER.size
+    
+    def _load_index(self) -> bool:
+        """Map an existing index that matches the segment and replay records appended after it"""
+        if not os.path.exists(self.index_path):
+            return False
+        self._map_index(self.index_path)
+        magic, segment_id, slots, live, used, indexed_until = INDEX_HEADER.unpack_from(self._index, 0)
+        if (
+            magic != INDEX_MAGIC
+            or segment_id != self._segment_id
+            or len(self._index) != INDEX_HEADER_SIZE + slots * SLOT.size
+            or indexed_until > self._segment_size
+        ):
+            logger.warning("Disk cache index does not match its segment, rebuilding it")
+            self._unmap_index()
+            return False
+        self._slots, self._live, self._used = slots, live, used
+        self._replay(indexed_until)
+        return True
+    
+    def _rebuild_index(self):
+        """Recreate the index by scanning the whole segment (first start, or after a crash)"""
+        self._create_index(self.index_path, self.initial_slots)
+        self._replay(SEGMENT_HEADER.size)
+    
+    def _replay(self, start: int):
+        for offset, key, expires_at, tag, version, length in self._scan(start):
+            self._insert(key[:16], offset, length, expires_at, tag, version)
+            self._versions[tag] = version
+            self.replayed += 1
+            self._maybe_grow()
+        self._write_header()
+    
+    def _create_index(self, path: str, slots: int):
+        with open(path, "wb") as f:
+            f.truncate(INDEX_HEADER_SIZE + slots * SLOT.size)
+        self._map_index(path)
+        self._slots, self._live, self._used = slots, 0, 0
+    
+    def _map_index(self, path: str):
+        self._index_file = open(path, "r+b")
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+    
+    def _unmap_index(self):
+        if self._index is not None:
+            self._index.close()
+            self._index_file.close()
+            self._index = self._index_file = None
+    
+    def _write_header(self):
+        INDEX_HEADER.pack_into(
+            self._index, 0, INDEX_MAGIC, self._segment_id, self._slots, self._live, self._used, self._segment_size
+        )
+    
+    def _scan(self, start: int) -> Iterator[Tuple[int, bytes, int, int, int, int]]:
+        """Yield (offset, key, expires_at, tag, version, length) of the valid records from ``start``.
+        
+        A torn or corrupt record ends the scan and is truncated away, so the
+        next append starts on a record boundary.
+        """
+        offset = start
+        self._segment.seek(offset)
+        while offset < self._segment_size:
+            header = self._segment.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            crc, key, expires_at, tag, version, value_len = RECORD_HEADER.unpack(header)
+            value = self._segment.read(value_len)
+            if len(value) < value_len or zlib.crc32(value, zlib.crc32(header[4:])) != crc:
+                break
+            length = RECORD_HEADER.size + value_len
+            yield offset, key, expires_at, tag, version, length
+            offset += length
+        if offset < self._segment_size:
+            logger.warning(f"Disk cache segment truncated at {offset}, dropping {self._segment_size - offset} bytes")
+            self._segment.truncate(offset)
+            self._segment_size = offset
+    
+    def _read(self, offset: int, length: int, key: bytes) -> Optional[str]:
+        self._segment.seek(offset)
+        record = self._segment.read(length)
+        if len(record) != length:
+            return None
+        crc, stored_key, _, _, _, value_len = RECORD_HEADER.unpack_from(record)
+        value = record[RECORD_HEADER.size:]
+        if stored_key != key or len(value) != value_len:
+            return None
+        if zlib.crc32(value, zlib.crc32(record[4:RECORD_HEADER.size])) != crc:
+            return None
+        return value.decode()
+    
+    def _probe(self, prefix: bytes) -> Iterator[int]:
+        slot = int.from_bytes(prefix[8:16], "little") % self._slots
+        for _ in range(self._slots):
+            yield slot
+            slot = (slot + 1) % self._slots
+    
+    def _slot(self, slot: int) -> Slot:
+        return SLOT.unpack_from(self._index, INDEX_HEADER_SIZE + slot * SLOT.size)
+    
+    def _set_slot(self, slot: int, entry: Slot):
+        SLOT.pack_into(self._index, INDEX_HEADER_SIZE + slot * SLOT.size, *entry)
+    
+    def _find(self, prefix: bytes) -> int:
+        for slot in self._probe(prefix):
+            stored, offset, *_ = self._slot(slot)
+            if offset == EMPTY:
+                return -1
+            if offset != TOMBSTONE and stored == prefix:
+                return slot
+        return -1
+    
+    def _insert(self, prefix: bytes, offset: int, length: int, expires_at: int, tag: int, version: int):
+        target = -1
+        for slot in self._probe(prefix):
+            stored, stored_offset, *_ = self._slot(slot)
+            if stored_offset == EMPTY:
+                if target < 0:
+                    target = slot
+                    self._used += 1
+                self._live += 1
+                break
+            if stored_offset == TOMBSTONE:
+                if target < 0:
+                    target = slot
+            elif stored == prefix:
+                target = slot  # newer record for the same key replaces the old one
+                break
+        else:
+            self._live += 1  # reusing a tombstone in a table without empty slots
+        self._set_slot(target, (prefix, offset, length, expires_at, tag, version))
+    
+    def _delete(self, slot: int):
+        self._set_slot(slot, (b"\0" * 16, TOMBSTONE, 0, 0, 0, 0))
+        self._live -= 1
+    
+    def _live_entries(self) -> List[Slot]:
+        now = time.time()
+        entries = []
+        for slot in range(self._slots):
+            entry = self._slot(slot)
+            _, offset, _, expires_at, tag, version = entry
+            if offset == EMPTY or offset == TOMBSTONE or expires_at <= now:
+                continue
+            if self._versions.get(tag, version) != version:
+                continue  # written by an older version of the model
+            entries.append(entry)
+        return entries
+    
+    def _maybe_grow(self):
+        """Rehash once live entries and tombstones pass the load factor, doubling if needed"""
+        if self._used <= self._slots * MAX_LOAD_FACTOR:
+            return
+        entries = self._live_entries()
+        slots = self._slots
+        while len(entries) > slots * MAX_LOAD_FACTOR / 2:
+            slots *= 2
+        self._reindex(entries, slots)
+    
+    def _reindex(self, entries: List[Slot], slots: int):
+        """Atomically replace the index file with one holding ``entries``"""
+        tmp_path = self.index_path + ".tmp"
+        self._unmap_index()
+        self._create_index(tmp_path, slots)
+        for prefix, offset, length, expires_at, tag, version in entries:
+            self._insert(prefix, offset, length, expires_at, tag, version)
+        self._write_header()
+        self._index.flush()
+        self._unmap_index()
+        os.replace(tmp_path, self.index_path)
+        self._map_index(self.index_path)
+    
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            if not self._ensure_open():
+                return None
+            raw_key = bytes.fromhex(key)
+            slot = self._find(raw_key[:16])
+            if slot < 0:
+                self.misses += 1
+                return None
+            _, offset, length, expires_at, _, _ = self._slot(slot)
+            if expires_at <= time.time():
+                self._delete(slot)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            value = self._read(offset, length, raw_key)
+            if value is None:
+                # Key prefix collision or a damaged record
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+    
+    def put(self, key: str, value: str, model: str, version: str):
+        """Append an entry; ``version`` identifies the model build that produced it.
+        
+        Entries of an unknown build are not written: they would replace the
+        model's recorded version and get its valid entries compacted away.
+        """
+        if not version:
+            return
+        data = value.encode()
+        raw_key = bytes.fromhex(key)
+        expires_at = int(time.time() + self.ttl_seconds)
+        tag, version_tag = _tag(model), _tag(version)
+        body = RECORD_HEADER.pack(0, raw_key, expires_at, tag, version_tag, len(data))[4:] + data
+        record = struct.pack("<I", zlib.crc32(body)) + body
+        if len(record) > self.max_bytes * COMPACT_TARGET:
+            return
+        with self.lock:
+            if not self._ensure_open():
+                return
+            offset = self._segment_size
+            self._segment.seek(offset)
+            self._segment.write(record)
+            self._segment.flush()
+            self._segment_size += len(record)
+            self._insert(raw_key[:16], offset, len(record), expires_at, tag, version_tag)
+            self._versions[tag] = version_tag
+            self._write_header()
+            self.writes += 1
+            self._maybe_grow()
+            if self._segment_size > self.max_bytes:
+                self._compact()
+    
+    def _compact(self):
+        """Rewrite the segment with the newest live entries, up to COMPACT_TARGET of max_bytes"""
+        start = time.perf_counter()
+        entries = sorted(self._live_entries(), key=lambda entry: entry[1], reverse=True)
+        budget = int(self.max_bytes * COMPACT_TARGET)
+        kept, total = [], SEGMENT_HEADER.size
+        for entry in entries:
+            if total + entry[2] > budget:
+                break
+            kept.append(entry)
+            total += entry[2]
+        kept.reverse()
+        
+        segment_id = int.from_bytes(os.urandom(8), "little")
+        tmp_path = self.segment_path + ".tmp"
+        moved = []
+        with open(tmp_path, "wb") as f:
+            f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, segment_id))
+            offset = SEGMENT_HEADER.size
+            for prefix, old_offset, length, expires_at, tag, version in kept:
+                self._segment.seek(old_offset)
+                f.write(self._segment.read(length))
+                moved.append((prefix, offset, length, expires_at, tag, version))
+                offset += length
+            f.flush()
+            os.fsync(f.fileno())
+        # A crash between the two renames leaves an index for the old segment
+        # id, which the next start detects and rebuilds
+        self._segment.close()
+        os.replace(tmp_path, self.segment_path)
+        self._segment = open(self.segment_path, "r+b")
+        self._segment_id, self._segment_size = segment_id, offset
+        slots = self.initial_slots
+        while len(moved) > slots * MAX_LOAD_FACTOR / 2:
+            slots *= 2
+        self._reindex(moved, slots)
+        self.compactions += 1
+        logger.info(
+            f"Disk cache compacted to {len(moved)} of {len(entries)} live entries "
+            f"({offset} bytes) in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+    
+    def flush(self):
+        """Write the mapped index back to disk (called on shutdown)"""
+        with self.lock:
+            if self.available:
+                self._write_header()
+                self._index.flush()
+    
+    def close(self):
+        """Flush and release the files and the directory lock"""
+        with self.lock:
+            if self.available:
+                self._write_header()
+                self._index.flush()
+                self._unmap_index()
+                self._segment.close()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+            self.available = False
+    
+    def clear(self):
+        with self.lock:
+            if not self._ensure_open():
+                return
+            self._reset_segment()
+            self._reindex([], self.initial_slots)
+    
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.available,
+                "entries": self._live,
+                "segment_bytes": self._segment_size,
+                "max_bytes": self.max_bytes,
+                "index_slots": self._slots,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "expirations": self.expirations,
+                "writes": self.writes,
+                "compactions": self.compactions,
+                "open_ms": round(self.open_ms, 2),
+                "replayed_records": self.replayed,
+            }
+
+
+def _create_disk_cache() -> DiskCache:
+    return DiskCache(
+        directory=settings.DISK_CACHE_DIR,
+        max_bytes=settings.DISK_CACHE_MAX_BYTES,
+        ttl_seconds=settings.DISK_CACHE_TTL,
+    )
+
+disk_cache = shared("disk_cache", _create_disk_cache)
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+from app.coalescer import request_coalescer
+from app.config import settings
+from app.deadlines import Deadline
+from app.disk_cache import disk_cache
+from app.llm_service import ollama_service
+from app.metrics import metrics_tracker
+from app.models import User
+from app.prometheus_metrics import SEMANTIC_CACHE_LATENCY
+from app.prompt_cache import prompt_cache
+from app.scheduler import priority_for, scheduled_generate_result
+from app.semantic_cache import NUMPY_AVAILABLE, scope_id, semantic_cache
+from app.state_backend import offload
+from app.timing import record_stage, stage_timings
+from app.token_budget import settle_tokens
+
+
+logger = logging.getLogger(__name__)
+
+# Disk writes in flight, referenced so they are not garbage collected
+_pending_writes: Set[asyncio.Task] = set()
+
+
+class InferenceResult(NamedTuple):
+    response: str
+    cache_status: str  # "hit", "miss" or "bypass"
+    coalesced: bool
+    latency_ms: float
+    cache_tier: Optional[str] = None  # "memory", "disk" or "semantic" on a hit
+    prompt_tokens: int = 0  # Ollama tokens this request was charged; 0 on hits and coalesced calls
+    completion_tokens: int = 0
+
+
+def _write_behind(key: str, value: str, model: str, version: str):
+    """Persist a generation to the disk tier without making the client wait"""
+    task = asyncio.create_task(asyncio.to_thread(disk_cache.put, key, value, model, version))
+    _pending_writes.add(task)
+    task.add_done_callback(_write_done)
+
+
+def _write_done(task: asyncio.Task):
+    _pending_writes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Disk cache write failed: {str(task.exception())}")
+
+
+async def _embed_prompt(prompt: str) -> Optional[List[float]]:
+    """Embed a prompt for the semantic tier; None if the embedding is unavailable"""
+    start = time.perf_counter()
+    try:
+        embeddings = await ollama_service.embed(
+            [prompt], settings.SEMANTIC_CACHE_EMBED_MODEL, timeout=settings.SEMANTIC_CACHE_EMBED_TIMEOUT
+        )
+    except Exception as e:
+        # The semantic tier is an optimization; never fail a request over it
+        logger.warning(f"Prompt embedding failed, skipping semantic cache: {str(e)}")
+        return None
+    finally:
+        SEMANTIC_CACHE_LATENCY.labels(stage="embed").observe(time.perf_counter() - start)
+    return embeddings[0] if embeddings else None
+
+
+async def run_inference(
+    prompt: str,
+    options: Optional[Dict[str, Any]],
+    user: User,
+    cache_read: bool = True,
+    cache_write: bool = True,
+    model: Optional[str] = None,
+    reserved_tokens: int = 0,
+    deadline: Optional[Deadline] = None,
+) -> InferenceResult:
+    """Shared non-streaming inference path: memory cache, disk cache, coalescing, scheduling, Ollama.
+    
+    Disk hits are promoted into the memory tier; fresh generations are
+    written to both. With the semantic tier enabled, exact misses are
+    embedded and may be answered by a near-duplicate prompt's generation.
+    
+    ``reserved_tokens`` is the token budget reserved at admission; it is
+    settled against the tokens Ollama reports, or refunded on a hit or error.
+    With a ``deadline``, the queue turns the request away if it cannot be
+    served in time; enforcing the deadline itself is up to the caller.
+    
+    Records metrics and structured logs; exceptions (UnknownModelError,
+    BackendUnavailableError, QueueFullError, LLMServiceError, ...) propagate to the caller to map onto its protocol.
+    """
+    start_time = time.time()
+    model = ollama_service.resolve_model(model)
+    if not settings.PROMPT_CACHE_ENABLED:
+        cache_read = cache_write = False
+    use_semantic = settings.SEMANTIC_CACHE_ENABLED and NUMPY_AVAILABLE and (cache_read or cache_write)
+    version = ollama_service.model_version(model)
+    # Persisted entries are keyed by model digest; until the first probe reports
+    # it, lookups would all miss and writes would clobber the recorded version
+    use_disk = settings.DISK_CACHE_ENABLED and settings.PROMPT_CACHE_ENABLED and bool(version)
+    cache_key = prompt_cache.make_key(model, prompt, options, version)
+    cache_status = "bypass"
+    cache_tier = None
+    coalesced = False
+    vector = None
+    usage: Dict[str, Any] = {}
+    
+    try:
+        if deadline is not None:
+            deadline.enter("cache")
+        lookup_start = time.perf_counter()
+        cached = await offload(prompt_cache.get, cache_key) if cache_read else None
+        if cached is not None:
+            cache_tier = "memory"
+        elif cache_read and use_disk:
+            cached = await asyncio.to_thread(disk_cache.get, cache_key)
+            if cached is not None:
+                cache_tier = "disk"
+                prompt_cache.put(cache_key, cached)
+        if cached is None and use_semantic:
+            if not cache_read:
+                # A no-cache retry of a prompt we answered with a near-duplicate
+                semantic_cache.record_override(cache_key)
+            vector = await _embed_prompt(prompt)
+            # Near-duplicates only match under the same model build and options
+            scope = scope_id(prompt_cache.make_key(model, "", options, version))
+        if cached is None and vector is not None and cache_read:
+            search_start = time.perf_counter()
+            match = await asyncio.to_thread(semantic_cache.lookup, vector, scope, cache_key)
+            SEMANTIC_CACHE_LATENCY.labels(stage="search").observe(time.perf_counter() - search_start)
+            if match is not None:
+                cached, _ = match
+                cache_tier = "semantic"
+        record_stage("cache", time.perf_counter() - lookup_start)
+        if cached is not None:
+            response_text = cached
+            cache_status = "hit"
+        else:
+            # Fail fast rather than queue for a backend whose circuit is open
+            ollama_service.check_available(model)
+            # Generate response from LLM, sharing the call with identical in-flight requests
+            generate = lambda: scheduled_generate_result(
+                user.username, priority_for(user.tier), prompt, options, model, deadline=deadline
+            )
+            if settings.COALESCE_REQUESTS:
+                result, coalesced = await request_coalescer.run(cache_key, generate)
+            else:
+                result = await generate()
+            response_text = result.get("response", "")
+            if not coalesced:
+                # Followers share the leader's generation; only the leader is charged
+                usage = result
+            if cache_write:
+                prompt_cache.put(cache_key, response_text)
+                if use_disk:
+                    _write_behind(cache_key, response_text, model, version)
+                if vector is not None and not coalesced:
+                    await asyncio.to_thread(semantic_cache.put, vector, scope, response_text)
+            if cache_read:
+                cache_status = "miss"
+    except asyncio.CancelledError:
+        # Deadline passed or the client left; the caller counts it
+        metrics_tracker.record_request((time.time() - start_time) * 1000, success=False)
+        settle_tokens(user.username, user.tier, model, reserved_tokens)
+        raise
+    except Exception as e:
+        latency_ms = (time.time() - start_time) * 1000
+        metrics_tracker.record_request(latency_ms, success=False)
+        settle_tokens(user.username, user.tier, model, reserved_tokens)
+        
+        log_extra = {
+            "user_id": user.username,
+            "prompt_length": len(prompt),
+            "latency_ms": round(latency_ms, 2),
+            "status": "error",
+            "timings": stage_timings(),
+        }
+        logger.error(f"Inference failed: {str(e)}", extra=log_extra)
+        raise
+    
+    latency_ms = (time.time() - start_time) * 1000
+    metrics_tracker.record_request(latency_ms, success=True)
+    prompt_tokens = usage.get("prompt_eval_count", 0)
+    completion_tokens = usage.get("eval_count", 0)
+    settle_tokens(user.username, user.tier, model, reserved_tokens, prompt_tokens, completion_tokens)
+    
+    log_extra = {
+        "user_id": user.username,
+        "model": model,
+        "prompt_length": len(prompt),
+        "response_length": len(response_text),
+        "latency_ms": round(latency_ms, 2),
+        "status": "success",
+        "cache": f"{cache_tier}_hit" if cache_tier in ("disk", "semantic") else cache_status,
+        "coalesced": coalesced,
+        "timings": stage_timings(),
+    }
+    logger.info("Inference completed successfully", extra=log_extra)
+    
+    return InferenceResult(response_text, cache_status, coalesced, latency_ms, cache_tier, prompt_tokens, completion_tokens)
@@ -1,45 +1,594 @@
-import requests
+import asyncio
+import httpx
 import logging
-from typing import Dict, Any
+import orjson
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional, Sequence
+from app.circuit_breaker import CLOSED, OPEN, CircuitBreaker
 from app.config import settings
+from app.deadlines import Deadline, DeadlineExceededError
+from app.prometheus_metrics import CIRCUIT_REJECTED, UPSTREAM_IN_FLIGHT, UPSTREAM_LATENCY, observe_tokens
+from app.timing import upstream_trace
 
 
 logger = logging.getLogger(__name__)
 
+# Request bodies are encoded with orjson, so httpx does not set the type itself
+JSON_HEADERS = {"Content-Type": "application/json"}
 
-class OllamaService:
-    def __init__(self):
-        self.base_url = settings.OLLAMA_BASE_URL
-        self.model = settings.OLLAMA_MODEL
+
+class LLMServiceError(Exception):
+    """Raised when the upstream LLM backend fails or is unreachable"""
     
-    def generate(self, prompt: str) -> str:
-        """Generate response from Ollama LLM"""
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        # False when the backend rejected the request itself, so another
+        # backend would reject it too
+        self.retryable = retryable
+
+
+class UnknownModelError(LLMServiceError):
+    """Raised when no configured backend serves the requested model"""
+
+
+class BackendUnavailableError(LLMServiceError):
+    """Raised without calling upstream when every backend for a model has an open circuit"""
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, retryable=False)
+        self.retry_after = retry_after
+
+
+def keep_alive() -> Any:
+    """OLLAMA_KEEP_ALIVE as Ollama expects it: seconds as a number, or a duration string"""
+    value = settings.OLLAMA_KEEP_ALIVE
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+class OllamaBackend:
+    """One Ollama host: its own connection pool, circuit breaker, load and latency statistics"""
+    
+    EWMA_ALPHA = 0.2
+    
+    def __init__(self, name: str, base_url: str, models: List[str], weight: float = 1.0, num_parallel: Optional[int] = None):
+        self.name = name
+        self.base_url = base_url
+        self.models = models
+        self.weight = weight
+        self.num_parallel = num_parallel or settings.OLLAMA_NUM_PARALLEL
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.CIRCUIT_BREAKER_RESET_TIMEOUT,
+            half_open_requests=settings.CIRCUIT_BREAKER_HALF_OPEN_REQUESTS,
+        )
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None  # seconds, None until the first success
+        self.requests = 0
+        self.failures = 0
+        # Result of the last background probe; None until the first one
+        self.reachable: Optional[bool] = None
+        self.last_probe_at: Optional[float] = None
+        self.model_digests: Dict[str, str] = {}  # model name -> digest, from /api/tags
+        self.last_used: Dict[str, float] = {}  # model -> monotonic time of the last call
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "OllamaBackend":
+        url = config["url"].rstrip("/")
+        return cls(
+            name=config.get("name", url),
+            base_url=url,
+            models=config.get("models") or [settings.OLLAMA_MODEL],
+            weight=float(config.get("weight", 1.0)),
+            num_parallel=config.get("num_parallel"),
+        )
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Keep-alive connection pool for this host, created lazily on the running loop"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(
+                    settings.OLLAMA_TIMEOUT,
+                    connect=settings.OLLAMA_CONNECT_TIMEOUT,
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._client
+    
+    def load(self, default_latency: float) -> float:
+        """Expected completion time of one more request, lower is better"""
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return (self.in_flight + 1) * latency / self.weight
+    
+    @staticmethod
+    def _error(e: httpx.HTTPError) -> LLMServiceError:
+        # 4xx other than "model not found" means the request is bad, not the host
+        rejected = (
+            isinstance(e, httpx.HTTPStatusError)
+            and 400 <= e.response.status_code < 500
+            and e.response.status_code != 404
+        )
+        return LLMServiceError(f"LLM inference failed: {str(e)}", retryable=not rejected)
+    
+    @property
+    def status(self) -> str:
+        """"up", "down", or "recovering" while the circuit is half-open"""
+        state = self.breaker.state
+        if state == OPEN or self.reachable is False:
+            return "down"
+        return "up" if state == CLOSED else "recovering"
+    
+    def _record(self, elapsed: Optional[float], success: bool):
+        self.requests += 1
+        if not success:
+            self.failures += 1
+            self.breaker.record_failure()
+            return
+        self.breaker.record_success()
+        if elapsed is None:
+            return
+        if self.latency_ewma is None:
+            self.latency_ewma = elapsed
+        else:
+            self.latency_ewma += self.EWMA_ALPHA * (elapsed - self.latency_ewma)
+    
+    async def generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> str:
+        """Generate a complete response from this host"""
+        result = await self.generate_result(model, prompt, options, timeout)
+        return result.get("response", "")
+    
+    async def generate_result(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None, context: Optional[List[int]] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Generate a complete response from this host, returning Ollama's full result.
+        
+        ``context`` is the token array returned by a previous call; passing it
+        back continues that conversation without resending its text. With a
+        ``deadline``, the call is given only the time the request has left and
+        raises DeadlineExceededError when it runs out; that is the request's
+        budget expiring, not the host failing, so the breaker is not charged.
+        """
+        if deadline is not None:
+            deadline.enter("upstream")
+            timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+        start = time.perf_counter()
+        outcome = "cancelled"
+        self.in_flight += 1
+        UPSTREAM_IN_FLIGHT.labels(model=model, backend=self.name).inc()
         try:
-            url = f"{self.base_url}/api/generate"
-            payload = {
-                "model": self.model,
+            payload: Dict[str, Any] = {
+                "model": model,
                 "prompt": prompt,
                 "stream": False
             }
+            if options:
+                payload["options"] = options
+            if context:
+                payload["context"] = context
+            if settings.OLLAMA_KEEP_ALIVE:
+                payload["keep_alive"] = keep_alive()
+            self.last_used[model] = time.monotonic()
+            
+            request_timeout = httpx.USE_CLIENT_DEFAULT
+            if timeout is not None:
+                request_timeout = httpx.Timeout(timeout, connect=settings.OLLAMA_CONNECT_TIMEOUT)
             
-            response = requests.post(url, json=payload, timeout=60)
+            trace = upstream_trace()
+            try:
+                response = await self.client.post(
+                    "/api/generate", content=orjson.dumps(payload), headers=JSON_HEADERS, timeout=request_timeout,
+                    extensions={"trace": trace} if trace is not None else None,
+                )
+            finally:
+                if trace is not None:
+                    trace.finish()
             response.raise_for_status()
             
-            result = response.json()
-            return result.get("response", "")
+            result = orjson.loads(response.content)
+            observe_tokens(model, result.get("prompt_eval_count", 0), result.get("eval_count", 0))
+            outcome = "success"
+            return result
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ollama API error: {str(e)}")
-            raise Exception(f"LLM inference failed: {str(e)}")
+        except httpx.HTTPError as e:
+            if deadline is not None and isinstance(e, httpx.TimeoutException) and not isinstance(e, httpx.ConnectTimeout):
+                # The request's time ran out; leave the outcome "cancelled"
+                raise DeadlineExceededError("upstream", deadline.timeout) from None
+            logger.error(f"Ollama API error from {self.name}: {str(e)}")
+            error = self._error(e)
+            outcome = "error" if error.retryable else "rejected"
+            raise error
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight -= 1
+            if outcome == "cancelled":
+                self.breaker.release()
+            else:
+                self._record(elapsed if outcome == "success" else None, outcome != "error")
+            UPSTREAM_IN_FLIGHT.labels(model=model, backend=self.name).dec()
+            UPSTREAM_LATENCY.labels(model=model, backend=self.name, status=outcome, mode="generate").observe(elapsed)
+    
+    async def generate_stream(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None, usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """Yield response chunks from this host as they are generated.
+        
+        Closing the iterator early closes the upstream connection, which makes
+        Ollama abort the generation.
+        """
+        payload: Dict[str, Any] = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True
+        }
+        if options:
+            payload["options"] = options
+        if settings.OLLAMA_KEEP_ALIVE:
+            payload["keep_alive"] = keep_alive()
+        self.last_used[model] = time.monotonic()
+        start = time.perf_counter()
+        outcome = "cancelled"
+        self.in_flight += 1
+        UPSTREAM_IN_FLIGHT.labels(model=model, backend=self.name).inc()
+        try:
+            async with self.client.stream("POST", "/api/generate", content=orjson.dumps(payload), headers=JSON_HEADERS) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        chunk = orjson.loads(line)
+                    except orjson.JSONDecodeError as e:
+                        raise LLMServiceError(f"Malformed stream chunk from {self.name}: {str(e)}")
+                    if "error" in chunk:
+                        raise LLMServiceError(f"LLM inference failed: {chunk['error']}")
+                    text = chunk.get("response", "")
+                    if text:
+                        yield text
+                    if chunk.get("done"):
+                        observe_tokens(model, chunk.get("prompt_eval_count", 0), chunk.get("eval_count", 0))
+                        if usage is not None:
+                            usage["prompt_tokens"] = chunk.get("prompt_eval_count", 0)
+                            usage["completion_tokens"] = chunk.get("eval_count", 0)
+                        break
+            outcome = "success"
+        except httpx.HTTPError as e:
+            logger.error(f"Ollama API error from {self.name}: {str(e)}")
+            error = self._error(e)
+            outcome = "error" if error.retryable else "rejected"
+            raise error
+        except LLMServiceError:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight -= 1
+            if outcome == "cancelled":
+                self.breaker.release()
+            else:
+                self._record(elapsed if outcome == "success" else None, outcome != "error")
+            UPSTREAM_IN_FLIGHT.labels(model=model, backend=self.name).dec()
+            UPSTREAM_LATENCY.labels(model=model, backend=self.name, status=outcome, mode="stream").observe(elapsed)
+    
+    async def embed(self, model: str, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """Embed ``texts`` with an embedding model on this host"""
+        payload: Dict[str, Any] = {"model": model, "input": texts}
+        if settings.OLLAMA_KEEP_ALIVE:
+            payload["keep_alive"] = keep_alive()
+        start = time.perf_counter()
+        outcome = "cancelled"
+        self.in_flight += 1
+        try:
+            request_timeout = httpx.USE_CLIENT_DEFAULT
+            if timeout is not None:
+                request_timeout = httpx.Timeout(timeout, connect=settings.OLLAMA_CONNECT_TIMEOUT)
+            response = await self.client.post("/api/embed", content=orjson.dumps(payload), headers=JSON_HEADERS, timeout=request_timeout)
+            response.raise_for_status()
+            embeddings = orjson.loads(response.content)["embeddings"]
+            outcome = "success"
+            return embeddings
+        except httpx.HTTPError as e:
+            logger.error(f"Ollama embed error from {self.name}: {str(e)}")
+            error = self._error(e)
+            outcome = "error" if error.retryable else "rejected"
+            raise error
+        except (KeyError, ValueError) as e:
+            outcome = "error"
+            raise LLMServiceError(f"Malformed embed response from {self.name}: {str(e)}")
+        finally:
+            self.in_flight -= 1
+            UPSTREAM_LATENCY.labels(model=model, backend=self.name, status=outcome, mode="embed").observe(time.perf_counter() - start)
+    
+    async def preload(self, model: str, timeout: float) -> float:
+        """Load ``model`` into memory without generating; returns the seconds it took.
+        
+        Ollama treats a generate request without a prompt as a load request,
+        which also resets the model's keep-alive timer.
+        """
+        payload: Dict[str, Any] = {"model": model}
+        if settings.OLLAMA_KEEP_ALIVE:
+            payload["keep_alive"] = keep_alive()
+        start = time.perf_counter()
+        try:
+            response = await self.client.post("/api/generate", content=orjson.dumps(payload), headers=JSON_HEADERS, timeout=timeout)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise LLMServiceError(f"Loading {model} on {self.name} failed: {str(e)}")
+        self.last_used[model] = time.monotonic()
+        return time.perf_counter() - start
     
-    def health_check(self) -> bool:
-        """Check if Ollama service is available"""
+    async def probe(self) -> bool:
+        """Check the host with a cheap request and feed the result to the breaker.
+        
+        A failed probe counts as one failure; a successful probe of an open
+        circuit half-opens it so real traffic can confirm the recovery.
+        """
         try:
-            url = f"{self.base_url}/api/tags"
-            response = requests.get(url, timeout=5)
-            return response.status_code == 200
+            response = await self.client.get("/api/tags", timeout=settings.OLLAMA_HEALTH_TIMEOUT)
+            reachable = response.status_code == 200
+            if reachable:
+                self.model_digests = {
+                    tag["name"]: tag.get("digest", "") for tag in response.json().get("models", [])
+                }
         except Exception:
-            return False
+            reachable = False
+        if reachable != self.reachable:
+            if reachable:
+                logger.info(f"Ollama backend {self.name} is reachable")
+            else:
+                logger.warning(f"Ollama backend {self.name} is unreachable")
+        self.reachable = reachable
+        self.last_probe_at = time.time()
+        if reachable:
+            self.breaker.half_open()
+        else:
+            self.breaker.record_failure()
+        return reachable
+    
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "url": self.base_url,
+            "models": self.models,
+            "weight": self.weight,
+            "status": self.status,
+            "circuit": self.breaker.stats(),
+            "in_flight": self.in_flight,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 2) if self.latency_ewma is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+    
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class OllamaService:
+    """Routes generations across the configured Ollama backends.
+    
+    Each request goes to the least-loaded backend serving the requested
+    model, scored by in-flight requests times EWMA latency over weight, and
+    failed calls fail over to the next one. Backends whose circuit is open
+    are skipped; when none is left the call fails fast with
+    BackendUnavailableError instead of waiting on a dead host.
+    """
+    
+    def __init__(self, backends: Optional[List[Dict[str, Any]]] = None):
+        configs = backends if backends is not None else settings.OLLAMA_BACKENDS
+        if not configs:
+            configs = [{"name": "default", "url": settings.OLLAMA_BASE_URL, "models": [settings.OLLAMA_MODEL]}]
+        self.backends = [OllamaBackend.from_config(config) for config in configs]
+        self.model = settings.OLLAMA_MODEL
+        self.failovers = 0
+        self.rejected = 0
+    
+    @property
+    def capacity(self) -> int:
+        """Generations that can run at once across all backends"""
+        return sum(backend.num_parallel for backend in self.backends)
+    
+    def capacity_for(self, model: str) -> int:
+        """Generations of ``model`` that can run at once across the backends serving it"""
+        return sum(backend.num_parallel for backend in self.backends if model in backend.models)
+    
+    def models(self) -> List[str]:
+        return sorted({model for backend in self.backends for model in backend.models})
+    
+    def resolve_model(self, model: Optional[str] = None) -> str:
+        """Return the model to use, raising UnknownModelError if nothing serves it"""
+        model = model or self.model
+        if not any(model in backend.models for backend in self.backends):
+            raise UnknownModelError(f"Model '{model}' is not served by any backend")
+        return model
+    
+    def model_version(self, model: str) -> str:
+        """Digest(s) of the model build the backends serve; empty until probed"""
+        names = (model, f"{model}:latest") if ":" not in model else (model,)
+        digests = set()
+        for backend in self.backends:
+            if model in backend.models:
+                digest = next((backend.model_digests[n] for n in names if n in backend.model_digests), "")
+                if digest:
+                    digests.add(digest)
+        return ",".join(sorted(digests))
+    
+    def _serving(self, model: str) -> List[OllamaBackend]:
+        serving = [backend for backend in self.backends if model in backend.models]
+        if not serving:
+            raise UnknownModelError(f"Model '{model}' is not served by any backend")
+        return serving
+    
+    def check_available(self, model: str):
+        """Raise BackendUnavailableError if every backend serving ``model`` refuses calls"""
+        serving = self._serving(model)
+        if not any(backend.breaker.available() for backend in serving):
+            self.rejected += 1
+            CIRCUIT_REJECTED.labels(model=model).inc()
+            retry_after = min(backend.breaker.retry_after() for backend in serving)
+            raise BackendUnavailableError(f"No Ollama backend available for '{model}'", retry_after=retry_after)
+    
+    def select(self, model: str, exclude: Sequence[OllamaBackend] = (), prefer: Optional[str] = None) -> Optional[OllamaBackend]:
+        """Pick the least-loaded backend whose circuit lets the next attempt through.
+        
+        Backends without a latency sample yet are scored with the mean of the
+        others, so a newly added host gets its share without being flooded.
+        ``prefer`` names a backend to use whenever it is available, for
+        requests that benefit from landing on the same host as before.
+        """
+        serving = self._serving(model)
+        known = [backend.latency_ewma for backend in serving if backend.latency_ewma is not None]
+        default_latency = sum(known) / len(known) if known else settings.SCHEDULER_INITIAL_SERVICE_TIME
+        remaining = [backend for backend in serving if backend not in exclude and backend.breaker.available()]
+        if not remaining:
+            return None
+        for backend in remaining:
+            if backend.name == prefer:
+                return backend
+        return min(remaining, key=lambda backend: backend.load(default_latency))
+    
+    def _failover(self, model: str, tried: List[OllamaBackend], error: Optional[LLMServiceError], prefer: Optional[str] = None) -> Optional[OllamaBackend]:
+        """Reserve the next backend to try, or return None once the candidates are exhausted"""
+        if not tried:
+            self.check_available(model)
+        backend = self.select(model, tried, prefer)
+        if backend is None:
+            return None
+        backend.breaker.acquire()
+        if tried:
+            self.failovers += 1
+            logger.warning(f"Failing over to Ollama backend {backend.name} after: {str(error)}")
+        return backend
+    
+    async def generate(self, prompt: str, options: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None, model: Optional[str] = None) -> str:
+        """Generate response from Ollama LLM"""
+        model = model or self.model
+        tried: List[OllamaBackend] = []
+        error: Optional[LLMServiceError] = None
+        while (backend := self._failover(model, tried, error)) is not None:
+            tried.append(backend)
+            try:
+                return await backend.generate(model, prompt, options, timeout)
+            except LLMServiceError as e:
+                if not e.retryable:
+                    raise
+                error = e
+        raise error
+    
+    async def generate_result(self, prompt: str, options: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None, model: Optional[str] = None, context: Optional[List[int]] = None, prefer: Optional[str] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Generate with a conversation ``context``, returning Ollama's full result.
+        
+        The result's ``backend`` key names the host that answered, so the next
+        turn can ``prefer`` it and find the conversation still in its cache.
+        Failover attempts share the ``deadline``, each getting what is left.
+        """
+        model = model or self.model
+        tried: List[OllamaBackend] = []
+        error: Optional[LLMServiceError] = None
+        while (backend := self._failover(model, tried, error, prefer)) is not None:
+            tried.append(backend)
+            try:
+                result = await backend.generate_result(model, prompt, options, timeout, context, deadline)
+            except LLMServiceError as e:
+                if not e.retryable:
+                    raise
+                error = e
+                continue
+            result["backend"] = backend.name
+            return result
+        raise error
+    
+    async def embed(self, texts: List[str], model: str, timeout: Optional[float] = None) -> List[List[float]]:
+        """Embed ``texts`` on the least busy healthy backend, failing over like generate.
+        
+        Embedding models are small and expected on every backend, so they are
+        not listed in a backend's ``models``. Embeddings only go to backends
+        whose circuit is closed and do not count towards it: a missing
+        embedding model must not take a backend out of generation.
+        """
+        tried: List[OllamaBackend] = []
+        error: Optional[LLMServiceError] = None
+        while True:
+            remaining = [backend for backend in self.backends if backend not in tried and backend.breaker.state == CLOSED]
+            if not remaining:
+                break
+            backend = min(remaining, key=lambda backend: (backend.in_flight + 1) / backend.weight)
+            tried.append(backend)
+            try:
+                return await backend.embed(model, texts, timeout)
+            except LLMServiceError as e:
+                if not e.retryable:
+                    raise
+                error = e
+        raise error or BackendUnavailableError(
+            "No Ollama backend available for embeddings",
+            retry_after=min(backend.breaker.retry_after() for backend in self.backends),
+        )
+    
+    async def generate_stream(self, prompt: str, options: Optional[Dict[str, Any]] = None, model: Optional[str] = None, usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """Yield response chunks from Ollama as they are generated.
+        
+        Fails over to the next backend only while nothing has been yielded
+        yet; a stream that breaks midway surfaces the error. ``usage``, if
+        given, receives ``prompt_tokens`` and ``completion_tokens`` once the
+        stream completes.
+        """
+        model = model or self.model
+        tried: List[OllamaBackend] = []
+        error: Optional[LLMServiceError] = None
+        while (backend := self._failover(model, tried, error)) is not None:
+            tried.append(backend)
+            chunks = backend.generate_stream(model, prompt, options, usage)
+            started = False
+            try:
+                async for chunk in chunks:
+                    started = True
+                    yield chunk
+                return
+            except LLMServiceError as e:
+                if started or not e.retryable:
+                    raise
+                error = e
+            finally:
+                await chunks.aclose()
+        raise error
+    
+    async def probe(self) -> bool:
+        """Probe every backend concurrently; True if at least one is reachable"""
+        results = await asyncio.gather(*(backend.probe() for backend in self.backends))
+        return any(results)
+    
+    def is_available(self) -> bool:
+        """Cached health: whether any backend currently accepts calls"""
+        return any(backend.status != "down" for backend in self.backends)
+    
+    def stats(self) -> dict:
+        return {
+            "failovers": self.failovers,
+            "rejected": self.rejected,
+            "backends": [backend.stats() for backend in self.backends],
+        }
+    
+    async def aclose(self):
+        """Close every backend's connection pool (called on application shutdown)"""
+        for backend in self.backends:
+            await backend.aclose()
+
+
+async def probe_periodically(service: OllamaService, interval: float):
+    """Background task keeping backend health current, so /health never calls upstream"""
+    while True:
+        try:
+            await service.probe()
+        except Exception as e:
+            logger.error(f"Ollama health probe failed: {str(e)}")
+        await asyncio.sleep(interval)
 
 
-ollama_service = OllamaService()
\ No newline at end of file
+ollama_service = OllamaService()
@@ -1,7 +1,15 @@
+import atexit
+import copy
 import logging
 import json
-from datetime import datetime
-from typing import Any, Dict
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+from typing import Any, Dict, List, Optional, TextIO
+from app.config import settings
 
 
 class JSONFormatter(logging.Formatter):
@@ -9,7 +17,8 @@ class JSONFormatter(logging.Formatter):
     
     def format(self, record: logging.LogRecord) -> str:
         log_data: Dict[str, Any] = {
-            "timestamp": datetime.utcnow().isoformat(),
+            # Time the record was created, not when the listener writes it
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).replace(tzinfo=None).isoformat(),
             "level": record.levelname,
             "message": record.getMessage(),
             "module": record.module,
@@ -18,6 +27,8 @@ class JSONFormatter(logging.Formatter):
         # Add extra fields if available
         if hasattr(record, "user_id"):
             log_data["user_id"] = record.user_id
+        if hasattr(record, "model"):
+            log_data["model"] = record.model
         if hasattr(record, "prompt_length"):
             log_data["prompt_length"] = record.prompt_length
         if hasattr(record, "response_length"):
@@ -26,18 +37,168 @@ class JSONFormatter(logging.Formatter):
             log_data["latency_ms"] = record.latency_ms
         if hasattr(record, "status"):
             log_data["status"] = record.status
+        if hasattr(record, "cache"):
+            log_data["cache"] = record.cache
+        if hasattr(record, "coalesced"):
+            log_data["coalesced"] = record.coalesced
+        if getattr(record, "timings", None):
+            log_data["timings"] = record.timings
+        if record.exc_info:
+            log_data["exception"] = self.formatException(record.exc_info)
         
         return json.dumps(log_data)
 
 
+class SuccessSampler(logging.Filter):
+    """Keep only a fraction of INFO records marked ``status="success"``"""
+    
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.sampled_out = 0
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno != logging.INFO or getattr(record, "status", None) != "success":
+            return True
+        if random.random() < self.rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hand records to the listener thread through a bounded queue.
+    
+    When the queue is full, ``policy="drop"`` discards the record and counts
+    it; ``policy="block"`` waits for room, trading latency for completeness.
+    Warnings and errors always wait, so only routine records are ever lost.
+    """
+    
+    def __init__(self, log_queue: queue.Queue, policy: str = "drop"):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the message arguments here, while they still hold their
+        # current values; JSON formatting happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        if self.policy == "block" or record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingLogListener(threading.Thread):
+    """Drain the log queue on a daemon thread, writing whatever is queued in one write"""
+    
+    _STOP = object()
+    
+    def __init__(self, log_queue: queue.Queue, stream: TextIO, formatter: logging.Formatter, handler: BoundedQueueHandler, batch_size: int):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = log_queue
+        self.stream = stream
+        self.formatter = formatter
+        self.handler = handler
+        self.batch_size = batch_size
+        self.written = 0
+        self.batches = 0
+        self._reported_drops = 0
+    
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Any] = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._STOP in batch:
+                stopping = True
+                batch = [record for record in batch if record is not self._STOP]
+            self._write(batch)
+    
+    def _write(self, batch: List[logging.LogRecord]):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                lines.append(json.dumps({"level": "ERROR", "message": f"Unformattable log record: {record.msg!r}"}))
+        dropped = self.handler.dropped
+        if dropped > self._reported_drops:
+            lines.append(json.dumps({
+                "timestamp": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
+                "level": "WARNING",
+                "message": f"Dropped {dropped - self._reported_drops} log records, log queue full",
+                "module": __name__,
+            }))
+            self._reported_drops = dropped
+        if not lines:
+            return
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            pass  # nowhere left to report a broken log stream
+        self.written += len(batch)
+        self.batches += 1
+    
+    def stop(self, timeout: float = 5.0):
+        """Flush queued records and stop the thread"""
+        self.queue.put(self._STOP)
+        self.join(timeout)
+
+
+_handler: Optional[BoundedQueueHandler] = None
+_sampler: Optional[SuccessSampler] = None
+_listener: Optional[BatchingLogListener] = None
+
+
 def setup_logging():
-    """Configure structured JSON logging"""
+    """Configure structured JSON logging written by a background thread.
+    
+    Safe to call more than once: the handler is only installed the first time.
+    """
+    global _handler, _sampler, _listener
     logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    if _handler is not None:
+        return logger
+    
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _handler = BoundedQueueHandler(log_queue, policy=settings.LOG_QUEUE_POLICY)
+    _sampler = SuccessSampler(settings.LOG_SUCCESS_SAMPLE_RATE)
+    _handler.addFilter(_sampler)
+    _listener = BatchingLogListener(log_queue, sys.stderr, JSONFormatter(), _handler, settings.LOG_BATCH_SIZE)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logger.addHandler(_handler)
     
-    # Console handler with JSON formatting
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(JSONFormatter())
-    logger.addHandler(console_handler)
+    # httpx logs every upstream call at INFO, doubling the volume of our own logs
+    logging.getLogger("httpx").setLevel(logging.WARNING)
     
-    return logger
\ No newline at end of file
+    return logger
+
+
+def logging_stats() -> dict:
+    if _handler is None:
+        return {}
+    return {
+        "queued": _handler.queue.qsize(),
+        "queue_size": settings.LOG_QUEUE_SIZE,
+        "policy": _handler.policy,
+        "dropped": _handler.dropped,
+        "sampled_out": _sampler.sampled_out,
+        "written": _listener.written,
+        "batches": _listener.batches,
+    }
@@ -1,16 +1,43 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
 from contextlib import asynccontextmanager
-import time
+import asyncio
+import math
 import logging
+import time
+from typing import Tuple
 from app.config import settings
 from app.models import InferenceRequest, InferenceResponse, Token, User
-from app.auth import authenticate_user, create_access_token, get_current_user
-from app.rate_limiter import rate_limiter
-from app.llm_service import ollama_service
+from app.auth import (
+    LoginThrottledError,
+    authenticate_user_async,
+    create_access_token,
+    get_current_user,
+    password_verifier,
+    token_cache,
+)
+from app.rate_limiter import rate_limiter, evict_idle_periodically
+from app.llm_service import BackendUnavailableError, UnknownModelError, ollama_service, probe_periodically
 from app.metrics import metrics_tracker
-from app.logging_config import setup_logging
+from app.prompt_cache import prompt_cache
+from app.disk_cache import disk_cache
+from app.semantic_cache import NUMPY_AVAILABLE, semantic_cache
+from app.sessions import session_store
+from app.coalescer import request_coalescer
+from app.scheduler import QueueFullError, inference_scheduler
+from app.inference import run_inference
+from app.deadlines import CLIENT_CLOSED_REQUEST, ClientDisconnectedError, Deadline, DeadlineExceededError, run_with_deadline
+from app.state_backend import offload
+from app.timing import timed
+from app.token_budget import HEADER_PREFIX as TOKEN_HEADER_PREFIX, apply_max_tokens, estimate_tokens, token_budget
+from app.compression import CompressionMiddleware
+from app.serialization import FastJSONResponse
+from app.model_warmup import model_warmup, warm_periodically
+from app.logging_config import logging_stats, setup_logging
+from app.diagnostics import TimingMiddleware, loop_monitor, timing_stats
+from app import batch, conversation, diagnostics, streaming, ws
+from app import prometheus_metrics
 
 
 # Setup logging
@@ -22,13 +49,37 @@ async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events"""
     # Startup
     logger.info("Starting Secure LLM Inference Service...")
-    if not ollama_service.health_check():
-        logger.warning("Ollama service not available. Please ensure Ollama is running.")
-    else:
-        logger.info(f"Ollama service connected. Model: {settings.OLLAMA_MODEL}")
+    logger.info(f"Routing to {len(ollama_service.backends)} Ollama backend(s). Models: {', '.join(ollama_service.models())}")
+    # Probes run in the background; the first result is logged when it arrives
+    probe_task = asyncio.create_task(
+        probe_periodically(ollama_service, settings.HEALTH_PROBE_INTERVAL)
+    )
+    if settings.SEMANTIC_CACHE_ENABLED and not NUMPY_AVAILABLE:
+        logger.warning("SEMANTIC_CACHE_ENABLED is set but numpy is not installed; semantic cache disabled")
+    if settings.DISK_CACHE_ENABLED:
+        # Maps the index and replays only the unindexed tail of the segment
+        await asyncio.to_thread(disk_cache.open)
+    # Models load in the background; /ready turns 200 once they are warm
+    warmup_task = asyncio.create_task(warm_periodically(model_warmup))
+    eviction_task = asyncio.create_task(
+        evict_idle_periodically(rate_limiter, settings.RATE_LIMIT_EVICT_INTERVAL)
+    )
+    token_eviction_task = asyncio.create_task(
+        evict_idle_periodically(token_budget, settings.RATE_LIMIT_EVICT_INTERVAL)
+    )
+    loop_monitor.start()
     yield
-    # Shutdown (if needed)
+    # Shutdown
     logger.info("Shutting down Secure LLM Inference Service...")
+    loop_monitor.stop()
+    eviction_task.cancel()
+    token_eviction_task.cancel()
+    probe_task.cancel()
+    warmup_task.cancel()
+    if settings.DISK_CACHE_ENABLED:
+        disk_cache.flush()
+    password_verifier.shutdown()
+    await ollama_service.aclose()
 
 
 # Initialize FastAPI app
@@ -38,12 +89,30 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan
 )
+app.add_middleware(prometheus_metrics.PrometheusMiddleware)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+# Outermost, so response compression counts towards the total
+app.add_middleware(TimingMiddleware, header=settings.SERVER_TIMING_ENABLED)
+app.include_router(streaming.router)
+app.include_router(batch.router)
+app.include_router(conversation.router)
+app.include_router(diagnostics.router)
+app.include_router(ws.router)
+app.include_router(prometheus_metrics.router)
 
 
 @app.post("/auth/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Generate JWT token for authentication"""
-    user = authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user_async(form_data.username, form_data.password)
+    except LoginThrottledError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -60,73 +129,134 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+def _cache_directives(http_request: Request) -> Tuple[bool, bool]:
+    """Return (read, write) cache permissions from the request's Cache-Control header"""
+    directives = {d.strip().lower() for d in http_request.headers.get("cache-control", "").split(",")}
+    if "no-store" in directives:
+        return False, False
+    return "no-cache" not in directives, True
+
+
 @app.post(f"/{settings.API_VERSION}/infer", response_model=InferenceResponse)
-async def infer(request: InferenceRequest, current_user: User = Depends(get_current_user)):
-    """Main inference endpoint with authentication and rate limiting"""
+async def infer(
+    request: InferenceRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user),
+):
+    """Main inference endpoint with authentication and rate limiting.
+    
+    Returns a pre-rendered response, so ``InferenceResponse`` only documents
+    the schema and is not re-validated on every call.
+    """
+    deadline = Deadline.from_request(http_request)
+    
+    try:
+        model = ollama_service.resolve_model(request.model)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     
     # Check rate limit
-    rate_limiter.check_rate_limit(current_user.username)
+    with timed("rate_limit"):
+        rate_limit = await offload(rate_limiter.check_rate_limit, current_user.username, current_user.tier)
+        headers = rate_limit.headers()
+        options = apply_max_tokens(request.options, request.max_tokens)
+        estimate = estimate_tokens(request.prompt, options)
+        token_limit = await offload(token_budget.check_budget, current_user.username, current_user.tier, estimate)
+        if token_limit is not None:
+            headers.update(token_limit.headers(TOKEN_HEADER_PREFIX))
     
-    # Track start time
-    start_time = time.time()
-    success = False
-    response_text = ""
+    cache_read, cache_write = _cache_directives(http_request)
+    http_request.state.model = model
     
     try:
-        # Generate response from LLM
-        response_text = ollama_service.generate(request.prompt)
-        success = True
-        
-        # Calculate latency
-        latency_ms = (time.time() - start_time) * 1000
-        
-        # Record metrics
-        metrics_tracker.record_request(latency_ms, success=True)
-        
-        # Structured logging
-        log_extra = {
-            "user_id": current_user.username,
-            "prompt_length": len(request.prompt),
-            "response_length": len(response_text),
-            "latency_ms": round(latency_ms, 2),
-            "status": "success"
-        }
-        logger.info("Inference completed successfully", extra=log_extra)
-        
-        return InferenceResponse(response=response_text)
-        
+        result = await run_with_deadline(
+            run_inference(
+                request.prompt, options, current_user, cache_read, cache_write, model,
+                reserved_tokens=estimate, deadline=deadline,
+            ),
+            deadline,
+            http_request,
+        )
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+    except ClientDisconnectedError as e:
+        # Nobody is left to read this; it only labels the request in metrics
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except (QueueFullError, BackendUnavailableError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
     except Exception as e:
-        latency_ms = (time.time() - start_time) * 1000
-        metrics_tracker.record_request(latency_ms, success=False)
-        
-        log_extra = {
-            "user_id": current_user.username,
-            "prompt_length": len(request.prompt),
-            "latency_ms": round(latency_ms, 2),
-            "status": "error"
-        }
-        logger.error(f"Inference failed: {str(e)}", extra=log_extra)
-        
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Inference failed: {str(e)}"
         )
+    
+    headers["X-Cache"] = result.cache_status.upper()
+    if result.cache_tier:
+        headers["X-Cache-Tier"] = result.cache_tier
+    http_request.state.cache = result.cache_status
+    return FastJSONResponse({"response": result.response}, headers=headers)
 
 
 @app.get("/metrics")
 async def get_metrics(current_user: User = Depends(get_current_user)):
     """Get performance metrics (requires authentication)"""
-    return metrics_tracker.get_metrics()
+    metrics = await offload(metrics_tracker.get_metrics)
+    metrics["cache"] = await offload(prompt_cache.stats)
+    if settings.DISK_CACHE_ENABLED:
+        metrics["disk_cache"] = await offload(disk_cache.stats)
+    if settings.SEMANTIC_CACHE_ENABLED:
+        metrics["semantic_cache"] = await offload(semantic_cache.stats)
+    metrics["sessions"] = await offload(session_store.stats)
+    metrics["coalescing"] = request_coalescer.stats()
+    metrics["scheduler"] = inference_scheduler.stats()
+    metrics["auth_token_cache"] = token_cache.stats()
+    metrics["login"] = password_verifier.stats()
+    metrics["rate_limiter"] = await offload(rate_limiter.stats)
+    metrics["token_budget"] = await offload(token_budget.stats)
+    metrics["upstream"] = ollama_service.stats()
+    metrics["warmup"] = model_warmup.stats()
+    metrics["logging"] = logging_stats()
+    metrics["timing"] = timing_stats()
+    # Already plain JSON types; skip the generic encoder's walk over every value
+    return FastJSONResponse(metrics)
 
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    ollama_status = ollama_service.health_check()
+    """Health check endpoint, answered from the background prober's cached results"""
+    ollama_status = ollama_service.is_available()
+    backends = [
+        {
+            "name": b.name,
+            "url": b.base_url,
+            "models": b.models,
+            "status": b.status,
+            "circuit": b.breaker.state,
+            "last_probe_age_seconds": round(time.time() - b.last_probe_at, 1) if b.last_probe_at else None,
+        }
+        for b in ollama_service.backends
+    ]
     return {
-        "status": "healthy" if ollama_status else "degraded",
+        "status": "healthy" if all(b["status"] == "up" for b in backends) else "degraded",
         "ollama_service": "up" if ollama_status else "down",
-        "model": settings.OLLAMA_MODEL
+        "model": settings.OLLAMA_MODEL,
+        "backends": backends
+    }
+
+
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """Readiness probe: 503 until every model is warm and a backend accepts calls"""
+    ready = model_warmup.warmed_up and ollama_service.is_available()
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "status": "ready" if ready else "not_ready",
+        "warmup": model_warmup.stats()
     }
 
 
@@ -139,7 +269,12 @@ async def root():
         "endpoints": {
             "auth": "/auth/token",
             "inference": f"/{settings.API_VERSION}/infer",
+            "streaming": f"/{settings.API_VERSION}/infer/stream",
+            "batch": f"/{settings.API_VERSION}/infer/batch",
+            "chat": f"/{settings.API_VERSION}/chat",
             "metrics": "/metrics",
-            "health": "/health"
+            "prometheus": "/metrics/prometheus",
+            "health": "/health",
+            "ready": "/ready"
         }
     }
\ No newline at end of file
@@ -1,52 +1,313 @@
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime
-import statistics
+import math
+import threading
+import time
+from app.config import settings
+from app.state_backend import SharedProxy, shared
+
+
+class LatencyHistogram:
+    """Fixed-memory, mergeable latency histogram.
+    
+    Values land in logarithmic buckets whose bounds grow by ``GAMMA``, so every
+    quantile is within ~1% relative error. Bucket bounds are global constants,
+    which makes histograms from different workers mergeable by adding counts.
+    Recording is O(1); a summary sorts the buckets once and reads every
+    quantile in a single pass.
+    """
+    
+    GAMMA = 1.02
+    MIN_VALUE_MS = 0.01
+    MAX_BUCKET = 1200  # covers up to ~0.01 * 1.02**1200 ms, i.e. ~5 days
+    _LOG_GAMMA = math.log(GAMMA)
+    
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    @classmethod
+    def _bucket(cls, value: float) -> int:
+        if value <= cls.MIN_VALUE_MS:
+            return 0
+        return min(cls.MAX_BUCKET, math.ceil(math.log(value / cls.MIN_VALUE_MS) / cls._LOG_GAMMA))
+    
+    @classmethod
+    def _bucket_value(cls, index: int) -> float:
+        # Midpoint (in relative terms) of (MIN * GAMMA**(i-1), MIN * GAMMA**i]
+        return cls.MIN_VALUE_MS * cls.GAMMA ** index * 2 / (1 + cls.GAMMA)
+    
+    def record(self, value: float):
+        index = self._bucket(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+    
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+    
+    def quantiles(self, qs: List[float]) -> List[float]:
+        """Several quantiles, ascending ``qs``, in one pass over the sorted buckets"""
+        if not self.count:
+            return [0] * len(qs)
+        results: List[float] = []
+        ranks = iter(q * (self.count - 1) for q in qs)
+        rank = next(ranks)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while seen > rank:
+                results.append(min(self._bucket_value(index), self.max))
+                rank = next(ranks, None)
+                if rank is None:
+                    return results
+        return results + [self.max] * (len(qs) - len(results))
+    
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+    
+    def summary(self) -> dict:
+        p50, p90, p95, p99 = self.quantiles([0.50, 0.90, 0.95, 0.99])
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else 0,
+            "p50": round(p50, 2),
+            "p90": round(p90, 2),
+            "p95": round(p95, 2),
+            "p99": round(p99, 2),
+            "max": round(self.max, 2),
+        }
+    
+    def to_dict(self) -> dict:
+        return {"counts": dict(self.counts), "count": self.count, "total": self.total, "max": self.max}
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        histogram = cls()
+        histogram.counts = {int(k): v for k, v in data["counts"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class WindowedHistogram:
+    """Lifetime histogram plus a ring of time slots for rolling windows"""
+    
+    WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+    
+    def __init__(self, slot_seconds: int = 10, horizon_seconds: int = 900):
+        self.slot_seconds = slot_seconds
+        self.lifetime = LatencyHistogram()
+        self.slots: List[Optional[LatencyHistogram]] = [None] * (horizon_seconds // slot_seconds)
+        self.slot_epochs: List[int] = [-1] * len(self.slots)
+    
+    def record(self, value: float, now: Optional[float] = None):
+        self.lifetime.record(value)
+        epoch = int((now if now is not None else time.monotonic()) // self.slot_seconds)
+        position = epoch % len(self.slots)
+        if self.slot_epochs[position] != epoch:
+            self.slots[position] = LatencyHistogram()
+            self.slot_epochs[position] = epoch
+        self.slots[position].record(value)
+    
+    def window(self, seconds: int, now: Optional[float] = None) -> LatencyHistogram:
+        epoch = int((now if now is not None else time.monotonic()) // self.slot_seconds)
+        oldest = epoch - seconds // self.slot_seconds + 1
+        merged = LatencyHistogram()
+        for slot, slot_epoch in zip(self.slots, self.slot_epochs):
+            if slot is not None and oldest <= slot_epoch <= epoch:
+                merged.merge(slot)
+        return merged
+    
+    def merge(self, other: "WindowedHistogram"):
+        """Merge another worker's histogram; slots align on monotonic time"""
+        self.lifetime.merge(other.lifetime)
+        for position, (slot, slot_epoch) in enumerate(zip(other.slots, other.slot_epochs)):
+            if slot is None:
+                continue
+            if self.slot_epochs[position] == slot_epoch:
+                self.slots[position].merge(slot)
+            elif self.slot_epochs[position] < slot_epoch:
+                self.slots[position] = LatencyHistogram()
+                self.slots[position].merge(slot)
+                self.slot_epochs[position] = slot_epoch
+    
+    def summary(self) -> dict:
+        now = time.monotonic()
+        result = {"lifetime": self.lifetime.summary()}
+        for name, seconds in self.WINDOWS.items():
+            result[name] = self.window(seconds, now).summary()
+        return result
 
 
 class MetricsTracker:
     """Track performance metrics for the API"""
     
     def __init__(self):
-        self.latencies: List[float] = []
+        self.latency = WindowedHistogram()
+        self.ttft = WindowedHistogram()
+        self.inter_token = WindowedHistogram()
         self.total_requests = 0
         self.successful_requests = 0
         self.failed_requests = 0
+        self.streaming_requests = 0
+        self.client_disconnects = 0
+        self.deadline_exceeded = 0
+        self.abandoned_requests = 0
         self.start_time = datetime.utcnow()
+        # The shared state backend calls in from several server threads
+        self.lock = threading.Lock()
     
     def record_request(self, latency_ms: float, success: bool):
         """Record a request with its latency"""
-        self.latencies.append(latency_ms)
-        self.total_requests += 1
-        if success:
-            self.successful_requests += 1
-        else:
-            self.failed_requests += 1
+        with self.lock:
+            self.latency.record(latency_ms)
+            self.total_requests += 1
+            if success:
+                self.successful_requests += 1
+            else:
+                self.failed_requests += 1
+    
+    def record_stream(self, ttft_ms: float, inter_token_ms: List[float], disconnected: bool = False):
+        """Record time-to-first-token and inter-token gaps of a streamed response"""
+        with self.lock:
+            self.streaming_requests += 1
+            if ttft_ms is not None:
+                self.ttft.record(ttft_ms)
+            for gap_ms in inter_token_ms:
+                self.inter_token.record(gap_ms)
+            if disconnected:
+                self.client_disconnects += 1
+    
+    def record_cutoff(self, deadline_exceeded: bool):
+        """Count a request cut off by its deadline, or abandoned by its client"""
+        with self.lock:
+            if deadline_exceeded:
+                self.deadline_exceeded += 1
+            else:
+                self.abandoned_requests += 1
+    
+    def __getstate__(self) -> dict:
+        # Sent to the shared state server by value; the lock stays behind
+        with self.lock:
+            return {name: value for name, value in self.__dict__.items() if name != "lock"}
+    
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+    
+    def drain(self) -> "MetricsTracker":
+        """Hand over everything recorded so far and start again from zero"""
+        drained = MetricsTracker()
+        fresh = MetricsTracker()
+        with self.lock:
+            for name, value in self.__dict__.items():
+                if name != "lock":
+                    setattr(drained, name, value)
+            for name, value in fresh.__dict__.items():
+                if name not in ("lock", "start_time"):
+                    setattr(self, name, value)
+        return drained
+    
+    def merge(self, other: "MetricsTracker"):
+        """Fold another worker's tracker into this one"""
+        with self.lock:
+            self.latency.merge(other.latency)
+            self.ttft.merge(other.ttft)
+            self.inter_token.merge(other.inter_token)
+            self.total_requests += other.total_requests
+            self.successful_requests += other.successful_requests
+            self.failed_requests += other.failed_requests
+            self.streaming_requests += other.streaming_requests
+            self.client_disconnects += other.client_disconnects
+            self.deadline_exceeded += other.deadline_exceeded
+            self.abandoned_requests += other.abandoned_requests
+            self.start_time = min(self.start_time, other.start_time)
     
     def get_metrics(self) -> dict:
         """Get current metrics summary"""
-        if not self.latencies:
+        with self.lock:
+            latency = self.latency.summary()
+            ttft = self.ttft.summary()
+            inter_token = self.inter_token.summary()
+            uptime = (datetime.utcnow() - self.start_time).total_seconds()
+            
             return {
-                "total_requests": 0,
-                "successful_requests": 0,
-                "failed_requests": 0,
-                "average_latency_ms": 0,
-                "p95_latency_ms": 0,
-                "uptime_seconds": 0
+                "total_requests": self.total_requests,
+                "successful_requests": self.successful_requests,
+                "failed_requests": self.failed_requests,
+                "average_latency_ms": latency["lifetime"]["mean"],
+                "p95_latency_ms": latency["lifetime"]["p95"],
+                "streaming_requests": self.streaming_requests,
+                "client_disconnects": self.client_disconnects,
+                "deadline_exceeded": self.deadline_exceeded,
+                "abandoned_requests": self.abandoned_requests,
+                "average_ttft_ms": ttft["lifetime"]["mean"],
+                "p95_ttft_ms": ttft["lifetime"]["p95"],
+                "average_inter_token_ms": inter_token["lifetime"]["mean"],
+                "p95_inter_token_ms": inter_token["lifetime"]["p95"],
+                "latency_ms": latency,
+                "ttft_ms": ttft,
+                "inter_token_ms": inter_token,
+                "uptime_seconds": round(uptime, 2)
             }
-        
-        sorted_latencies = sorted(self.latencies)
-        p95_index = int(len(sorted_latencies) * 0.95)
-        
-        uptime = (datetime.utcnow() - self.start_time).total_seconds()
-        
-        return {
-            "total_requests": self.total_requests,
-            "successful_requests": self.successful_requests,
-            "failed_requests": self.failed_requests,
-            "average_latency_ms": round(statistics.mean(self.latencies), 2),
-            "p95_latency_ms": round(sorted_latencies[p95_index], 2) if p95_index < len(sorted_latencies) else 0,
-            "uptime_seconds": round(uptime, 2)
-        }
 
 
-metrics_tracker = MetricsTracker()
\ No newline at end of file
+class MetricsTrackerProxy(SharedProxy):
+    """Shared-backend handle that records in-process and merges periodically.
+    
+    Recording runs on every request, so it never waits on the state server:
+    the first record after a flush arms a timer, and when it fires this
+    worker's tracker is drained into the shared one with a single ``merge``.
+    Reads flush first, so they include this worker's latest requests.
+    """
+    
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._local = MetricsTracker()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_lock = threading.Lock()
+    
+    def _flush(self):
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            drained = self._local.drain()
+        self._post("merge", drained)
+    
+    def _schedule_flush(self):
+        with self._timer_lock:
+            if self._timer is None:
+                self._timer = threading.Timer(settings.STATE_BACKEND_FLUSH_INTERVAL, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+    
+    def record_request(self, latency_ms: float, success: bool):
+        self._local.record_request(latency_ms, success)
+        self._schedule_flush()
+    
+    def record_stream(self, ttft_ms: float, inter_token_ms: List[float], disconnected: bool = False):
+        self._local.record_stream(ttft_ms, inter_token_ms, disconnected)
+        self._schedule_flush()
+    
+    def record_cutoff(self, deadline_exceeded: bool):
+        self._local.record_cutoff(deadline_exceeded)
+        self._schedule_flush()
+    
+    def get_metrics(self) -> dict:
+        self._flush()
+        # Queued behind the merges, so the result includes every flushed record
+        return self._poster.submit(self._call, "get_metrics").result()
+
+
+metrics_tracker = shared("metrics_tracker", MetricsTracker, MetricsTrackerProxy)
@@ -1,21 +1,162 @@
+import asyncio
+import logging
 import time
-from app.llm_service import ollama_service
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.llm_service import OllamaBackend, OllamaService, ollama_service
+from app.prometheus_metrics import MODEL_LOAD_DURATION, MODEL_WARM
+
+
+logger = logging.getLogger(__name__)
+
+
+class _WarmState:
+    __slots__ = ("warm", "load_seconds", "warmup_seconds", "warmed_at", "loads", "error")
+    
+    def __init__(self):
+        self.warm = False
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.warmed_at: Optional[float] = None
+        self.loads = 0
+        self.error: Optional[str] = None
+
 
 # Model loading and warmup logic
 class ModelWarmup:
-    def __init__(self):
-        self.warmed_up = False
-    
-    def warmup(self, test_prompt: str = "Hello!") -> bool:
-        if not self.warmed_up:
-            try:
-                start = time.time()
-                ollama_service.generate(test_prompt)
-                end = time.time()
-                self.warmed_up = True
-                print(f"Warmup complete, took {round(end-start, 2)}s")
-            except Exception as e:
-                print(f"Warmup failed: {e}")
+    """Preload and warm every configured model on every backend, then keep them resident.
+    
+    Warming is a load request (so the model is in memory with our
+    ``keep_alive``) followed by the configured warm prompts, which run the
+    first real generation. The service is ready once each model is warm on at
+    least one backend. Afterwards, models idle for ``KEEP_WARM_INTERVAL`` get
+    a load request again, which resets Ollama's keep-alive timer and reloads
+    a model that was evicted anyway.
+    """
+    
+    WARM_PROMPT_OPTIONS = {"num_predict": 8}
+    
+    def __init__(self, service: OllamaService):
+        self.service = service
+        self.states: Dict[Tuple[str, str], _WarmState] = {}
+        self.started = False
+        self.pings = 0
+    
+    def _pairs(self) -> List[Tuple[OllamaBackend, str]]:
+        return [(backend, model) for backend in self.service.backends for model in backend.models]
+    
+    def _state(self, backend: OllamaBackend, model: str) -> _WarmState:
+        return self.states.setdefault((backend.name, model), _WarmState())
+    
+    @property
+    def warmed_up(self) -> bool:
+        """True once every model is warm on at least one backend"""
+        if not settings.WARMUP_ENABLED:
+            return True
+        if not self.started:
+            return False
+        return all(
+            any(self._state(backend, model).warm for backend in self.service.backends if model in backend.models)
+            for model in self.service.models()
+        )
+    
+    async def _load(self, backend: OllamaBackend, model: str) -> float:
+        state = self._state(backend, model)
+        seconds = await backend.preload(model, settings.WARMUP_TIMEOUT)
+        state.load_seconds = seconds
+        state.loads += 1
+        MODEL_LOAD_DURATION.labels(model=model, backend=backend.name).observe(seconds)
+        return seconds
+    
+    async def _warm_one(self, backend: OllamaBackend, model: str) -> bool:
+        state = self._state(backend, model)
+        start = time.perf_counter()
+        try:
+            load_seconds = await self._load(backend, model)
+            for prompt in settings.WARMUP_PROMPTS:
+                await backend.generate(model, prompt, self.WARM_PROMPT_OPTIONS, timeout=settings.WARMUP_TIMEOUT)
+        except Exception as e:
+            state.error = str(e)
+            logger.warning(f"Warmup of {model} on {backend.name} failed: {str(e)}")
+            return False
+        state.warm = True
+        state.error = None
+        state.warmup_seconds = time.perf_counter() - start
+        state.warmed_at = time.time()
+        MODEL_WARM.labels(model=model, backend=backend.name).set(1)
+        logger.info(
+            f"Model {model} warm on {backend.name}: loaded in {load_seconds:.2f}s, "
+            f"warmed in {state.warmup_seconds:.2f}s"
+        )
+        return True
+    
+    async def warmup(self) -> bool:
+        """Warm every (backend, model) pair concurrently; returns readiness"""
+        self.started = True
+        if settings.WARMUP_ENABLED:
+            await asyncio.gather(*(
+                self._warm_one(backend, model)
+                for backend, model in self._pairs()
+                if not self._state(backend, model).warm
+            ))
         return self.warmed_up
+    
+    async def keep_warm(self):
+        """Retry failed warmups and ping models that have been idle too long"""
+        interval = settings.KEEP_WARM_INTERVAL
+        tasks = []
+        now = time.monotonic()
+        for backend, model in self._pairs():
+            if not backend.breaker.available():
+                # A backend that went down has likely lost its loaded models
+                self._state(backend, model).warm = False
+                MODEL_WARM.labels(model=model, backend=backend.name).set(0)
+                continue
+            if settings.WARMUP_ENABLED and not self._state(backend, model).warm:
+                tasks.append(self._warm_one(backend, model))
+            elif interval and now - backend.last_used.get(model, 0.0) >= interval:
+                tasks.append(self._ping(backend, model))
+        await asyncio.gather(*tasks)
+    
+    async def _ping(self, backend: OllamaBackend, model: str):
+        try:
+            await self._load(backend, model)
+            self.pings += 1
+        except Exception as e:
+            logger.warning(f"Keep-warm ping of {model} on {backend.name} failed: {str(e)}")
+    
+    def stats(self) -> dict:
+        return {
+            "ready": self.warmed_up,
+            "keep_warm_pings": self.pings,
+            "models": [
+                {
+                    "backend": backend_name,
+                    "model": model,
+                    "warm": state.warm,
+                    "load_seconds": round(state.load_seconds, 3) if state.load_seconds is not None else None,
+                    "warmup_seconds": round(state.warmup_seconds, 3) if state.warmup_seconds is not None else None,
+                    "loads": state.loads,
+                    "error": state.error,
+                }
+                for (backend_name, model), state in self.states.items()
+            ],
+        }
+
+
+async def warm_periodically(warmup: ModelWarmup):
+    """Background task: initial warmup, then retries and keep-warm pings"""
+    await warmup.warmup()
+    while True:
+        if not warmup.warmed_up or not settings.KEEP_WARM_INTERVAL:
+            await asyncio.sleep(settings.HEALTH_PROBE_INTERVAL)
+        else:
+            # Check several times per interval so idle models are pinged on time
+            await asyncio.sleep(min(settings.KEEP_WARM_INTERVAL / 4, 60))
+        try:
+            await warmup.keep_warm()
+        except Exception as e:
+            logger.error(f"Keep-warm failed: {str(e)}")
+
 
-model_warmup = ModelWarmup()
+model_warmup = ModelWarmup(ollama_service)
@@ -1,9 +1,13 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, Optional
+from app.config import settings
 
 
 class InferenceRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=2000, description="Input prompt for LLM")
+    options: Optional[Dict[str, Any]] = Field(None, description="Ollama generation options (temperature, top_p, seed, ...)")
+    model: Optional[str] = Field(None, max_length=200, description="Model to run; defaults to OLLAMA_MODEL")
+    max_tokens: Optional[int] = Field(None, ge=1, le=settings.MAX_TOKENS_LIMIT, description="Cap on generated tokens (Ollama num_predict)")
 
 
 class InferenceResponse(BaseModel):
@@ -22,4 +26,23 @@ class UserCreate(BaseModel):
 
 class User(BaseModel):
     username: str
-    disabled: Optional[bool] = False
\ No newline at end of file
+    disabled: Optional[bool] = False
+    tier: str = "default"
+
+class ChatRequest(BaseModel):
+    message: str = Field(..., min_length=1, max_length=2000, description="Next user message in the conversation")
+    session_id: Optional[str] = Field(None, max_length=64, description="Session to continue; omit to start a new one")
+    options: Optional[Dict[str, Any]] = Field(None, description="Ollama generation options (temperature, top_p, seed, ...)")
+    model: Optional[str] = Field(None, max_length=200, description="Model for a new session; defaults to OLLAMA_MODEL")
+    max_tokens: Optional[int] = Field(None, ge=1, le=settings.MAX_TOKENS_LIMIT, description="Cap on generated tokens (Ollama num_predict)")
+
+
+class ChatResponse(BaseModel):
+    session_id: str = Field(..., description="Pass back to continue the conversation")
+    response: str = Field(..., description="Generated response from LLM")
+    turn: int = Field(..., description="Number of turns in the session so far")
+    context_full: bool = Field(False, description="The conversation outgrew SESSION_MAX_CONTEXT_TOKENS; start a new session to continue")
+
+
+class ProfilingConfig(BaseModel):
+    sample_rate: float = Field(..., ge=0, le=1, description="Fraction of requests to profile; 0 turns profiling off")
@@ -1,26 +1,256 @@
+import asyncio
+import os
+import time
 from fastapi import APIRouter, Depends, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
 from app.metrics import metrics_tracker
-from app.auth import get_current_user
-import prometheus_client
+from app.auth import get_current_user, password_verifier
+from app.prompt_cache import prompt_cache
+from app.disk_cache import disk_cache
+from app.semantic_cache import semantic_cache
+from app.sessions import session_store
+from app.config import settings
+from app.coalescer import request_coalescer
+from app.logging_config import logging_stats
 
 router = APIRouter()
 
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# Instruments are created once at import and labelled per request
+REQUESTS_TOTAL = Counter(
+    "llm_http_requests_total", "HTTP requests handled",
+    ["route", "model", "status", "cache"],
+)
+REQUEST_LATENCY = Histogram(
+    "llm_http_request_duration_seconds", "End-to-end HTTP request latency, including streamed bodies",
+    ["route", "model", "status", "cache"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "llm_http_requests_in_flight", "HTTP requests currently being served",
+    ["route"], multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "llm_upstream_duration_seconds", "Latency of Ollama generate calls",
+    ["model", "backend", "status", "mode"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "llm_upstream_requests_in_flight", "Ollama generate calls currently in progress",
+    ["model", "backend"], multiprocess_mode="livesum",
+)
+CIRCUIT_STATE = Gauge(
+    "llm_backend_circuit_state", "Circuit breaker state per Ollama backend (0 closed, 1 half-open, 2 open)",
+    ["backend"], multiprocess_mode="max",
+)
+CIRCUIT_REJECTED = Counter(
+    "llm_circuit_rejected_total", "Requests failed fast because every backend for the model had an open circuit",
+    ["model"],
+)
+MODEL_LOAD_DURATION = Histogram(
+    "llm_model_load_duration_seconds", "Time to make a model resident in Ollama (warmup and keep-warm loads)",
+    ["model", "backend"], buckets=LATENCY_BUCKETS + (300.0,),
+)
+SEMANTIC_CACHE_LATENCY = Histogram(
+    "llm_semantic_cache_duration_seconds", "Semantic cache lookup latency by stage (embed, search)",
+    ["stage"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+MODEL_WARM = Gauge(
+    "llm_model_warm", "1 once a model has been loaded and warmed on a backend",
+    ["model", "backend"], multiprocess_mode="max",
+)
+TOKENS_TOTAL = Counter(
+    "llm_tokens_total", "Tokens processed by Ollama",
+    ["model", "kind"],
+)
+TIER_TOKENS_TOTAL = Counter(
+    "llm_tier_tokens_total", "Ollama tokens charged to users, by tier",
+    ["tier", "model", "kind"],
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "llm_scheduler_queue_depth", "Requests waiting for an upstream slot",
+    ["model"], multiprocess_mode="livesum",
+)
+SCHEDULER_ACTIVE = Gauge(
+    "llm_scheduler_active", "Upstream slots in use",
+    ["model"], multiprocess_mode="livesum",
+)
+SCHEDULER_WAIT = Histogram(
+    "llm_scheduler_wait_seconds", "Time spent waiting for an upstream slot",
+    ["model"], buckets=LATENCY_BUCKETS,
+)
+SCHEDULER_REJECTED = Counter(
+    "llm_scheduler_rejected_total", "Requests turned away because the queue exceeded its latency budget",
+    ["model"],
+)
+STAGE_LATENCY = Histogram(
+    "llm_request_stage_duration_seconds", "Time spent in each stage of a request (auth, rate_limit, cache, queue, connect, upstream, serialize)",
+    ["route", "stage"], buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025) + LATENCY_BUCKETS,
+)
+LOOP_LAG = Histogram(
+    "llm_event_loop_lag_seconds", "How late the event loop woke a periodic sampler",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = Counter(
+    "llm_event_loop_blocked_total", "Event loop stalls longer than LOOP_BLOCK_THRESHOLD",
+)
+WS_CONNECTIONS = Gauge(
+    "llm_ws_connections", "Open WebSocket inference connections",
+    multiprocess_mode="livesum",
+)
+WS_MESSAGES = Counter(
+    "llm_ws_messages_total", "Prompts received over WebSocket connections, by outcome",
+    ["outcome"],
+)
+REQUESTS_DEADLINE_EXCEEDED = Counter(
+    "llm_deadline_exceeded_total", "Requests cut off by their deadline, by the stage they were in",
+    ["stage"],
+)
+REQUESTS_ABANDONED = Counter(
+    "llm_requests_abandoned_total", "Requests whose client disconnected before the response, by the stage they were in",
+    ["stage"],
+)
+
+
+def observe_tokens(model: str, prompt_tokens: int, completion_tokens: int):
+    if prompt_tokens:
+        TOKENS_TOTAL.labels(model=model, kind="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        TOKENS_TOTAL.labels(model=model, kind="completion").inc(completion_tokens)
+
+
+class PrometheusMiddleware:
+    """ASGI middleware timing every HTTP request until its last body chunk.
+    
+    Endpoints may set ``request.state.model`` and ``request.state.cache`` to
+    fill in the corresponding labels.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    @staticmethod
+    def _route_label(scope) -> str:
+        # Label by route template rather than raw path to bound cardinality
+        return getattr(scope.get("route"), "path", "unmatched")
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        status_code = 500
+        in_flight_route = None
+        
+        # The route template is only known once routing has run, i.e. by the
+        # time the endpoint reads the body or starts the response
+        def enter():
+            nonlocal in_flight_route
+            if in_flight_route is None and "route" in scope:
+                in_flight_route = self._route_label(scope)
+                REQUESTS_IN_FLIGHT.labels(route=in_flight_route).inc()
+        
+        async def receive_wrapper():
+            enter()
+            return await receive()
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            enter()
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            if in_flight_route is not None:
+                REQUESTS_IN_FLIGHT.labels(route=in_flight_route).dec()
+            state = scope.get("state", {})
+            labels = {
+                "route": self._route_label(scope),
+                "model": state.get("model", ""),
+                "status": str(status_code),
+                "cache": state.get("cache", ""),
+            }
+            REQUESTS_TOTAL.labels(**labels).inc()
+            REQUEST_LATENCY.labels(**labels).observe(time.perf_counter() - start)
+
+
+class ServiceStateCollector(Collector):
+    """Expose cache, coalescing and tracker counters at scrape time"""
+    
+    def collect(self):
+        cache = prompt_cache.stats()
+        for name in ("hits", "misses", "evictions", "expirations"):
+            yield CounterMetricFamily(f"llm_prompt_cache_{name}", f"Response cache {name}", value=cache[name])
+        yield GaugeMetricFamily("llm_prompt_cache_entries", "Entries in the response cache", value=cache["entries"])
+        yield GaugeMetricFamily("llm_prompt_cache_bytes", "Bytes held by the response cache", value=cache["bytes"])
+        
+        if settings.DISK_CACHE_ENABLED:
+            disk = disk_cache.stats()
+            for name in ("hits", "misses", "writes", "compactions"):
+                yield CounterMetricFamily(f"llm_disk_cache_{name}", f"Disk cache {name}", value=disk[name])
+            yield GaugeMetricFamily("llm_disk_cache_entries", "Entries in the disk cache", value=disk["entries"])
+            yield GaugeMetricFamily("llm_disk_cache_segment_bytes", "Size of the disk cache segment file", value=disk["segment_bytes"])
+        
+        sessions = session_store.stats()
+        yield GaugeMetricFamily("llm_sessions", "Conversation sessions held", value=sessions["sessions"])
+        yield GaugeMetricFamily("llm_session_bytes", "Bytes held by conversation contexts", value=sessions["bytes"])
+        yield GaugeMetricFamily("llm_session_max_bytes", "Bytes held by the largest conversation context", value=sessions["max_session_bytes"])
+        yield CounterMetricFamily("llm_session_turns", "Conversation turns served", value=sessions["turns"])
+        yield CounterMetricFamily("llm_session_continued_turns", "Turns that reused a stored context", value=sessions["continued_turns"])
+        yield CounterMetricFamily("llm_session_reused_context_tokens", "Context tokens sent back instead of resending history", value=sessions["reused_context_tokens"])
+        yield CounterMetricFamily("llm_session_evaluated_prompt_tokens", "Prompt tokens Ollama evaluated for conversation turns", value=sessions["evaluated_prompt_tokens"])
+        for name in ("evictions", "expirations"):
+            yield CounterMetricFamily(f"llm_session_{name}", f"Conversation session {name}", value=sessions[name])
+        yield CounterMetricFamily("llm_session_full", "Sessions closed because their context outgrew the limit", value=sessions["full_sessions"])
+        
+        if settings.SEMANTIC_CACHE_ENABLED:
+            semantic = semantic_cache.stats()
+            for name in ("hits", "misses", "false_hit_overrides", "evictions"):
+                yield CounterMetricFamily(f"llm_semantic_cache_{name}", f"Semantic cache {name.replace('_', ' ')}", value=semantic[name])
+            yield GaugeMetricFamily("llm_semantic_cache_entries", "Entries in the semantic cache", value=semantic["entries"])
+        
+        coalescing = request_coalescer.stats()
+        yield CounterMetricFamily(
+            "llm_coalesced_requests", "Requests served by sharing an identical in-flight generation",
+            value=coalescing["coalesced_requests"] + coalescing["coalesced_streams"],
+        )
+        
+        login = password_verifier.stats()
+        yield GaugeMetricFamily("llm_login_verifications_pending", "Password checks queued or running", value=login["pending"])
+        yield CounterMetricFamily("llm_login_rejected", "Logins rejected because the verifier queue was full", value=login["rejected"])
+        
+        logs = logging_stats()
+        if logs:
+            yield CounterMetricFamily("llm_log_records_dropped", "Log records dropped because the log queue was full", value=logs["dropped"])
+            yield CounterMetricFamily("llm_log_records_sampled_out", "Success log records skipped by sampling", value=logs["sampled_out"])
+        
+        tracker = metrics_tracker.get_metrics()
+        yield CounterMetricFamily("llm_stream_client_disconnects", "Streams abandoned by the client", value=tracker["client_disconnects"])
+
+
+REGISTRY.register(ServiceStateCollector())
+
+
+def _registry():
+    # With several uvicorn workers, aggregate the per-process files
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(ServiceStateCollector())
+        return registry
+    return REGISTRY
+
+
 @router.get("/metrics/prometheus")
 async def prometheus_metrics(current_user = Depends(get_current_user)):
-    # For demo: convert metrics_tracker data to Prometheus text format
-    data = metrics_tracker.get_metrics()
-    # Define Prometheus metrics
-    response_count = prometheus_client.Gauge('total_requests', 'Total API requests')
-    successful_requests = prometheus_client.Gauge('successful_requests', 'Successful requests')
-    failed_requests = prometheus_client.Gauge('failed_requests', 'Failed requests')
-    avg_latency = prometheus_client.Gauge('average_latency_ms', 'Average Latency (ms)')
-    p95_latency = prometheus_client.Gauge('p95_latency_ms', '95th Percentile Latency (ms)')
-
-    response_count.set(data.get('total_requests', 0))
-    successful_requests.set(data.get('successful_requests', 0))
-    failed_requests.set(data.get('failed_requests', 0))
-    avg_latency.set(data.get('average_latency_ms', 0))
-    p95_latency.set(data.get('p95_latency_ms', 0))
-
-    content = prometheus_client.generate_latest()
-    return Response(content, media_type='text/plain')
+    if settings.STATE_BACKEND == "shared":
+        # The collector reads the shared components over IPC; keep that off the event loop
+        content = await asyncio.to_thread(generate_latest, _registry())
+    else:
+        content = generate_latest(_registry())
+    return Response(content, media_type=CONTENT_TYPE_LATEST)
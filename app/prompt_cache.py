@@ -1,28 +1,114 @@
-import functools
-from typing import Any, Dict
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
 import hashlib
 import threading
+from app.config import settings
+from app.state_backend import SharedProxy, shared
 
-# Simple in-memory cache for repeated prompts
+# Rough per-entry bookkeeping overhead (key, tuple, OrderedDict node)
+ENTRY_OVERHEAD_BYTES = 200
+
+
+# LRU cache for generated responses, bounded by entry count and total bytes
 class PromptCache:
-    def __init__(self, max_size=128):
-        self.cache = dict()
-        self.max_size = max_size
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 3600):
+        # key -> (value, expires_at, size_bytes); most recently used last
+        self.cache: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
         self.lock = threading.Lock()
     
-    def _hash_prompt(self, prompt: str) -> str:
-        return hashlib.sha256(prompt.encode()).hexdigest()
+    @staticmethod
+    def make_key(model: str, prompt: str, options: Optional[Dict[str, Any]] = None, version: str = "") -> str:
+        """Cache key over everything that changes the generated output.
+        
+        ``version`` identifies the model build (its digest), so pulling a new
+        build of the same model name stops old entries from matching.
+        """
+        material = json.dumps(
+            {"model": model, "version": version, "prompt": prompt, "options": options or {}},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+    
+    def get(self, key: str) -> Any:
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        size = len(key) + len(str(value).encode()) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        with self.lock:
+            if key in self.cache:
+                self._remove(key)
+            self.cache[key] = (value, expires_at, size)
+            self.current_bytes += size
+            while len(self.cache) > self.max_entries or self.current_bytes > self.max_bytes:
+                oldest = next(iter(self.cache))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def _remove(self, key: str):
+        _, _, size = self.cache.pop(key)
+        self.current_bytes -= size
     
-    def get(self, prompt: str) -> Any:
+    def clear(self):
         with self.lock:
-            key = self._hash_prompt(prompt)
-            return self.cache.get(key)
+            self.cache.clear()
+            self.current_bytes = 0
     
-    def put(self, prompt: str, value: Any):
+    def stats(self) -> dict:
         with self.lock:
-            key = self._hash_prompt(prompt)
-            if len(self.cache) >= self.max_size:
-                self.cache.pop(next(iter(self.cache)))
-            self.cache[key] = value
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.cache),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+class PromptCacheProxy(SharedProxy):
+    """Shared-backend handle; writes are posted from a background thread"""
+    
+    make_key = staticmethod(PromptCache.make_key)
+    
+    def put(self, key: str, value: str):
+        self._post("put", key, value)
+
+
+def _create_prompt_cache() -> PromptCache:
+    return PromptCache(
+        max_entries=settings.PROMPT_CACHE_MAX_ENTRIES,
+        max_bytes=settings.PROMPT_CACHE_MAX_BYTES,
+        ttl_seconds=settings.PROMPT_CACHE_TTL,
+    )
 
-prompt_cache = PromptCache(max_size=128)
+prompt_cache = shared("prompt_cache", _create_prompt_cache, PromptCacheProxy)
@@ -1,35 +1,143 @@
+import asyncio
+import logging
+import math
+import threading
+import time
 from fastapi import HTTPException, status
-from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, NamedTuple, Optional
 from app.config import settings
+from app.state_backend import SharedProxy, shared
+
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    window: int
+    remaining: int
+    retry_after: float  # seconds until enough tokens are available
+    reset_after: float  # seconds until the bucket is full again
+    
+    def headers(self, prefix: str = "X-RateLimit") -> Dict[str, str]:
+        headers = {
+            f"{prefix}-Limit": str(self.limit),
+            f"{prefix}-Remaining": str(self.remaining),
+            f"{prefix}-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def _enforce(result: RateLimitResult, unit: str = "requests", prefix: str = "X-RateLimit") -> RateLimitResult:
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded. Max {result.limit} {unit} per {result.window} seconds.",
+            headers=result.headers(prefix),
+        )
+    return result
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+    
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
 
 
 class RateLimiter:
-    def __init__(self):
-        self.requests: Dict[str, List[datetime]] = defaultdict(list)
+    """Per-user token bucket: O(1) time and memory per user.
     
-    def check_rate_limit(self, user_id: str) -> bool:
-        """Check if user has exceeded rate limit"""
-        now = datetime.utcnow()
-        window_start = now - timedelta(seconds=settings.RATE_LIMIT_WINDOW)
-        
-        # Clean old requests
-        self.requests[user_id] = [
-            req_time for req_time in self.requests[user_id]
-            if req_time > window_start
-        ]
+    Each user may burst up to their limit and regains ``limit / window``
+    tokens per second, using monotonic time. A bucket idle for a full window
+    has refilled completely, so evicting it loses no state.
+    """
+    
+    def __init__(self, requests: int = None, window: int = None):
+        self.default_limit = requests or settings.RATE_LIMIT_REQUESTS
+        self.window = window or settings.RATE_LIMIT_WINDOW
+        self.buckets: Dict[str, _Bucket] = {}
+        self.lock = threading.Lock()
+    
+    def limit_for(self, user_id: str, tier: Optional[str] = None) -> int:
+        """Requests per window for a user: user override, then tier, then default"""
+        if user_id in settings.RATE_LIMIT_USER_OVERRIDES:
+            return settings.RATE_LIMIT_USER_OVERRIDES[user_id]
+        if tier is not None and tier in settings.RATE_LIMIT_TIERS:
+            return settings.RATE_LIMIT_TIERS[tier]
+        return self.default_limit
+    
+    def _bucket(self, user_id: str, limit: int, now: float) -> _Bucket:
+        """The user's bucket, refilled up to ``now``; call with the lock held"""
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            bucket = self.buckets[user_id] = _Bucket(limit, now)
+        else:
+            bucket.tokens = min(limit, bucket.tokens + (now - bucket.updated) * limit / self.window)
+            bucket.updated = now
+        return bucket
+    
+    def acquire(self, user_id: str, tier: Optional[str] = None, cost: float = 1) -> RateLimitResult:
+        """Take ``cost`` tokens from the user's bucket if available"""
+        limit = self.limit_for(user_id, tier)
+        refill_rate = limit / self.window
+        now = time.monotonic()
         
-        # Check limit
-        if len(self.requests[user_id]) >= settings.RATE_LIMIT_REQUESTS:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Rate limit exceeded. Max {settings.RATE_LIMIT_REQUESTS} requests per {settings.RATE_LIMIT_WINDOW} seconds."
-            )
+        with self.lock:
+            bucket = self._bucket(user_id, limit, now)
+            allowed = bucket.tokens >= cost
+            if allowed:
+                bucket.tokens -= cost
+            tokens = bucket.tokens
         
-        # Add current request
-        self.requests[user_id].append(now)
-        return True
+        return RateLimitResult(
+            allowed=allowed,
+            limit=limit,
+            window=self.window,
+            remaining=max(0, int(tokens)),
+            retry_after=0.0 if allowed else (cost - tokens) / refill_rate,
+            reset_after=(limit - tokens) / refill_rate,
+        )
+    
+    def check_rate_limit(self, user_id: str, tier: Optional[str] = None, cost: float = 1) -> RateLimitResult:
+        """Check if user has exceeded rate limit"""
+        return _enforce(self.acquire(user_id, tier, cost))
+    
+    def evict_idle(self) -> int:
+        """Drop buckets that have been idle for a full window"""
+        cutoff = time.monotonic() - self.window
+        with self.lock:
+            idle = [user_id for user_id, bucket in self.buckets.items() if bucket.updated <= cutoff]
+            for user_id in idle:
+                del self.buckets[user_id]
+        return len(idle)
+    
+    def stats(self) -> dict:
+        with self.lock:
+            return {"tracked_users": len(self.buckets)}
+
+
+async def evict_idle_periodically(limiter: RateLimiter, interval: float):
+    """Background task that keeps the bucket table bounded by active users"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            evicted = limiter.evict_idle()
+            if evicted:
+                logger.debug(f"Evicted {evicted} idle rate limit buckets")
+        except Exception as e:
+            logger.error(f"Rate limit eviction failed: {str(e)}")
+
+
+class RateLimiterProxy(SharedProxy):
+    """Shared-backend handle; the 429 is raised locally since it cannot be pickled"""
+    
+    def check_rate_limit(self, user_id: str, tier: Optional[str] = None, cost: float = 1) -> RateLimitResult:
+        return _enforce(self.acquire(user_id, tier, cost))
 
 
-rate_limiter = RateLimiter()
\ No newline at end of file
+rate_limiter = shared("rate_limiter", RateLimiter, RateLimiterProxy)
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.config import settings
+from app.deadlines import Deadline, DeadlineExceededError
+from app.llm_service import ollama_service
+from app.metrics import LatencyHistogram
+from app.prometheus_metrics import SCHEDULER_ACTIVE, SCHEDULER_QUEUE_DEPTH, SCHEDULER_REJECTED, SCHEDULER_WAIT
+from app.timing import record_stage
+
+
+class QueueFullError(Exception):
+    """Raised when a request would wait longer than the queue latency budget"""
+    
+    def __init__(self, retry_after: float):
+        super().__init__(f"Inference queue is full, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class InferenceScheduler:
+    """Admission control and fair queueing in front of one model.
+    
+    At most ``concurrency`` generations run at once, matching the Ollama
+    ``OLLAMA_NUM_PARALLEL`` slots of the backends serving the model, so it
+    stays saturated without thrashing. Waiting requests are ordered by priority (lower first), then by
+    a per-user virtual start time: a user's Nth queued request is tagged N
+    steps after their first, so one heavy user cannot starve everyone else.
+    Requests whose estimated wait exceeds ``max_queue_wait`` are rejected up
+    front instead of timing out later.
+    """
+    
+    EWMA_ALPHA = 0.2
+    
+    def __init__(self, model: str, concurrency: int, max_queue_wait: float, max_queue_size: int):
+        self.model = model
+        self.concurrency = concurrency
+        self.max_queue_wait = max_queue_wait
+        self.max_queue_size = max_queue_size
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.service_time_ewma = settings.SCHEDULER_INITIAL_SERVICE_TIME
+        self.wait_ms = LatencyHistogram()
+        self._heap: List[Tuple[int, float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._user_tags: Dict[str, float] = {}
+    
+    def estimated_wait(self) -> float:
+        """Seconds a request admitted now would wait for a slot"""
+        if self.active < self.concurrency and not self.queued:
+            return 0.0
+        return (self.queued // self.concurrency + 1) * self.service_time_ewma
+    
+    def check_admission(self):
+        """Raise QueueFullError if a new request should be turned away"""
+        wait = self.estimated_wait()
+        if wait > self.max_queue_wait or self.queued >= self.max_queue_size:
+            self.rejected += 1
+            SCHEDULER_REJECTED.labels(model=self.model).inc()
+            raise QueueFullError(retry_after=wait)
+    
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: int = 0, deadline: Optional[Deadline] = None) -> AsyncIterator[None]:
+        """Hold one upstream concurrency slot for the duration of the block.
+        
+        A request whose ``deadline`` would pass before a slot is likely to
+        free up is rejected at once rather than left to expire in the queue.
+        """
+        enqueued_at = time.perf_counter()
+        if deadline is not None:
+            deadline.enter("queue")
+        if self.active < self.concurrency and not self.queued:
+            self.active += 1
+        else:
+            self.check_admission()
+            if deadline is not None and self.estimated_wait() > deadline.remaining():
+                raise DeadlineExceededError("queue", deadline.timeout)
+            await self._wait_for_slot(user_id, priority)
+        if deadline is not None:
+            deadline.stage = "upstream"
+        
+        wait_ms = (time.perf_counter() - enqueued_at) * 1000
+        self.admitted += 1
+        self.wait_ms.record(wait_ms)
+        SCHEDULER_WAIT.labels(model=self.model).observe(wait_ms / 1000)
+        record_stage("queue", wait_ms / 1000)
+        SCHEDULER_ACTIVE.labels(model=self.model).set(self.active)
+        
+        started = time.perf_counter()
+        try:
+            yield
+            # Only calls that ran to completion say how long a slot is held;
+            # cancelled, abandoned and failed calls would skew the estimate
+            elapsed = time.perf_counter() - started
+            self.service_time_ewma += self.EWMA_ALPHA * (elapsed - self.service_time_ewma)
+        finally:
+            self.active -= 1
+            self._dispatch()
+    
+    async def _wait_for_slot(self, user_id: str, priority: int):
+        tag = max(self._virtual_time, self._user_tags.get(user_id, 0.0)) + 1
+        self._user_tags[user_id] = tag
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, tag, next(self._sequence), future))
+        self.queued += 1
+        SCHEDULER_QUEUE_DEPTH.labels(model=self.model).set(self.queued)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.active -= 1
+                self._dispatch()
+            else:
+                future.cancel()
+                self.queued -= 1
+                SCHEDULER_QUEUE_DEPTH.labels(model=self.model).set(self.queued)
+            raise
+    
+    def _dispatch(self):
+        while self.active < self.concurrency and self._heap:
+            _, tag, _, future = heapq.heappop(self._heap)
+            if future.cancelled():
+                continue
+            self.queued -= 1
+            self._virtual_time = tag
+            self.active += 1
+            future.set_result(None)
+        if not self._heap:
+            self._user_tags.clear()
+        SCHEDULER_QUEUE_DEPTH.labels(model=self.model).set(self.queued)
+        SCHEDULER_ACTIVE.labels(model=self.model).set(self.active)
+    
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "estimated_wait_seconds": round(self.estimated_wait(), 3),
+            "service_time_ewma_seconds": round(self.service_time_ewma, 3),
+            "queue_wait_ms": self.wait_ms.summary(),
+        }
+
+
+class ModelSchedulers:
+    """One InferenceScheduler per model, sized to the backends serving it.
+    
+    Ollama's ``OLLAMA_NUM_PARALLEL`` applies to each loaded model, so a model
+    gets the slots of the backends that serve it; a model served by one small
+    backend cannot take slots sized for the others, nor queue behind them.
+    """
+    
+    def __init__(self, max_queue_wait: float, max_queue_size: int):
+        self.pools: Dict[str, InferenceScheduler] = {
+            model: InferenceScheduler(model, ollama_service.capacity_for(model), max_queue_wait, max_queue_size)
+            for model in ollama_service.models()
+        }
+    
+    def for_model(self, model: Optional[str] = None) -> InferenceScheduler:
+        return self.pools[model or ollama_service.model]
+    
+    def check_admission(self, model: Optional[str] = None):
+        """Raise QueueFullError if a new request for ``model`` should be turned away"""
+        self.for_model(model).check_admission()
+    
+    def stats(self) -> dict:
+        pools = [pool.stats() for pool in self.pools.values()]
+        return {
+            "concurrency": sum(pool["concurrency"] for pool in pools),
+            "active": sum(pool["active"] for pool in pools),
+            "queued": sum(pool["queued"] for pool in pools),
+            "admitted": sum(pool["admitted"] for pool in pools),
+            "rejected": sum(pool["rejected"] for pool in pools),
+            "models": dict(zip(self.pools, pools)),
+        }
+
+
+def priority_for(tier: str) -> int:
+    return settings.SCHEDULER_TIER_PRIORITIES.get(tier, 0)
+
+
+async def scheduled_generate_result(
+    user_id: str,
+    priority: int,
+    prompt: str,
+    options: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+    context: Optional[List[int]] = None,
+    prefer: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
+    """Generate once a slot is free; the upstream call gets only the time ``deadline`` has left"""
+    async with inference_scheduler.for_model(model).slot(user_id, priority, deadline):
+        return await ollama_service.generate_result(prompt, options, model=model, context=context, prefer=prefer, deadline=deadline)
+
+
+async def scheduled_stream(
+    user_id: str,
+    priority: int,
+    prompt: str,
+    options: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+    usage: Optional[Dict[str, int]] = None,
+) -> AsyncIterator[str]:
+    async with inference_scheduler.for_model(model).slot(user_id, priority):
+        chunks = ollama_service.generate_stream(prompt, options, model=model, usage=usage)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+
+inference_scheduler = ModelSchedulers(
+    max_queue_wait=settings.SCHEDULER_MAX_QUEUE_WAIT,
+    max_queue_size=settings.SCHEDULER_MAX_QUEUE_SIZE,
+)
@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+from app.config import settings
+from app.state_backend import shared
+
+try:
+    import numpy as np
+except ImportError:  # optional: the semantic tier is unavailable without it
+    np = None
+
+NUMPY_AVAILABLE = np is not None
+
+
+def scope_id(scope_key: str) -> int:
+    """Fold a hex cache key into the int64 stored per slot"""
+    return int(scope_key[:15], 16)
+
+
+# Near-duplicate response cache over prompt embeddings
+class SemanticCache:
+    """Answer prompts that are paraphrases of earlier ones.
+    
+    Unit-length prompt embeddings live in a matrix preallocated for
+    ``max_entries`` rows, so a lookup is one matrix-vector product over every
+    slot followed by a masked argmax; no per-entry Python loop. Entries only
+    match within the same scope (model, model version and options). When the
+    matrix is full, expired slots are reused first, then the least recently
+    used.
+    
+    Clients that reject a near-duplicate answer re-send the prompt with
+    ``Cache-Control: no-cache``; those are counted as false-hit overrides.
+    """
+    
+    def __init__(self, max_entries: int = 10000, threshold: float = 0.95, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.dim: Optional[int] = None
+        # Allocated on the first insert, once the embedding size is known
+        self.vectors: Any = None
+        self.scopes: Any = None
+        self.expires_at: Any = None
+        self.last_used: Any = None
+        self.responses: List[Optional[str]] = []
+        self.free: List[int] = []
+        self.high_water = 0  # slots [0, high_water) have been used
+        # exact cache key -> slot, for prompts answered by a near-duplicate
+        self.recent_hits: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.false_hit_overrides = 0
+        self.evictions = 0
+        self.lookup_seconds = 0.0
+        self.lock = threading.Lock()
+    
+    def _allocate(self, dim: int):
+        self.dim = dim
+        self.vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self.scopes = np.zeros(self.max_entries, dtype=np.int64)
+        self.expires_at = np.zeros(self.max_entries, dtype=np.float64)
+        self.last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self.responses = [None] * self.max_entries
+        self.free = list(range(self.max_entries - 1, -1, -1))
+        self.high_water = 0
+        self.recent_hits.clear()
+    
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> Any:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+    
+    def lookup(self, vector: Sequence[float], scope: int, key: str) -> Optional[Tuple[str, float]]:
+        """Return (response, similarity) of the closest live entry above the threshold"""
+        start = time.perf_counter()
+        with self.lock:
+            try:
+                if self.dim is None or len(vector) != self.dim or not self.high_water:
+                    self.misses += 1
+                    return None
+                n = self.high_water
+                similarities = self.vectors[:n] @ self._normalize(vector)
+                live = (self.scopes[:n] == scope) & (self.expires_at[:n] > time.monotonic())
+                similarities[~live] = -1.0
+                slot = int(np.argmax(similarities))
+                similarity = float(similarities[slot])
+                if similarity < self.threshold:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                self.last_used[slot] = time.monotonic()
+                self.recent_hits[key] = slot
+                self.recent_hits.move_to_end(key)
+                while len(self.recent_hits) > self.max_entries:
+                    self.recent_hits.popitem(last=False)
+                return self.responses[slot], similarity
+            finally:
+                self.lookup_seconds += time.perf_counter() - start
+    
+    def put(self, vector: Sequence[float], scope: int, response: str):
+        with self.lock:
+            if self.dim != len(vector):
+                # First insert, or the embedding model changed size
+                self._allocate(len(vector))
+            now = time.monotonic()
+            if self.free:
+                slot = self.free.pop()
+            else:
+                # Full: reuse an expired slot if any, else the least recently used
+                n = self.high_water
+                slot = int(np.argmin(np.where(self.expires_at[:n] <= now, -np.inf, self.last_used[:n])))
+                self.evictions += 1
+            self.vectors[slot] = self._normalize(vector)
+            self.scopes[slot] = scope
+            self.expires_at[slot] = now + self.ttl_seconds
+            self.last_used[slot] = now
+            self.responses[slot] = response
+            self.high_water = max(self.high_water, slot + 1)
+    
+    def record_override(self, key: str) -> bool:
+        """Count a no-cache retry of a prompt that was answered by a near-duplicate"""
+        with self.lock:
+            if self.recent_hits.pop(key, None) is None:
+                return False
+            self.false_hit_overrides += 1
+            return True
+    
+    def clear(self):
+        with self.lock:
+            self.dim = None
+            self.vectors = self.scopes = self.expires_at = self.last_used = None
+            self.responses = []
+            self.free = []
+            self.high_water = 0
+            self.recent_hits.clear()
+    
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            n = self.high_water
+            # Expired slots stay in the matrix until reused; only count live ones
+            entries = int(np.count_nonzero(self.expires_at[:n] > time.monotonic())) if n else 0
+            return {
+                "entries": entries,
+                "high_water": n,
+                "max_entries": self.max_entries,
+                "dimensions": self.dim,
+                "matrix_bytes": self.vectors.nbytes if self.vectors is not None else 0,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "false_hit_overrides": self.false_hit_overrides,
+                "evictions": self.evictions,
+                "avg_search_ms": round(self.lookup_seconds / lookups * 1000, 3) if lookups else 0,
+            }
+
+
+def _create_semantic_cache() -> SemanticCache:
+    return SemanticCache(
+        max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+        threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds=settings.SEMANTIC_CACHE_TTL,
+    )
+
+semantic_cache = shared("semantic_cache", _create_semantic_cache)
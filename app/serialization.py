@@ -0,0 +1,17 @@
+from typing import Any
+import orjson
+from starlette.responses import JSONResponse
+from app.timing import timed
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by orjson.
+    
+    Hot routes return this directly instead of a pydantic model: FastAPI then
+    skips re-validating the response model and its generic encoder, while the
+    route's ``response_model`` still documents the schema.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        with timed("serialize"):
+            return orjson.dumps(content)
@@ -0,0 +1,197 @@
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.state_backend import shared
+
+# Rough per-session bookkeeping overhead (id, object, OrderedDict node)
+SESSION_OVERHEAD_BYTES = 300
+
+
+class Session:
+    __slots__ = ("user_id", "model", "backend", "context", "full", "turns", "created_at", "last_used")
+    
+    def __init__(self, user_id: str, model: str):
+        self.user_id = user_id
+        self.model = model
+        self.backend: Optional[str] = None
+        # Token ids fit in 32 bits; an array is ~9x smaller than a list of ints
+        self.context = array("I")
+        # Set once the context outgrows the store's limit; the session takes no more turns
+        self.full = False
+        self.turns = 0
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+    
+    @property
+    def size(self) -> int:
+        return len(self.context) * self.context.itemsize + SESSION_OVERHEAD_BYTES
+    
+    def info(self, session_id: str) -> dict:
+        return {
+            "session_id": session_id,
+            "model": self.model,
+            "backend": self.backend,
+            "turns": self.turns,
+            "context_tokens": len(self.context),
+            "context_full": self.full,
+            "bytes": self.size,
+            "created_at": self.created_at,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+        }
+
+
+# Conversation contexts, bounded by session count and total bytes, expiring when idle
+class SessionStore:
+    """Keep each conversation's Ollama ``context`` so follow-up turns send only the new message.
+    
+    Ollama returns the conversation so far as a token array; passing it back
+    with the next prompt skips re-tokenizing the history, and a backend that
+    still holds the conversation in its KV cache skips evaluating it. Sessions
+    are kept in LRU order, so the idle ones are evicted first.
+    
+    A context longer than ``max_context_tokens`` is not kept: it starts with
+    the prompt template, so cutting it down would corrupt the conversation.
+    The session is marked full instead and the client has to start a new one.
+    """
+    
+    def __init__(self, max_sessions: int = 10000, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 1800, max_context_tokens: int = 8192):
+        # session id -> Session; most recently used last
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_context_tokens = max_context_tokens
+        self.current_bytes = 0
+        self.created = 0
+        self.turns = 0
+        self.continued_turns = 0
+        self.reused_tokens = 0
+        self.evaluated_tokens = 0
+        self.full_sessions = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def new_id() -> str:
+        return secrets.token_urlsafe(16)
+    
+    def _expire(self):
+        # LRU order is idle order, so expired sessions sit at the front
+        deadline = time.monotonic() - self.ttl_seconds
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_used > deadline:
+                break
+            self._remove(session_id)
+            self.expirations += 1
+    
+    def _remove(self, session_id: str) -> Session:
+        session = self.sessions.pop(session_id)
+        self.current_bytes -= session.size
+        return session
+    
+    def _owned(self, session_id: str, user_id: str) -> Optional[Session]:
+        self._expire()
+        session = self.sessions.get(session_id)
+        if session is None or session.user_id != user_id:
+            return None
+        return session
+    
+    def get(self, session_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """The session's model, preferred backend and context, or None if unknown to this user"""
+        with self.lock:
+            session = self._owned(session_id, user_id)
+            if session is None:
+                return None
+            return {"model": session.model, "backend": session.backend, "context": session.context.tolist(), "full": session.full}
+    
+    def save(self, session_id: str, user_id: str, model: str, context: List[int], backend: Optional[str], reused_tokens: int, evaluated_tokens: int) -> Tuple[int, bool]:
+        """Store the context returned by a turn; returns the session's turn count and whether it is now full"""
+        full = len(context) > self.max_context_tokens
+        if full:
+            context = []
+        with self.lock:
+            self.full_sessions += full
+            self._expire()
+            session = self.sessions.get(session_id)
+            if session is None or session.user_id != user_id:
+                session = Session(user_id, model)
+                self.created += 1
+            else:
+                self._remove(session_id)
+            session.model = model
+            session.backend = backend
+            session.context = array("I", context)
+            session.full = full
+            session.turns += 1
+            session.last_used = time.monotonic()
+            self.sessions[session_id] = session
+            self.current_bytes += session.size
+            
+            self.turns += 1
+            if reused_tokens:
+                self.continued_turns += 1
+                self.reused_tokens += reused_tokens
+            self.evaluated_tokens += evaluated_tokens
+            
+            while len(self.sessions) > self.max_sessions or self.current_bytes > self.max_bytes:
+                oldest = next(iter(self.sessions))
+                self._remove(oldest)
+                self.evictions += 1
+            return session.turns, session.full
+    
+    def info(self, session_id: str, user_id: str) -> Optional[dict]:
+        with self.lock:
+            session = self._owned(session_id, user_id)
+            return session.info(session_id) if session is not None else None
+    
+    def delete(self, session_id: str, user_id: str) -> bool:
+        with self.lock:
+            if self._owned(session_id, user_id) is None:
+                return False
+            self._remove(session_id)
+            return True
+    
+    def clear(self):
+        with self.lock:
+            self.sessions.clear()
+            self.current_bytes = 0
+    
+    def stats(self) -> dict:
+        with self.lock:
+            self._expire()
+            sizes = [session.size for session in self.sessions.values()]
+            return {
+                "sessions": len(self.sessions),
+                "bytes": self.current_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "avg_session_bytes": round(self.current_bytes / len(sizes)) if sizes else 0,
+                "max_session_bytes": max(sizes, default=0),
+                "context_tokens": sum(len(session.context) for session in self.sessions.values()),
+                "created": self.created,
+                "turns": self.turns,
+                "continued_turns": self.continued_turns,
+                "prefix_reuse_rate": round(self.continued_turns / self.turns, 4) if self.turns else 0,
+                "reused_context_tokens": self.reused_tokens,
+                "evaluated_prompt_tokens": self.evaluated_tokens,
+                "full_sessions": self.full_sessions,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def _create_session_store() -> SessionStore:
+    return SessionStore(
+        max_sessions=settings.SESSION_MAX_SESSIONS,
+        max_bytes=settings.SESSION_MAX_BYTES,
+        ttl_seconds=settings.SESSION_TTL,
+        max_context_tokens=settings.SESSION_MAX_CONTEXT_TOKENS,
+    )
+
+session_store = shared("session_store", _create_session_store)
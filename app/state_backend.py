@@ -0,0 +1,176 @@
+"""Pluggable state backend for the stateful singletons.
+
+``rate_limiter``, ``metrics_tracker`` and ``prompt_cache`` are created through
+:func:`shared`. With ``STATE_BACKEND=memory`` (the default) each process gets
+its own instance. With ``STATE_BACKEND=shared`` every uvicorn worker talks to a
+single instance of each component hosted by a state server on a local socket,
+so quotas, cache and counters are global to the host.
+
+A call to the state server is a blocking IPC round trip, so it must not run on
+the event loop: request paths await :func:`offload`, which runs remote calls
+on a worker thread, and proxies send calls whose result nobody needs (usage
+settlement, cache writes) from a background thread with ``_post``.
+
+The state server is either started explicitly (``python -m app.state_backend``)
+or, if none is reachable, hosted on a background thread by the first worker
+that manages to bind ``STATE_BACKEND_ADDRESS``. No outside service is needed.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.managers import BaseManager
+from typing import Any, Callable, Dict, Optional, Tuple, Type, Union
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+_factories: Dict[str, Callable[[], Any]] = {}
+_hosted: Dict[str, Any] = {}
+_hosted_lock = threading.Lock()
+_server_lock = threading.Lock()
+_serving = False
+
+
+class _StateManager(BaseManager):
+    pass
+
+
+def _hosted_instance(name: str) -> Any:
+    """Server side: every client shares the same instance of a component"""
+    with _hosted_lock:
+        if name not in _hosted:
+            _hosted[name] = _factories[name]()
+        return _hosted[name]
+
+
+def _address() -> Union[str, Tuple[str, int]]:
+    address = settings.STATE_BACKEND_ADDRESS
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return address  # Unix domain socket path
+
+
+def _authkey() -> bytes:
+    return hashlib.sha256(f"state-backend:{settings.JWT_SECRET_KEY}".encode()).digest()
+
+
+def _start_server_thread() -> bool:
+    """Try to host the state server in this process; False if another process won"""
+    global _serving
+    with _server_lock:
+        if _serving:
+            return True
+        try:
+            server = _StateManager(address=_address(), authkey=_authkey()).get_server()
+        except OSError:
+            return False
+        threading.Thread(target=server.serve_forever, name="state-backend", daemon=True).start()
+        _serving = True
+    logger.info(f"Hosting shared state backend on {settings.STATE_BACKEND_ADDRESS}")
+    return True
+
+
+class SharedProxy:
+    """Client-side handle for a component hosted by the state server.
+    
+    Attribute access becomes a remote method call. Subclasses may define
+    methods that must run locally (e.g. ones raising HTTP errors, which do
+    not survive pickling). The connection is made lazily on first use and
+    re-established once if the hosting process has gone away.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._remote = None
+        self._connect_lock = threading.Lock()
+        self._poster: Optional[ThreadPoolExecutor] = None
+    
+    def _connect(self):
+        with self._connect_lock:
+            if self._remote is not None:
+                return self._remote
+            deadline = time.monotonic() + settings.STATE_BACKEND_CONNECT_TIMEOUT
+            while True:
+                manager = _StateManager(address=_address(), authkey=_authkey())
+                try:
+                    manager.connect()
+                    self._remote = getattr(manager, self._name)()
+                    return self._remote
+                except (ConnectionError, FileNotFoundError, EOFError):
+                    if _start_server_thread():
+                        continue
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.05)
+    
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        for attempt in range(2):
+            remote = self._remote or self._connect()
+            try:
+                return getattr(remote, method)(*args, **kwargs)
+            except (ConnectionError, EOFError):
+                self._remote = None
+                if attempt:
+                    raise
+    
+    def _post(self, method: str, *args, **kwargs):
+        """Send a call whose result is not needed from a background thread, in order"""
+        if self._poster is None:
+            with self._connect_lock:
+                if self._poster is None:
+                    self._poster = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"state-{self._name}")
+        self._poster.submit(self._post_call, method, *args, **kwargs)
+    
+    def _post_call(self, method: str, *args, **kwargs):
+        try:
+            self._call(method, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"Shared state call {self._name}.{method} failed: {str(e)}")
+    
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return functools.partial(self._call, name)
+
+
+async def offload(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Call a component method, on a worker thread if it is a round trip to the state server"""
+    owner = getattr(func, "__self__", None) or getattr(getattr(func, "func", None), "__self__", None)
+    if isinstance(owner, SharedProxy):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+def shared(name: str, factory: Callable[[], Any], proxytype: Type[SharedProxy] = SharedProxy) -> Any:
+    """Return the instance of a stateful component for the configured backend"""
+    _factories[name] = factory
+    _StateManager.register(name, callable=functools.partial(_hosted_instance, name))
+    if settings.STATE_BACKEND == "memory" or _serving:
+        return factory()
+    if settings.STATE_BACKEND == "shared":
+        return proxytype(name)
+    raise ValueError(f"Unknown STATE_BACKEND: {settings.STATE_BACKEND}")
+
+
+def serve_forever():
+    """Run a standalone state server in the foreground"""
+    global _serving
+    _serving = True
+    # Importing the component modules registers their factories
+    import app.disk_cache, app.metrics, app.prompt_cache, app.rate_limiter, app.semantic_cache, app.sessions, app.token_budget  # noqa: F401
+    server = _StateManager(address=_address(), authkey=_authkey()).get_server()
+    logger.info(f"Shared state backend listening on {settings.STATE_BACKEND_ADDRESS}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    # Use the importable module so component imports see the serving flag
+    from app import state_backend
+    logging.basicConfig(level=logging.INFO)
+    state_backend.serve_forever()
@@ -1,19 +1,181 @@
-import asyncio
+import orjson
+import logging
+import math
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
 from fastapi import APIRouter, Request, HTTPException, status, Depends
 from fastapi.responses import StreamingResponse
 from app.auth import get_current_user
-from app.llm_service import ollama_service
+from app.coalescer import request_coalescer
+from app.config import settings
+from app.llm_service import BackendUnavailableError, UnknownModelError, ollama_service
+from app.metrics import metrics_tracker
 from app.models import InferenceRequest, User
+from app.prompt_cache import prompt_cache
+from app.rate_limiter import rate_limiter
+from app.scheduler import QueueFullError, inference_scheduler, priority_for, scheduled_stream
+from app.state_backend import offload
+from app.timing import stage_timings, timed
+from app.token_budget import HEADER_PREFIX as TOKEN_HEADER_PREFIX, apply_max_tokens, estimate_tokens, settle_tokens, token_budget
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def stream_tokens(
+    prompt: str,
+    user_id: str,
+    options: Optional[Dict[str, Any]] = None,
+    priority: int = 0,
+    model: Optional[str] = None,
+    tier: Optional[str] = None,
+    reserved_tokens: int = 0,
+) -> AsyncIterator[str]:
+    """Yield Ollama's response chunks as they arrive; upstream errors propagate.
+    
+    If the consumer stops early, closing this generator closes the chunk
+    iterator and releases the upstream response, so Ollama stops generating
+    once no other coalesced subscriber is reading it.
+    
+    The ``reserved_tokens`` reservation is settled against Ollama's final
+    counts; a stream cut short is charged one token per chunk received, and
+    a coalesced follower, which shares another request's generation, is
+    refunded.
+    """
+    start = time.perf_counter()
+    last_token_at: Optional[float] = None
+    ttft_ms: Optional[float] = None
+    inter_token_ms: List[float] = []
+    response_length = 0
+    chunk_count = 0
+    success = False
+    disconnected = True
+    usage: Dict[str, int] = {}
+    coalesced = False
+    
+    model = model or ollama_service.model
+    if settings.COALESCE_REQUESTS:
+        key = prompt_cache.make_key(model, prompt, options, ollama_service.model_version(model))
+        chunks, coalesced = request_coalescer.stream(key, lambda: scheduled_stream(user_id, priority, prompt, options, model, usage))
+    else:
+        chunks = scheduled_stream(user_id, priority, prompt, options, model, usage)
+    
+    try:
+        async for chunk in chunks:
+            chunk_count += 1
+            now = time.perf_counter()
+            if last_token_at is None:
+                ttft_ms = (now - start) * 1000
+            else:
+                inter_token_ms.append((now - last_token_at) * 1000)
+            last_token_at = now
+            response_length += len(chunk)
+            yield chunk
+        success = True
+        disconnected = False
+    except Exception as e:
+        disconnected = False
+        logger.error(f"Streaming inference failed: {str(e)}", extra={"user_id": user_id, "status": "error"})
+        raise
+    finally:
+        await chunks.aclose()
+        latency_ms = (time.perf_counter() - start) * 1000
+        metrics_tracker.record_request(latency_ms, success=success)
+        metrics_tracker.record_stream(ttft_ms, inter_token_ms, disconnected=disconnected)
+        if coalesced:
+            # Followers share the leader's generation; only the leader is charged
+            settle_tokens(user_id, tier, model, reserved_tokens)
+        else:
+            settle_tokens(
+                user_id, tier, model, reserved_tokens,
+                usage.get("prompt_tokens", 0), usage.get("completion_tokens", chunk_count if not usage else 0),
+            )
+        logger.info(
+            "Streaming inference finished",
+            extra={
+                "user_id": user_id,
+                "model": model,
+                "prompt_length": len(prompt),
+                "response_length": response_length,
+                "latency_ms": round(latency_ms, 2),
+                "status": "success" if success else ("disconnected" if disconnected else "error"),
+                "timings": stage_timings(),
+            },
+        )
+
+
+async def stream_generator(
+    prompt: str,
+    user_id: str,
+    sse: bool = False,
+    options: Optional[Dict[str, Any]] = None,
+    priority: int = 0,
+    model: Optional[str] = None,
+    tier: Optional[str] = None,
+    reserved_tokens: int = 0,
+) -> AsyncIterator[str]:
+    """Format ``stream_tokens`` as chunked text or SSE events.
+    
+    If the client disconnects, Starlette cancels this generator, which closes
+    the token stream and with it the upstream generation.
+    """
+    tokens = stream_tokens(prompt, user_id, options, priority, model, tier, reserved_tokens)
+    response_length = 0
+    try:
+        async for chunk in tokens:
+            response_length += len(chunk)
+            yield _format_sse("token", {"token": chunk}) if sse else chunk
+        if sse:
+            yield _format_sse("done", {"response_length": response_length})
+    except Exception as e:
+        yield _format_sse("error", {"detail": str(e)}) if sse else f"\n[error] {str(e)}"
+    finally:
+        await tokens.aclose()
 
-async def stream_generator(prompt: str):
-    # Simulated token streaming (replace with proper Ollama streaming if available)
-    response = ollama_service.generate(prompt)
-    for token in response.split():
-        yield token + " "
-        await asyncio.sleep(0.1)
 
 @router.post("/v1/infer/stream")
-async def infer_stream(request: InferenceRequest, current_user: User = Depends(get_current_user)):
-    return StreamingResponse(stream_generator(request.prompt), media_type="text/plain")
+async def infer_stream(request: InferenceRequest, http_request: Request, current_user: User = Depends(get_current_user)):
+    """Stream tokens as chunked text, or as SSE when the client accepts text/event-stream"""
+    try:
+        model = ollama_service.resolve_model(request.model)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    with timed("rate_limit"):
+        rate_limit = await offload(rate_limiter.check_rate_limit, current_user.username, current_user.tier)
+        headers = rate_limit.headers()
+        options = apply_max_tokens(request.options, request.max_tokens)
+        estimate = estimate_tokens(request.prompt, options)
+        token_limit = await offload(token_budget.check_budget, current_user.username, current_user.tier, estimate)
+        if token_limit is not None:
+            headers.update(token_limit.headers(TOKEN_HEADER_PREFIX))
+    try:
+        ollama_service.check_available(model)
+        inference_scheduler.check_admission(model)
+    except (QueueFullError, BackendUnavailableError) as e:
+        settle_tokens(current_user.username, current_user.tier, model, estimate)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+    
+    http_request.state.model = model
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
+    return StreamingResponse(
+        stream_generator(
+            request.prompt,
+            current_user.username,
+            sse=sse,
+            options=options,
+            priority=priority_for(current_user.tier),
+            model=model,
+            tier=current_user.tier,
+            reserved_tokens=estimate,
+        ),
+        media_type="text/event-stream" if sse else "text/plain",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **headers},
+    )
@@ -0,0 +1,103 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+
+class RequestTiming:
+    """Seconds spent per stage while serving one request.
+    
+    Stages recorded more than once (e.g. an upstream call retried on another
+    backend) accumulate.
+    """
+    
+    __slots__ = ("start", "stages")
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+    
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+    
+    def milliseconds(self) -> Dict[str, float]:
+        return {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+    
+    def header(self) -> str:
+        """Server-Timing value: each stage, then the total so far"""
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# Set by the timing middleware; tasks spawned while serving a request inherit it
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def begin_request() -> Any:
+    """Start timing the current request; returns a token for ``end_request``"""
+    return _current.set(RequestTiming())
+
+
+def end_request(token: Any):
+    _current.reset(token)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+def record_stage(stage: str, seconds: float):
+    """Add ``seconds`` to ``stage`` of the request being served, if any"""
+    timing = _current.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time the block as ``stage`` of the request being served"""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(stage, time.perf_counter() - start)
+
+
+def stage_timings() -> Optional[Dict[str, float]]:
+    """Milliseconds per stage so far, for structured log fields"""
+    timing = _current.get()
+    return timing.milliseconds() if timing is not None else None
+
+
+class UpstreamTrace:
+    """httpx trace hook splitting an upstream call into connect and upstream.
+    
+    ``connect`` lasts until the request headers start going out, i.e. pool
+    wait plus any new TCP connection; ``upstream`` is the rest, Ollama itself.
+    """
+    
+    __slots__ = ("timing", "start", "sent")
+    
+    def __init__(self, timing: RequestTiming):
+        self.timing = timing
+        self.start = time.perf_counter()
+        self.sent: Optional[float] = None
+    
+    async def __call__(self, event: str, info: Dict[str, Any]):
+        if self.sent is None and event.endswith("send_request_headers.started"):
+            self.sent = time.perf_counter()
+            self.timing.add("connect", self.sent - self.start)
+    
+    def finish(self):
+        self.timing.add("upstream", time.perf_counter() - (self.sent or self.start))
+
+
+def upstream_trace() -> Optional[UpstreamTrace]:
+    """Trace hook for an upstream call made while serving a timed request"""
+    timing = _current.get()
+    return UpstreamTrace(timing) if timing is not None else None
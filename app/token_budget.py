@@ -0,0 +1,159 @@
+import math
+import time
+from typing import Any, Dict, Optional, Tuple
+from app.config import settings
+from app.prometheus_metrics import TIER_TOKENS_TOTAL
+from app.rate_limiter import RateLimiter, RateLimitResult, _enforce
+from app.state_backend import SharedProxy, shared
+
+HEADER_PREFIX = "X-TokenLimit"
+
+# Time constant of the tokens/s averages, in seconds
+USAGE_RATE_TAU = 60.0
+
+
+def estimate_tokens(prompt: str, options: Optional[Dict[str, Any]] = None) -> int:
+    """Pre-admission cost estimate: prompt tokens from its length, plus the completion cap"""
+    prompt_tokens = math.ceil(len(prompt) / settings.TOKEN_ESTIMATE_CHARS_PER_TOKEN)
+    num_predict = (options or {}).get("num_predict")
+    completion_tokens = num_predict if isinstance(num_predict, int) and num_predict > 0 else settings.TOKEN_ESTIMATE_COMPLETION
+    return prompt_tokens + completion_tokens
+
+
+def apply_max_tokens(options: Optional[Dict[str, Any]], max_tokens: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Fold a request's ``max_tokens`` into Ollama's ``num_predict``, keeping the lower cap"""
+    if max_tokens is None:
+        return options
+    options = dict(options or {})
+    num_predict = options.get("num_predict")
+    if not isinstance(num_predict, int) or num_predict <= 0 or num_predict > max_tokens:
+        options["num_predict"] = max_tokens
+    return options
+
+
+class _Usage:
+    __slots__ = ("tokens", "rate", "updated")
+    
+    def __init__(self, now: float):
+        self.tokens = 0
+        self.rate = 0.0
+        self.updated = now
+    
+    def decayed_rate(self, now: float) -> float:
+        return self.rate * math.exp(-(now - self.updated) / USAGE_RATE_TAU)
+
+
+def _check(result: Optional[RateLimitResult]) -> Optional[RateLimitResult]:
+    return _enforce(result, unit="tokens", prefix=HEADER_PREFIX) if result is not None else None
+
+
+class TokenBudget(RateLimiter):
+    """Per-user token bucket over Ollama prompt + completion tokens.
+    
+    Admission reserves an estimate (``estimate_tokens``); once Ollama reports
+    ``prompt_eval_count`` and ``eval_count`` the reservation is settled
+    against the real count. Cache hits and coalesced followers cost nothing
+    upstream and are refunded in full; a generation that ran over its
+    estimate leaves the bucket in debt, delaying the user's next request.
+    Also tracks tokens/s per (user, model) as an exponentially decaying average.
+    """
+    
+    def __init__(self):
+        super().__init__(settings.TOKEN_BUDGET_PER_WINDOW, settings.TOKEN_BUDGET_WINDOW)
+        self.default_limit = settings.TOKEN_BUDGET_PER_WINDOW
+        self.usage: Dict[Tuple[str, str], _Usage] = {}
+    
+    def limit_for(self, user_id: str, tier: Optional[str] = None) -> int:
+        """Tokens per window for a user: user override, then tier, then default; 0 is unlimited"""
+        if user_id in settings.TOKEN_BUDGET_USER_OVERRIDES:
+            return settings.TOKEN_BUDGET_USER_OVERRIDES[user_id]
+        if tier is not None and tier in settings.TOKEN_BUDGET_TIERS:
+            return settings.TOKEN_BUDGET_TIERS[tier]
+        return self.default_limit
+    
+    def reserve(self, user_id: str, tier: Optional[str], estimate: int) -> Optional[RateLimitResult]:
+        """Reserve ``estimate`` tokens; None when the user has no token budget"""
+        limit = self.limit_for(user_id, tier)
+        if limit <= 0:
+            return None
+        # A request estimated above the whole budget still runs from a full bucket
+        return self.acquire(user_id, tier, min(estimate, limit))
+    
+    def check_budget(self, user_id: str, tier: Optional[str], estimate: int) -> Optional[RateLimitResult]:
+        """Reserve ``estimate`` tokens or raise HTTP 429"""
+        return _check(self.reserve(user_id, tier, estimate))
+    
+    def settle(self, user_id: str, tier: Optional[str], model: str, reserved: int, used: int):
+        """Replace a reservation with the tokens actually used and record them"""
+        now = time.monotonic()
+        limit = self.limit_for(user_id, tier)
+        reserved = min(reserved, limit)
+        with self.lock:
+            if limit > 0 and reserved != used:
+                bucket = self._bucket(user_id, limit, now)
+                bucket.tokens = min(limit, bucket.tokens + reserved - used)
+            if used:
+                usage = self.usage.get((user_id, model))
+                if usage is None:
+                    usage = self.usage[(user_id, model)] = _Usage(now)
+                usage.rate = usage.decayed_rate(now) + used / USAGE_RATE_TAU
+                usage.updated = now
+                usage.tokens += used
+    
+    def evict_idle(self) -> int:
+        evicted = super().evict_idle()
+        cutoff = time.monotonic() - max(self.window, USAGE_RATE_TAU * 10)
+        with self.lock:
+            for key in [key for key, usage in self.usage.items() if usage.updated <= cutoff]:
+                del self.usage[key]
+        return evicted
+    
+    def stats(self, top: int = 20) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            rates = sorted(
+                ((user_id, model, usage.tokens, usage.decayed_rate(now)) for (user_id, model), usage in self.usage.items()),
+                key=lambda row: row[3],
+                reverse=True,
+            )
+            return {
+                "tracked_users": len(self.buckets),
+                "default_budget": self.default_limit,
+                "window": self.window,
+                "tokens_per_second": round(sum(row[3] for row in rates), 2),
+                "top_usage": [
+                    {"user_id": user_id, "model": model, "tokens": tokens, "tokens_per_second": round(rate, 2)}
+                    for user_id, model, tokens, rate in rates[:top]
+                ],
+            }
+
+
+class TokenBudgetProxy(SharedProxy):
+    """Shared-backend handle; the 429 is raised locally since it cannot be pickled.
+    
+    Settlement is posted from a background thread.
+    """
+    
+    def check_budget(self, user_id: str, tier: Optional[str], estimate: int) -> Optional[RateLimitResult]:
+        return _check(self.reserve(user_id, tier, estimate))
+    
+    def settle(self, user_id: str, tier: Optional[str], model: str, reserved: int, used: int):
+        # Runs in finally blocks on the event loop; nothing waits for the result
+        self._post("settle", user_id, tier, model, reserved, used)
+
+
+token_budget = shared("token_budget", TokenBudget, TokenBudgetProxy)
+
+
+def settle_tokens(user_id: str, tier: Optional[str], model: str, reserved: int, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Settle a reservation and export the usage; call once per admitted request.
+    
+    Prometheus gets the usage per tier, not per user, to keep its series
+    bounded; per-user figures are in ``token_budget.stats()``.
+    """
+    tier_label = tier or "default"
+    if prompt_tokens:
+        TIER_TOKENS_TOTAL.labels(tier=tier_label, model=model, kind="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        TIER_TOKENS_TOTAL.labels(tier=tier_label, model=model, kind="completion").inc(completion_tokens)
+    token_budget.settle(user_id, tier, model, reserved, prompt_tokens + completion_tokens)
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+import orjson
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from jose import JWTError, jwt
+from pydantic import ValidationError
+from app.auth import user_from_token
+from app.config import settings
+from app.inference import run_inference
+from app.llm_service import BackendUnavailableError, UnknownModelError, ollama_service
+from app.models import InferenceRequest, User
+from app.prometheus_metrics import WS_CONNECTIONS, WS_MESSAGES
+from app.rate_limiter import rate_limiter
+from app.scheduler import QueueFullError, inference_scheduler, priority_for
+from app.state_backend import offload
+from app.streaming import stream_tokens
+from app.token_budget import apply_max_tokens, estimate_tokens, settle_tokens, token_budget
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+MAX_ID_LENGTH = 64
+
+
+class _Rejected(Exception):
+    """A prompt turned away before it ran, reported to the client as an error message"""
+    
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _error(request_id: Any, status_code: int, detail: str, retry_after: Optional[float] = None) -> dict:
+    message = {"id": request_id, "type": "error", "status": status_code, "detail": detail}
+    if retry_after is not None:
+        message["retry_after"] = round(retry_after, 2)
+    return message
+
+
+class InferenceConnection:
+    """One authenticated WebSocket carrying many concurrent prompts.
+    
+    Each prompt runs as its own task, tagged with the client's ``id``, and its
+    messages are interleaved with those of the other prompts. Every outgoing
+    message goes through one bounded queue drained by a single writer. A client
+    that reads slowly therefore fills the queue and stalls the token streams
+    feeding it, instead of the server buffering without limit. At most
+    ``WS_MAX_IN_FLIGHT`` prompts run at once; further prompts are rejected.
+    """
+    
+    def __init__(self, websocket: WebSocket, user: User, expires_at: Optional[float]):
+        self.websocket = websocket
+        self.user = user
+        self.expires_at = expires_at
+        self.outgoing: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.tasks: Dict[Any, asyncio.Task] = {}
+    
+    async def send(self, message: dict):
+        await self.outgoing.put(message)
+    
+    async def _write(self):
+        while True:
+            message = await self.outgoing.get()
+            await self.websocket.send_text(orjson.dumps(message).decode())
+    
+    async def serve(self):
+        """Read prompts until the client disconnects, then cancel whatever is still running"""
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if self.expires_at is not None and time.time() >= self.expires_at:
+                    await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token expired")
+                    return
+                raw = message.get("text")
+                await self.dispatch(raw if raw is not None else message.get("bytes") or b"")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Cancelling closes the token streams, so Ollama stops generating
+            for task in self.tasks.values():
+                task.cancel()
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+    
+    async def dispatch(self, raw: Any):
+        if isinstance(raw, str):
+            raw = raw.encode()
+        if len(raw) > settings.WS_MAX_MESSAGE_BYTES:
+            await self.send(_error(None, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, f"Message exceeds {settings.WS_MAX_MESSAGE_BYTES} bytes"))
+            return
+        try:
+            message = orjson.loads(raw)
+        except orjson.JSONDecodeError as e:
+            await self.send(_error(None, status.HTTP_400_BAD_REQUEST, f"Invalid JSON: {str(e)}"))
+            return
+        if not isinstance(message, dict):
+            await self.send(_error(None, status.HTTP_400_BAD_REQUEST, "Expected a JSON object"))
+            return
+        
+        request_id = message.get("id")
+        if not isinstance(request_id, (str, int)) or isinstance(request_id, bool) or len(str(request_id)) > MAX_ID_LENGTH:
+            await self.send(_error(None, status.HTTP_400_BAD_REQUEST, f"Every message needs an 'id': a string or integer of up to {MAX_ID_LENGTH} characters"))
+            return
+        kind = message.get("type", "infer")
+        if kind == "cancel":
+            task = self.tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+            return
+        if kind != "infer":
+            await self.send(_error(request_id, status.HTTP_400_BAD_REQUEST, f"Unknown message type {kind!r}"))
+            return
+        
+        if request_id in self.tasks:
+            WS_MESSAGES.labels(outcome="rejected").inc()
+            await self.send(_error(request_id, status.HTTP_409_CONFLICT, "A prompt with this id is already in flight"))
+            return
+        if len(self.tasks) >= settings.WS_MAX_IN_FLIGHT:
+            WS_MESSAGES.labels(outcome="rejected").inc()
+            await self.send(_error(
+                request_id, status.HTTP_429_TOO_MANY_REQUESTS,
+                f"Too many prompts in flight on this connection (max {settings.WS_MAX_IN_FLIGHT})",
+            ))
+            return
+        try:
+            request = InferenceRequest(
+                prompt=message.get("prompt"),
+                options=message.get("options"),
+                model=message.get("model"),
+                max_tokens=message.get("max_tokens"),
+            )
+        except ValidationError as e:
+            WS_MESSAGES.labels(outcome="rejected").inc()
+            await self.send(_error(request_id, status.HTTP_400_BAD_REQUEST, f"Invalid message: {e.errors()[0]['msg']}"))
+            return
+        
+        task = asyncio.create_task(self.run(request_id, request, message.get("stream", True) is not False))
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(request_id, None))
+    
+    async def run(self, request_id: Any, request: InferenceRequest, stream: bool):
+        outcome = "error"
+        try:
+            await self._infer(request_id, request, stream)
+            outcome = "success"
+        except _Rejected as e:
+            outcome = "rejected"
+            await self.send(_error(request_id, e.status_code, str(e), e.retry_after))
+        except (QueueFullError, BackendUnavailableError) as e:
+            outcome = "rejected"
+            await self.send(_error(request_id, status.HTTP_503_SERVICE_UNAVAILABLE, str(e), e.retry_after))
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            # Without waiting: while the connection closes nobody drains the queue
+            if not self.outgoing.full():
+                self.outgoing.put_nowait({"id": request_id, "type": "cancelled"})
+            raise
+        except Exception as e:
+            await self.send(_error(request_id, status.HTTP_500_INTERNAL_SERVER_ERROR, f"Inference failed: {str(e)}"))
+        finally:
+            WS_MESSAGES.labels(outcome=outcome).inc()
+    
+    async def _infer(self, request_id: Any, request: InferenceRequest, stream: bool):
+        """Admit one prompt like /v1/infer does, then answer it in one message or as a token stream"""
+        user = self.user
+        try:
+            model = ollama_service.resolve_model(request.model)
+        except UnknownModelError as e:
+            raise _Rejected(status.HTTP_400_BAD_REQUEST, str(e))
+        rate_limit = await offload(rate_limiter.acquire, user.username, user.tier)
+        if not rate_limit.allowed:
+            raise _Rejected(status.HTTP_429_TOO_MANY_REQUESTS, "Rate limit exceeded", rate_limit.retry_after)
+        options = apply_max_tokens(request.options, request.max_tokens)
+        estimate = estimate_tokens(request.prompt, options)
+        token_limit = await offload(token_budget.reserve, user.username, user.tier, estimate)
+        if token_limit is not None and not token_limit.allowed:
+            raise _Rejected(status.HTTP_429_TOO_MANY_REQUESTS, "Token budget exceeded", token_limit.retry_after)
+        
+        if not stream:
+            # Same cache tiers and coalescing as /v1/infer
+            result = await run_inference(request.prompt, options, user, model=model, reserved_tokens=estimate)
+            await self.send({
+                "id": request_id,
+                "type": "done",
+                "response": result.response,
+                "cache": result.cache_status,
+                "latency_ms": round(result.latency_ms, 2),
+            })
+            return
+        
+        try:
+            ollama_service.check_available(model)
+            inference_scheduler.check_admission(model)
+        except (QueueFullError, BackendUnavailableError):
+            settle_tokens(user.username, user.tier, model, estimate)
+            raise
+        tokens = stream_tokens(request.prompt, user.username, options, priority_for(user.tier), model, user.tier, estimate)
+        try:
+            async for chunk in tokens:
+                await self.send({"id": request_id, "type": "token", "token": chunk})
+        finally:
+            await tokens.aclose()
+        await self.send({"id": request_id, "type": "done"})
+
+
+async def _receive_auth_token(websocket: WebSocket) -> str:
+    """Wait for the ``{"type": "auth", "token": ...}`` message that opens a connection"""
+    frame = await asyncio.wait_for(websocket.receive(), timeout=settings.WS_AUTH_TIMEOUT)
+    if frame["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(frame.get("code", status.WS_1000_NORMAL_CLOSURE))
+    raw = frame.get("text")
+    message = orjson.loads(raw if raw is not None else frame.get("bytes") or b"")
+    if not isinstance(message, dict) or message.get("type") != "auth" or not isinstance(message.get("token"), str):
+        raise ValueError("Expected an auth message")
+    return message["token"]
+
+
+@router.websocket("/v1/ws")
+async def inference_socket(websocket: WebSocket):
+    """Run many prompts over one connection, authenticated once.
+    
+    Authenticate with an ``Authorization: Bearer`` header on the handshake, or,
+    where headers cannot be set (browsers), with ``{"type": "auth", "token": ...}``
+    as the first message. Then send ``{"id", "prompt", "options", "model",
+    "max_tokens", "stream"}`` messages; replies carry the same ``id``.
+    """
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    try:
+        if token and scheme.lower() == "bearer":
+            user = user_from_token(token)
+            await websocket.accept()
+        else:
+            await websocket.accept()
+            token = await _receive_auth_token(websocket)
+            user = user_from_token(token)
+        expires_at = jwt.get_unverified_claims(token).get("exp")
+    except WebSocketDisconnect:
+        return
+    except (HTTPException, JWTError, ValueError, asyncio.TimeoutError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Authentication failed")
+        return
+    
+    connection = InferenceConnection(websocket, user, expires_at)
+    connection.outgoing.put_nowait({"type": "ready", "user": user.username, "max_in_flight": settings.WS_MAX_IN_FLIGHT})
+    WS_CONNECTIONS.inc()
+    try:
+        await connection.serve()
+    finally:
+        WS_CONNECTIONS.dec()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Ollama HTTP API, for offline benchmarking.
+
+Implements ``/api/generate`` (streaming NDJSON and non-streaming),
+``/api/embed`` and ``/api/tags`` with configurable time-to-first-token,
+token rate and response length. No model is loaded, so it runs on any
+CPU-only box.
+
+Usage: python -m benchmarks.fake_ollama --port 11435 --ttft-ms 80 --tokens-per-second 50 --tokens 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import zlib
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TTFT_MS = float(os.getenv("FAKE_OLLAMA_TTFT_MS", "50"))
+TOKENS_PER_SECOND = float(os.getenv("FAKE_OLLAMA_TOKENS_PER_SECOND", "100"))
+TOKENS = int(os.getenv("FAKE_OLLAMA_TOKENS", "32"))
+MODELS = os.getenv("FAKE_OLLAMA_MODELS", "gemma:2b").split(",")
+EMBEDDING_DIMENSIONS = 256
+
+app = FastAPI(title="Fake Ollama")
+
+
+def _tokens(prompt: str, count: int):
+    words = (prompt.split() or ["ok"])
+    return [words[i % len(words)] + " " for i in range(count)]
+
+
+def _final_chunk(model: str, prompt: str, count: int, started: float) -> dict:
+    elapsed_ns = int((time.perf_counter() - started) * 1e9)
+    return {
+        "model": model,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "response": "",
+        "done": True,
+        "context": list(range(len(prompt.split()) + count)),
+        "total_duration": elapsed_ns,
+        "prompt_eval_count": len(prompt.split()),
+        "eval_count": count,
+    }
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": model, "model": model, "digest": f"fake-{model}"} for model in MODELS]}
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    model = body.get("model", MODELS[0])
+    prompt = body.get("prompt", "")
+    count = int((body.get("options") or {}).get("num_predict", TOKENS))
+    if count < 0:
+        count = TOKENS
+    tokens = _tokens(prompt, count)
+    started = time.perf_counter()
+    
+    if not body.get("stream", True):
+        await asyncio.sleep(TTFT_MS / 1000 + len(tokens) / TOKENS_PER_SECOND)
+        final = _final_chunk(model, prompt, len(tokens), started)
+        final["response"] = "".join(tokens)
+        return JSONResponse(final)
+    
+    async def stream():
+        await asyncio.sleep(TTFT_MS / 1000)
+        for token in tokens:
+            yield json.dumps({"model": model, "response": token, "done": False}) + "\n"
+            await asyncio.sleep(1 / TOKENS_PER_SECOND)
+        yield json.dumps(_final_chunk(model, prompt, len(tokens), started)) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.post("/api/embed")
+async def embed(request: Request):
+    """Bag-of-words vectors: prompts sharing most words come out near-duplicates"""
+    body = await request.json()
+    texts = body.get("input", [])
+    if isinstance(texts, str):
+        texts = [texts]
+    embeddings = []
+    for text in texts:
+        vector = [0.0] * EMBEDDING_DIMENSIONS
+        for word in text.lower().split():
+            vector[zlib.crc32(word.strip(".,!?").encode()) % EMBEDDING_DIMENSIONS] += 1.0
+        embeddings.append(vector)
+    return {"model": body.get("model", ""), "embeddings": embeddings}
+
+
+def main():
+    global TTFT_MS, TOKENS_PER_SECOND, TOKENS
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft-ms", type=float, default=TTFT_MS)
+    parser.add_argument("--tokens-per-second", type=float, default=TOKENS_PER_SECOND)
+    parser.add_argument("--tokens", type=int, default=TOKENS)
+    args = parser.parse_args()
+    
+    TTFT_MS, TOKENS_PER_SECOND, TOKENS = args.ttft_ms, args.tokens_per_second, args.tokens
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Load generator for the inference service.
+
+Drives one scenario (``login``, ``infer``, ``stream``, ``metrics``) against a
+running server, either closed-loop at a fixed concurrency or open-loop at a
+target request rate, and prints a JSON report with throughput, latency
+percentiles, time-to-first-token (streaming) and, when the server was started
+through ``benchmarks.serve_app``, event-loop lag.
+
+Usage:
+    python -m benchmarks.load_test --scenario infer --concurrency 32 --duration 20
+    python -m benchmarks.load_test --scenario stream --rps 50 --duration 20 --output stream.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+import httpx
+
+USERNAME = "demo"
+PASSWORD = "demo1234"
+SCENARIOS = ("login", "infer", "stream", "metrics")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+    
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class LoadTest:
+    def __init__(self, base_url: str, scenario: str, repeat_prompts: bool = False):
+        self.base_url = base_url.rstrip("/")
+        self.scenario = scenario
+        self.repeat_prompts = repeat_prompts
+        self.latencies_ms: List[float] = []
+        self.ttft_ms: List[float] = []
+        self.statuses: Counter = Counter()
+        self.token: Optional[str] = None
+        self._sequence = itertools.count()
+    
+    async def login(self, client: httpx.AsyncClient) -> str:
+        response = await client.post("/auth/token", data={"username": USERNAME, "password": PASSWORD})
+        response.raise_for_status()
+        return response.json()["access_token"]
+    
+    def _prompt(self) -> str:
+        n = next(self._sequence)
+        return f"Benchmark prompt {n % 10 if self.repeat_prompts else n}"
+    
+    async def one_request(self, client: httpx.AsyncClient):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        start = time.perf_counter()
+        try:
+            if self.scenario == "login":
+                response = await client.post("/auth/token", data={"username": USERNAME, "password": PASSWORD})
+            elif self.scenario == "infer":
+                response = await client.post("/v1/infer", json={"prompt": self._prompt()}, headers=headers)
+            elif self.scenario == "metrics":
+                response = await client.get("/metrics", headers=headers)
+            else:
+                async with client.stream("POST", "/v1/infer/stream", json={"prompt": self._prompt()}, headers=headers) as response:
+                    first = True
+                    async for _ in response.aiter_raw():
+                        if first:
+                            self.ttft_ms.append((time.perf_counter() - start) * 1000)
+                            first = False
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.statuses[status] += 1
+        if status.startswith("2"):
+            self.latencies_ms.append((time.perf_counter() - start) * 1000)
+    
+    async def run(self, duration: float, concurrency: Optional[int] = None, rps: Optional[float] = None) -> dict:
+        limits = httpx.Limits(max_connections=max(concurrency or 0, 1000), max_keepalive_connections=1000)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=120, limits=limits) as client:
+            self.token = await self.login(client)
+            await self._reset_loop_lag(client)
+            
+            started = time.perf_counter()
+            deadline = started + duration
+            if rps:
+                await self._open_loop(client, deadline, rps)
+            else:
+                await self._closed_loop(client, deadline, concurrency or 1)
+            elapsed = time.perf_counter() - started
+            loop_lag = await self._loop_lag(client)
+        
+        return {
+            "scenario": self.scenario,
+            "mode": "rps" if rps else "concurrency",
+            "target_rps": rps,
+            "concurrency": None if rps else (concurrency or 1),
+            "duration_s": round(elapsed, 2),
+            "requests": sum(self.statuses.values()),
+            "statuses": dict(self.statuses),
+            "rps": round(len(self.latencies_ms) / elapsed, 2),
+            "latency_ms": percentiles(self.latencies_ms),
+            "ttft_ms": percentiles(self.ttft_ms) if self.scenario == "stream" else None,
+            "event_loop_lag_ms": loop_lag,
+        }
+    
+    async def _closed_loop(self, client: httpx.AsyncClient, deadline: float, concurrency: int):
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.one_request(client)
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    
+    async def _open_loop(self, client: httpx.AsyncClient, deadline: float, rps: float):
+        interval = 1 / rps
+        next_at = time.perf_counter()
+        tasks = set()
+        while next_at < deadline:
+            task = asyncio.create_task(self.one_request(client))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        if tasks:
+            await asyncio.gather(*tasks)
+    
+    async def _reset_loop_lag(self, client: httpx.AsyncClient):
+        try:
+            await client.get("/__bench/loop-lag", params={"reset": "true"})
+        except httpx.HTTPError:
+            pass
+    
+    async def _loop_lag(self, client: httpx.AsyncClient) -> Optional[dict]:
+        try:
+            response = await client.get("/__bench/loop-lag")
+            return response.json() if response.status_code == 200 else None
+        except httpx.HTTPError:
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="infer")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="closed-loop workers")
+    parser.add_argument("--rps", type=float, help="open-loop target request rate (overrides --concurrency)")
+    parser.add_argument("--repeat-prompts", action="store_true", help="cycle 10 prompts to exercise the cache")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    
+    test = LoadTest(args.base_url, args.scenario, repeat_prompts=args.repeat_prompts)
+    report = asyncio.run(test.run(args.duration, concurrency=args.concurrency, rps=args.rps))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+End-to-end offline benchmark: fake Ollama + the service + load generator.
+
+Starts ``benchmarks.fake_ollama`` and ``benchmarks.serve_app`` as
+subprocesses (rate limiting effectively disabled, response cache bypassed
+unless --repeat-prompts), runs every scenario in turn and writes one JSON
+report suitable for regression tracking.
+
+Usage: python -m benchmarks.run_benchmark --duration 10 --concurrency 32 --output bench_report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.load_test import SCENARIOS, LoadTest
+
+
+def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rps", type=float)
+    parser.add_argument("--repeat-prompts", action="store_true")
+    parser.add_argument("--app-port", type=int, default=8900)
+    parser.add_argument("--ollama-port", type=int, default=11499)
+    parser.add_argument("--ttft-ms", type=float, default=50)
+    parser.add_argument("--tokens-per-second", type=float, default=100)
+    parser.add_argument("--tokens", type=int, default=32)
+    parser.add_argument("--output", default="bench_report.json")
+    args = parser.parse_args()
+    
+    env = dict(
+        os.environ,
+        OLLAMA_BASE_URL=f"http://127.0.0.1:{args.ollama_port}",
+        RATE_LIMIT_REQUESTS="100000000",
+        OLLAMA_NUM_PARALLEL=str(max(args.concurrency, 1)),
+        PROMPT_CACHE_ENABLED="true" if args.repeat_prompts else "false",
+    )
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(args.ollama_port),
+         "--ttft-ms", str(args.ttft_ms), "--tokens-per-second", str(args.tokens_per_second),
+         "--tokens", str(args.tokens)],
+        env=env,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve_app", "--port", str(args.app_port)],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.ollama_port}/api/tags")
+        wait_until_up(f"{base_url}/health")
+        results = []
+        for scenario in args.scenarios.split(","):
+            test = LoadTest(base_url, scenario, repeat_prompts=args.repeat_prompts)
+            concurrency = min(args.concurrency, 4) if scenario == "login" else args.concurrency
+            result = asyncio.run(test.run(args.duration, concurrency=concurrency, rps=args.rps))
+            print(json.dumps(result), flush=True)
+            results.append(result)
+    finally:
+        server.terminate()
+        fake.terminate()
+        server.wait()
+        fake.wait()
+    
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
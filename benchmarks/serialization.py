@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of per-request serialization cost.
+
+Compares the stdlib / FastAPI default paths with the orjson fast path for:
+parsing an Ollama /api/generate body, rendering the /v1/infer response
+(response-model validation vs. a pre-rendered FastJSONResponse), rendering
+/metrics (jsonable_encoder vs. orjson), and compressing a large response and
+a batch of NDJSON results.
+
+Usage: python -m benchmarks.serialization [iterations]
+"""
+import json
+import sys
+import time
+from typing import Callable
+import httpx
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from app.compression import _Compressor, zstandard
+from app.models import InferenceResponse
+from app.serialization import FastJSONResponse
+
+
+def measure(fn: Callable[[], object], iterations: int) -> float:
+    """Return mean microseconds per call"""
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def compare(baseline: Callable[[], object], fast: Callable[[], object], iterations: int) -> dict:
+    slow_us = measure(baseline, iterations)
+    fast_us = measure(fast, iterations)
+    return {
+        "baseline_us": round(slow_us, 2),
+        "fast_us": round(fast_us, 2),
+        "speedup": round(slow_us / fast_us, 1),
+    }
+
+
+def sample_metrics() -> dict:
+    """A /metrics-sized payload: nested sections of counters and per-backend lists"""
+    section = {f"counter_{i}": i * 7 for i in range(20)}
+    section.update({f"rate_{i}": i / 3 for i in range(10)})
+    return {
+        "total_requests": 123456,
+        "latency": {f"p{p}": 12.5 * p for p in (50, 90, 95, 99)},
+        **{name: dict(section) for name in ("cache", "disk_cache", "sessions", "coalescing", "scheduler", "rate_limiter", "logging")},
+        "upstream": {"backends": [dict(section, name=f"gpu-{i}", status="up") for i in range(4)]},
+        "warmup": {"models": [{"backend": "gpu-0", "model": "gemma:2b", "warm": True, "load_seconds": 1.234, "error": None}] * 4},
+    }
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    text = "The quick brown fox jumps over the lazy dog. " * 40  # ~1.8 KB of output
+    upstream_body = json.dumps({
+        "model": "gemma:2b",
+        "created_at": "2024-01-01T00:00:00Z",
+        "response": text,
+        "done": True,
+        "context": list(range(2048)),
+        "total_duration": 812345678,
+        "prompt_eval_count": 26,
+        "eval_count": 298,
+    }).encode()
+    upstream = httpx.Response(200, content=upstream_body, headers={"Content-Type": "application/json"})
+    
+    # FastAPI re-validates a returned model against response_model, then dumps it
+    adapter = TypeAdapter(InferenceResponse)
+    
+    def validated_response():
+        value = adapter.validate_python(InferenceResponse(response=text))
+        return adapter.dump_json(value)
+    
+    metrics = sample_metrics()
+    batch = [
+        orjson.dumps({"index": i, "response": text[: 200 + i], "cache": "miss", "latency_ms": 812.4}) + b"\n"
+        for i in range(100)
+    ]
+    large_body = orjson.dumps({"response": text * 4})
+    
+    def stream_batch(encoding: str) -> int:
+        compressor = _Compressor(encoding)
+        size = sum(len(compressor.compress(line)) for line in batch)
+        return size + len(compressor.compress(b"", final=True))
+    
+    report = {
+        "iterations": iterations,
+        "upstream_parse": compare(lambda: upstream.json(), lambda: orjson.loads(upstream.content), iterations),
+        "infer_response": compare(validated_response, lambda: FastJSONResponse({"response": text}), iterations),
+        "infer_response_jsonable_encoder": compare(
+            lambda: JSONResponse(jsonable_encoder(InferenceResponse(response=text))),
+            lambda: FastJSONResponse({"response": text}),
+            iterations,
+        ),
+        "metrics_response": compare(
+            lambda: JSONResponse(jsonable_encoder(metrics)), lambda: FastJSONResponse(metrics), iterations // 10 or 1
+        ),
+        "compression": {
+            "large_response_bytes": len(large_body),
+            "gzip_us": round(measure(lambda: _Compressor("gzip").compress(large_body, final=True), iterations // 10 or 1), 2),
+            "gzip_bytes": len(_Compressor("gzip").compress(large_body, final=True)),
+            "batch_ndjson_bytes": sum(len(line) for line in batch),
+            "batch_gzip_sync_flush_bytes": stream_batch("gzip"),
+            "batch_gzip_us": round(measure(lambda: stream_batch("gzip"), iterations // 100 or 1), 2),
+        },
+    }
+    if zstandard is not None:
+        report["compression"].update(
+            zstd_us=round(measure(lambda: _Compressor("zstd").compress(large_body, final=True), iterations // 10 or 1), 2),
+            zstd_bytes=len(_Compressor("zstd").compress(large_body, final=True)),
+            batch_zstd_flush_bytes=stream_batch("zstd"),
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
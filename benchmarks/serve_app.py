@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Run app.main:app for benchmarking, with its event-loop lag exposed.
+
+The app's own LoopMonitor samples how late the loop wakes a periodic task;
+its stats are served at ``GET /__bench/loop-lag`` (benchmark builds only, no
+auth) so the load generator can report them next to throughput and latency.
+If the monitor is disabled in settings it is turned on at ``LAG_INTERVAL``.
+
+Usage: python -m benchmarks.serve_app --port 8000
+"""
+import argparse
+import uvicorn
+from app.diagnostics import loop_monitor
+from app.main import app
+from app.metrics import LatencyHistogram
+
+LAG_INTERVAL = 0.05
+
+if loop_monitor.interval <= 0:
+    loop_monitor.interval = LAG_INTERVAL
+
+
+@app.get("/__bench/loop-lag", include_in_schema=False)
+async def loop_lag(reset: bool = False):
+    stats = loop_monitor.stats()
+    if reset:
+        loop_monitor.lag_ms = LatencyHistogram()
+        loop_monitor.blocked = 0
+    return {**stats["lag_ms"], "interval_seconds": stats["interval_seconds"], "blocked": stats["blocked"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
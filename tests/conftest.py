@@ -0,0 +1,84 @@
+import asyncio
+import os
+
+# Settings are read at import time; keep the app off any real Ollama and disk
+os.environ.setdefault("OLLAMA_BASE_URL", "http://ollama.test")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+os.environ.setdefault("DISK_CACHE_ENABLED", "false")
+os.environ.setdefault("STATE_BACKEND", "memory")
+
+import httpx
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from app.auth import create_access_token
+from app.llm_service import ollama_service
+from app.rate_limiter import rate_limiter
+from app.token_budget import token_budget
+
+
+class FakeOllama:
+    """httpx transport answering like Ollama: echoes the prompt back word by word"""
+    
+    def __init__(self):
+        self.generate_calls = 0
+        self.delay = 0.0
+        self.digest = "sha256:test"
+        self.context = [1, 2, 3]
+    
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": name, "digest": self.digest} for name in ollama_service.models()]})
+        if request.url.path == "/api/generate":
+            return self.generate(orjson.loads(request.content))
+        return httpx.Response(404)
+    
+    def generate(self, payload: dict) -> httpx.Response:
+        self.generate_calls += 1
+        words = f"echo {payload.get('prompt', '')}".split()
+        final = {"done": True, "prompt_eval_count": 5, "eval_count": len(words), "context": self.context}
+        if not payload.get("stream"):
+            return httpx.Response(200, content=orjson.dumps({"response": " ".join(words), **final}))
+        
+        async def lines():
+            for word in words:
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                yield orjson.dumps({"response": word + " ", "done": False}) + b"\n"
+            yield orjson.dumps({"response": "", **final}) + b"\n"
+        return httpx.Response(200, content=lines())
+    
+    async def async_handler(self, request: httpx.Request) -> httpx.Response:
+        if self.delay and request.url.path == "/api/generate" and not orjson.loads(request.content).get("stream"):
+            await asyncio.sleep(self.delay)
+        return self.handler(request)
+
+
+@pytest.fixture(autouse=True)
+def fresh_limits():
+    # The demo user's buckets would otherwise run dry over the suite
+    rate_limiter.buckets.clear()
+    token_budget.buckets.clear()
+
+
+@pytest.fixture
+def fake_ollama():
+    fake = FakeOllama()
+    originals = [backend._client for backend in ollama_service.backends]
+    for backend in ollama_service.backends:
+        backend._client = httpx.AsyncClient(base_url=backend.base_url, transport=httpx.MockTransport(fake.async_handler))
+    yield fake
+    for backend, original in zip(ollama_service.backends, originals):
+        backend._client = original
+
+
+@pytest.fixture
+def client(fake_ollama):
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def token() -> str:
+    return create_access_token({"sub": "demo"})
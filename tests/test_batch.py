@@ -0,0 +1,69 @@
+import asyncio
+import orjson
+from app.config import settings
+
+
+def _batch(client, token, **kwargs):
+    return client.post("/v1/infer/batch", headers={"Authorization": f"Bearer {token}", **kwargs.pop("headers", {})}, **kwargs)
+
+
+def _lines(response) -> list:
+    return [orjson.loads(line) for line in response.text.splitlines()]
+
+
+def test_json_array_batch(client, token, fake_ollama):
+    response = _batch(client, token, json=["a", {"prompt": "b", "id": "x"}, {"nope": 1}])
+    assert response.status_code == 200
+    *results, summary = _lines(response)
+    assert sorted(result["index"] for result in results) == [0, 1, 2]
+    assert {result.get("id") for result in results} == {None, "x"}
+    assert summary["summary"]["total"] == 3 and summary["summary"]["failed"] == 1
+
+
+def test_malformed_json_array_is_rejected_up_front(client, token, fake_ollama, monkeypatch):
+    assert _batch(client, token, content=b"[", headers={"Content-Type": "application/json"}).status_code == 400
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 2)
+    assert _batch(client, token, json=["a", "b", "c"]).status_code == 413
+
+
+def test_oversized_jsonl_upload_ends_with_error_line(client, token, fake_ollama, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 2)
+    body = b"\n".join(orjson.dumps({"prompt": f"q{i}"}) for i in range(3))
+    response = _batch(client, token, content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert "exceeds" in _lines(response)[-1]["error"]
+
+
+def test_jsonl_results_stream_before_upload_ends(fake_ollama, token):
+    from app.main import app
+    sent = []
+    
+    def result_sent() -> bool:
+        return any(b'"index"' in message.get("body", b"") for message in sent)
+    
+    chunks = [orjson.dumps({"prompt": "first"}) + b"\n", orjson.dumps({"prompt": "second"}) + b"\n"]
+    
+    async def receive():
+        if chunks:
+            if len(chunks) == 1:
+                # Hold the rest of the upload until the first result is out
+                while not result_sent():
+                    await asyncio.sleep(0.01)
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        await asyncio.Event().wait()
+    
+    async def send(message):
+        sent.append(message)
+    
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/v1/infer/batch", "raw_path": b"/v1/infer/batch",
+        "root_path": "", "query_string": b"", "server": ("test", 80), "client": ("test", 1234),
+        "headers": [(b"authorization", f"Bearer {token}".encode()), (b"content-type", b"application/x-ndjson")],
+    }
+    asyncio.run(asyncio.wait_for(app(scope, receive, send), timeout=10))
+    body = b"".join(message.get("body", b"") for message in sent)
+    *results, summary = [orjson.loads(line) for line in body.splitlines()]
+    assert [result["response"] for result in results] == ["echo first", "echo second"]
+    assert summary["summary"]["total"] == 2
@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from app.coalescer import RequestCoalescer
+
+
+class Upstream:
+    """Stand-in generation that runs until released, recording cancellation"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+    
+    async def generate(self) -> str:
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "result"
+    
+    async def stream(self):
+        self.calls += 1
+        try:
+            for chunk in ("a", "b", "c"):
+                await self.release.wait()
+                yield chunk
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def test_identical_requests_share_one_call():
+    async def scenario():
+        coalescer, upstream = RequestCoalescer(), Upstream()
+        waiters = [asyncio.ensure_future(coalescer.run("k", upstream.generate)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(*waiters)
+        assert [result for result, _ in results] == ["result"] * 3
+        assert [coalesced for _, coalesced in results] == [False, True, True]
+        assert upstream.calls == 1 and coalescer.stats()["in_flight"] == 0
+    
+    asyncio.run(scenario())
+
+
+def test_upstream_survives_until_the_last_waiter_leaves():
+    async def scenario():
+        coalescer, upstream = RequestCoalescer(), Upstream()
+        leader = asyncio.ensure_future(coalescer.run("k", upstream.generate))
+        follower = asyncio.ensure_future(coalescer.run("k", upstream.generate))
+        await asyncio.sleep(0)
+        
+        leader.cancel()
+        await asyncio.sleep(0)
+        assert not upstream.cancelled
+        upstream.release.set()
+        assert await follower == ("result", True)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+    
+    asyncio.run(scenario())
+
+
+def test_cancelling_every_waiter_cancels_upstream_and_frees_the_key():
+    async def scenario():
+        coalescer, upstream = RequestCoalescer(), Upstream()
+        waiters = [asyncio.ensure_future(coalescer.run("k", upstream.generate)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert upstream.cancelled and coalescer.stats()["in_flight"] == 0
+        
+        # A new request starts a fresh call rather than joining the cancelled one
+        retry = asyncio.ensure_future(coalescer.run("k", upstream.generate))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        assert await retry == ("result", False)
+        assert upstream.calls == 2
+    
+    asyncio.run(scenario())
+
+
+def test_stream_replays_to_late_joiners_and_stops_when_all_leave():
+    async def scenario():
+        coalescer, upstream = RequestCoalescer(), Upstream()
+        first, _ = coalescer.stream("k", upstream.stream)
+        upstream.release.set()
+        assert await first.__anext__() == "a"
+        
+        late, coalesced = coalescer.stream("k", upstream.stream)
+        assert coalesced
+        assert [chunk async for chunk in late] == ["a", "b", "c"]
+        await first.aclose()
+        assert upstream.calls == 1
+        
+        upstream.release.clear()
+        abandoned, _ = coalescer.stream("other", upstream.stream)
+        pending = asyncio.ensure_future(abandoned.__anext__())
+        await asyncio.sleep(0)
+        pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+        await abandoned.aclose()
+        await asyncio.sleep(0)
+        assert upstream.cancelled and coalescer.stats()["in_flight_streams"] == 0
+    
+    asyncio.run(scenario())
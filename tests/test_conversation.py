@@ -0,0 +1,52 @@
+import asyncio
+import httpx
+from app import conversation
+from app.scheduler import inference_scheduler
+from app.sessions import session_store
+
+
+def _chat(client, token, **body):
+    return client.post("/v1/chat", json=body, headers={"Authorization": f"Bearer {token}"})
+
+
+def test_turns_continue_the_session(client, token, fake_ollama):
+    first = _chat(client, token, message="hello")
+    assert first.status_code == 200
+    session_id = first.json()["session_id"]
+    second = _chat(client, token, message="again", session_id=session_id)
+    assert second.status_code == 200
+    assert second.json()["turn"] == 2
+
+
+def test_full_session_is_closed(client, token, fake_ollama, monkeypatch):
+    monkeypatch.setattr(session_store, "max_context_tokens", len(fake_ollama.context) - 1)
+    first = _chat(client, token, message="hello")
+    assert first.status_code == 200
+    assert first.json()["context_full"] is True
+    
+    calls = fake_ollama.generate_calls
+    second = _chat(client, token, message="again", session_id=first.json()["session_id"])
+    assert second.status_code == 409
+    assert fake_ollama.generate_calls == calls
+
+
+def test_cancelled_turn_returns_its_reservation(fake_ollama, token, monkeypatch):
+    from app.main import app
+    settled = []
+    monkeypatch.setattr(conversation, "settle_tokens", lambda *args: settled.append(args))
+    fake_ollama.delay = 5.0
+    
+    async def cancel_mid_turn():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            request = asyncio.ensure_future(
+                http.post("/v1/chat", json={"message": "hello"}, headers={"Authorization": f"Bearer {token}"})
+            )
+            while not inference_scheduler.stats()["active"]:
+                await asyncio.sleep(0.01)
+            request.cancel()
+            await asyncio.gather(request, return_exceptions=True)
+    
+    asyncio.run(cancel_mid_turn())
+    assert len(settled) == 1
+    user_id, _, _, reserved = settled[0]
+    assert user_id == "demo" and reserved > 0
@@ -0,0 +1,44 @@
+import asyncio
+import httpx
+import pytest
+from app.deadlines import Deadline, DeadlineExceededError
+from app.llm_service import ollama_service
+
+
+def test_upstream_timeout_is_remaining_budget(fake_ollama):
+    timeouts = []
+    backend = ollama_service.backends[0]
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        timeouts.append(request.extensions["timeout"]["read"])
+        return fake_ollama.handler(request)
+    
+    backend._client = httpx.AsyncClient(base_url=backend.base_url, transport=httpx.MockTransport(handler))
+    result = asyncio.run(backend.generate_result(ollama_service.model, "hi", deadline=Deadline(5.0)))
+    assert result["response"] == "echo hi"
+    assert 4.0 < timeouts[0] <= 5.0
+
+
+def test_deadline_timeout_does_not_trip_breaker(fake_ollama):
+    backend = ollama_service.backends[0]
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ReadTimeout("timed out", request=request)
+    
+    backend._client = httpx.AsyncClient(base_url=backend.base_url, transport=httpx.MockTransport(handler))
+    failures = backend.failures
+    with pytest.raises(DeadlineExceededError) as error:
+        asyncio.run(backend.generate_result(ollama_service.model, "hi", deadline=Deadline(5.0)))
+    assert error.value.stage == "upstream"
+    assert backend.failures == failures
+
+
+def test_chat_answers_504_when_deadline_passes(client, token, fake_ollama):
+    fake_ollama.delay = 1.0
+    response = client.post(
+        "/v1/chat",
+        json={"message": "hello there"},
+        headers={"Authorization": f"Bearer {token}", "X-Request-Timeout": "0.2"},
+    )
+    assert response.status_code == 504
+    assert "upstream" in response.json()["detail"]
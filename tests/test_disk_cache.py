@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import os
+import pytest
+from app import inference
+from app.config import settings
+from app.disk_cache import DiskCache
+from app.llm_service import ollama_service
+from app.models import User
+
+
+def key(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+    
+    def make(max_bytes: int = 1 << 20) -> DiskCache:
+        cache = DiskCache(str(tmp_path), max_bytes=max_bytes, ttl_seconds=3600, initial_slots=64)
+        assert cache.open()
+        caches.append(cache)
+        return cache
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def test_entries_survive_a_restart(make_cache):
+    cache = make_cache()
+    cache.put(key("a"), "alpha", "m", "v1")
+    cache.close()
+    reopened = make_cache()
+    assert reopened.get(key("a")) == "alpha"
+    assert reopened.get(key("b")) is None
+
+
+def test_unindexed_tail_is_replayed_and_torn_record_dropped(make_cache, tmp_path):
+    cache = make_cache()
+    cache.put(key("a"), "alpha", "m", "v1")
+    cache.flush()
+    with open(cache.index_path, "rb") as f:
+        stale_index = f.read()
+    # Appended after the index was last persisted, then the process dies mid-write
+    cache.put(key("b"), "beta", "m", "v1")
+    cache._segment.write(b"\x01\x02\x03")
+    cache._segment.flush()
+    cache.close()
+    with open(cache.index_path, "wb") as f:
+        f.write(stale_index)
+    
+    reopened = make_cache()
+    assert reopened.replayed == 1
+    assert reopened.get(key("a")) == "alpha"
+    assert reopened.get(key("b")) == "beta"
+    reopened.put(key("c"), "gamma", "m", "v1")
+    assert reopened.get(key("c")) == "gamma"
+
+
+def test_unknown_version_is_not_written(make_cache):
+    cache = make_cache()
+    cache.put(key("a"), "alpha", "m", "v1")
+    cache.put(key("b"), "beta", "m", "")
+    assert cache.get(key("b")) is None
+    assert cache._live_entries() and cache.stats()["writes"] == 1
+
+
+def test_compaction_keeps_the_newest_entries_within_budget(make_cache):
+    cache = make_cache(max_bytes=4096)
+    for i in range(80):
+        cache.put(key(f"k{i}"), "x" * 40, "m", "v1")
+    stats = cache.stats()
+    assert stats["compactions"] >= 1 and stats["segment_bytes"] <= 4096
+    assert cache.get(key("k0")) is None
+    assert cache.get(key("k79")) == "x" * 40
+
+
+def test_compaction_drops_entries_of_an_older_model_build(make_cache):
+    cache = make_cache()
+    cache.put(key("old"), "stale build", "m", "v1")
+    cache.put(key("other"), "other model", "n", "v1")
+    cache.put(key("new"), "fresh build", "m", "v2")
+    with cache.lock:
+        cache._compact()
+    assert cache.get(key("old")) is None
+    assert cache.get(key("other")) == "other model"
+    assert cache.get(key("new")) == "fresh build"
+
+
+def test_disk_tier_is_skipped_until_the_model_version_is_known(fake_ollama, monkeypatch):
+    calls = []
+    
+    class Recorder:
+        def get(self, *args):
+            calls.append("get")
+        
+        def put(self, *args):
+            calls.append("put")
+    monkeypatch.setattr(settings, "DISK_CACHE_ENABLED", True)
+    monkeypatch.setattr(inference, "disk_cache", Recorder())
+    user = User(username="demo")
+    
+    async def main():
+        await inference.run_inference("before probe", None, user)
+        await ollama_service.probe()
+        await inference.run_inference("after probe", None, user)
+        await asyncio.gather(*inference._pending_writes)
+    
+    for backend in ollama_service.backends:
+        monkeypatch.setattr(backend, "model_digests", {})
+    asyncio.run(main())
+    assert calls == ["get", "put"]
@@ -0,0 +1,45 @@
+import random
+from app.metrics import LatencyHistogram, MetricsTracker
+
+
+def _quantile_by_scan(histogram: LatencyHistogram, q: float) -> float:
+    rank = q * (histogram.count - 1)
+    seen = 0
+    for index in sorted(histogram.counts):
+        seen += histogram.counts[index]
+        if seen > rank:
+            return min(histogram._bucket_value(index), histogram.max)
+    return histogram.max
+
+
+def test_quantiles_match_individual_scans():
+    rng = random.Random(7)
+    histogram = LatencyHistogram()
+    values = [rng.lognormvariate(3, 1) for _ in range(5000)]
+    for value in values:
+        histogram.record(value)
+    qs = [0.0, 0.5, 0.9, 0.95, 0.99, 1.0]
+    assert histogram.quantiles(qs) == [_quantile_by_scan(histogram, q) for q in qs]
+    
+    values.sort()
+    for q, estimate in zip(qs, histogram.quantiles(qs)):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(estimate - exact) / exact < 0.02
+
+
+def test_summary_of_empty_and_single_value():
+    assert LatencyHistogram().summary()["p99"] == 0
+    histogram = LatencyHistogram()
+    histogram.record(12.5)
+    summary = histogram.summary()
+    assert summary["p50"] == summary["p99"] == summary["max"] == 12.5
+
+
+def test_tracker_merge_and_drain():
+    tracker, other = MetricsTracker(), MetricsTracker()
+    tracker.record_request(10.0, success=True)
+    other.record_request(20.0, success=False)
+    tracker.merge(other.drain())
+    metrics = tracker.get_metrics()
+    assert (metrics["total_requests"], metrics["successful_requests"], metrics["failed_requests"]) == (2, 1, 1)
+    assert other.get_metrics()["total_requests"] == 0
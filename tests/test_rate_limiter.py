@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+from app import rate_limiter as rate_limiter_module
+from app.rate_limiter import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_up_to_the_limit_then_refill(clock):
+    limiter = RateLimiter(requests=3, window=30)
+    assert [limiter.acquire("u").allowed for _ in range(4)] == [True, True, True, False]
+    
+    denied = limiter.acquire("u")
+    assert denied.retry_after == pytest.approx(10.0)
+    clock.now += 10
+    allowed = limiter.acquire("u")
+    assert allowed.allowed and allowed.remaining == 0
+    assert allowed.reset_after == pytest.approx(30.0)
+
+
+def test_bucket_never_overfills(clock):
+    limiter = RateLimiter(requests=2, window=10)
+    limiter.acquire("u")
+    clock.now += 1000
+    assert limiter.acquire("u").remaining == 1
+
+
+def test_check_rate_limit_raises_429_with_retry_after(clock):
+    limiter = RateLimiter(requests=1, window=60)
+    limiter.check_rate_limit("u")
+    with pytest.raises(HTTPException) as error:
+        limiter.check_rate_limit("u")
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "60"
+    assert error.value.headers["X-RateLimit-Remaining"] == "0"
+
+
+def test_idle_buckets_are_evicted_once_refilled(clock):
+    limiter = RateLimiter(requests=2, window=10)
+    limiter.acquire("idle")
+    clock.now += 5
+    limiter.acquire("busy")
+    clock.now += 6
+    assert limiter.evict_idle() == 1
+    assert set(limiter.buckets) == {"busy"}
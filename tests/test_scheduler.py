@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from app.config import settings
+from app.llm_service import OllamaService
+from app.scheduler import InferenceScheduler, ModelSchedulers
+
+
+def make_scheduler(concurrency: int = 1) -> InferenceScheduler:
+    return InferenceScheduler("m", concurrency, max_queue_wait=100, max_queue_size=100)
+
+
+def test_users_are_interleaved_and_cancelled_waiters_skipped():
+    scheduler = make_scheduler()
+    order = []
+    
+    async def job(user: str, i: int):
+        async with scheduler.slot(user):
+            order.append(f"{user}{i}")
+            await asyncio.sleep(0.001)
+    
+    async def main():
+        tasks = [asyncio.ensure_future(job("A", i)) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(job("B", 0)))
+        await asyncio.sleep(0)
+        tasks[2].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    asyncio.run(main())
+    assert order == ["A0", "A1", "B0", "A3"]
+    assert scheduler.active == 0 and scheduler.queued == 0
+
+
+def test_service_time_follows_completed_calls_only():
+    scheduler = make_scheduler()
+    initial = scheduler.service_time_ewma
+    
+    async def abandoned():
+        async with scheduler.slot("u"):
+            await asyncio.sleep(10)
+    
+    async def failed():
+        async with scheduler.slot("u"):
+            await asyncio.sleep(0.05)
+            raise RuntimeError("upstream error")
+    
+    async def main():
+        task = asyncio.ensure_future(abandoned())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await failed()
+        assert scheduler.service_time_ewma == initial
+        async with scheduler.slot("u"):
+            pass
+    asyncio.run(main())
+    assert scheduler.service_time_ewma < initial
+    assert scheduler.active == 0
+
+
+def test_each_model_gets_the_slots_of_its_backends(monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_BACKENDS", [
+        {"name": "big", "url": "http://big.test", "models": ["a", "b"], "num_parallel": 8},
+        {"name": "small", "url": "http://small.test", "models": ["b"], "num_parallel": 1},
+    ])
+    monkeypatch.setattr(settings, "OLLAMA_MODEL", "a")
+    service = OllamaService()
+    monkeypatch.setattr("app.scheduler.ollama_service", service)
+    schedulers = ModelSchedulers(max_queue_wait=100, max_queue_size=100)
+    assert schedulers.for_model("a").concurrency == 8
+    assert schedulers.for_model("b").concurrency == 9
+    assert schedulers.for_model().model == "a"
+    assert schedulers.stats()["concurrency"] == 17
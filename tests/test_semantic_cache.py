@@ -0,0 +1,33 @@
+import time
+from app.semantic_cache import SemanticCache
+
+
+def test_paraphrase_hits_within_scope():
+    cache = SemanticCache(max_entries=4, threshold=0.9)
+    cache.put([1.0, 0.0, 0.1], scope=1, response="first")
+    response, similarity = cache.lookup([1.0, 0.0, 0.12], scope=1, key="a")
+    assert response == "first" and similarity > 0.99
+    assert cache.lookup([1.0, 0.0, 0.12], scope=2, key="b") is None
+    assert cache.lookup([0.0, 1.0, 0.0], scope=1, key="c") is None
+
+
+def test_stats_count_live_entries_not_high_water():
+    cache = SemanticCache(max_entries=4, threshold=0.9, ttl_seconds=10)
+    cache.put([1.0, 0.0], scope=1, response="old")
+    cache.put([0.0, 1.0], scope=1, response="new")
+    assert cache.stats()["entries"] == 2
+    
+    cache.expires_at[0] = time.monotonic() - 1
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["high_water"] == 2
+
+
+def test_full_cache_reuses_expired_slot_first():
+    cache = SemanticCache(max_entries=2, threshold=0.9)
+    cache.put([1.0, 0.0], scope=1, response="a")
+    cache.put([0.0, 1.0], scope=1, response="b")
+    cache.expires_at[1] = time.monotonic() - 1
+    cache.put([0.7, 0.7], scope=1, response="c")
+    assert cache.responses == ["a", "c"]
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import pytest
+from app import state_backend
+from app.config import settings
+from app.metrics import MetricsTracker, MetricsTrackerProxy
+from app.rate_limiter import RateLimiter, RateLimiterProxy
+from app.state_backend import offload
+from app.token_budget import TokenBudgetProxy
+
+
+@pytest.fixture(scope="module")
+def state_server(tmp_path_factory):
+    address = str(tmp_path_factory.mktemp("state") / "state.sock")
+    original = settings.STATE_BACKEND_ADDRESS
+    settings.STATE_BACKEND_ADDRESS = address
+    assert state_backend._start_server_thread()
+    yield address
+    settings.STATE_BACKEND_ADDRESS = original
+
+
+def test_offload_runs_remote_calls_off_the_event_loop(state_server):
+    limiter = RateLimiterProxy("rate_limiter")
+    threads = []
+    original = limiter._call
+    
+    def call(method, *args, **kwargs):
+        threads.append(threading.current_thread())
+        return original(method, *args, **kwargs)
+    limiter._call = call
+    
+    async def main():
+        result = await offload(limiter.check_rate_limit, "offload-user")
+        assert result.allowed
+        return threading.current_thread()
+    loop_thread = asyncio.run(main())
+    assert threads and loop_thread not in threads
+
+
+def test_offload_calls_local_components_inline():
+    limiter = RateLimiter(requests=1, window=60)
+    
+    async def main():
+        first = await offload(limiter.acquire, "inline-user")
+        second = await offload(limiter.acquire, "inline-user")
+        return first.allowed, second.allowed
+    assert asyncio.run(main()) == (True, False)
+
+
+def test_metrics_are_recorded_locally_and_merged_on_read(state_server, monkeypatch):
+    monkeypatch.setattr(settings, "STATE_BACKEND_FLUSH_INTERVAL", 3600)
+    tracker = MetricsTrackerProxy("metrics_tracker")
+    calls = []
+    original = tracker._call
+    tracker._call = lambda method, *args, **kwargs: calls.append(method) or original(method, *args, **kwargs)
+    
+    before = tracker.get_metrics()["total_requests"]
+    calls.clear()
+    for _ in range(50):
+        tracker.record_request(12.5, success=True)
+    tracker.record_cutoff(deadline_exceeded=True)
+    assert calls == []
+    
+    metrics = tracker.get_metrics()
+    assert metrics["total_requests"] == before + 50
+    assert metrics["deadline_exceeded"] >= 1
+    assert calls == ["merge", "get_metrics"]
+
+
+def test_drain_hands_over_and_resets():
+    tracker = MetricsTracker()
+    tracker.record_request(5.0, success=False)
+    drained = tracker.drain()
+    assert drained.failed_requests == 1 and drained.latency.lifetime.count == 1
+    assert tracker.failed_requests == 0 and tracker.latency.lifetime.count == 0
+    tracker.merge(drained)
+    assert tracker.get_metrics()["failed_requests"] == 1
+
+
+def test_settle_is_posted_in_order(state_server, monkeypatch):
+    monkeypatch.setattr(settings, "TOKEN_BUDGET_USER_OVERRIDES", {"posted-user": 1000})
+    budget = TokenBudgetProxy("token_budget")
+    reserved = budget.reserve("posted-user", None, 100)
+    budget.settle("posted-user", None, "m", 100, 10)
+    budget._poster.submit(lambda: None).result()
+    after = budget.reserve("posted-user", None, 0)
+    assert after.remaining > reserved.remaining
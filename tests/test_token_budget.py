@@ -0,0 +1,49 @@
+import pytest
+from app import rate_limiter as rate_limiter_module
+from app.config import settings
+from app.token_budget import TokenBudget, apply_max_tokens, estimate_tokens, token_budget
+
+
+@pytest.fixture
+def budget(monkeypatch) -> TokenBudget:
+    monkeypatch.setitem(settings.TOKEN_BUDGET_USER_OVERRIDES, "u", 1000)
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", lambda: 1000.0)
+    return TokenBudget()
+
+
+def test_estimate_uses_the_completion_cap():
+    options = apply_max_tokens({"num_predict": 500}, 64)
+    assert options["num_predict"] == 64
+    assert estimate_tokens("x" * 40, options) == 40 // settings.TOKEN_ESTIMATE_CHARS_PER_TOKEN + 64
+
+
+def test_settle_refunds_unused_reservation(budget):
+    assert budget.reserve("u", None, 300).remaining == 700
+    budget.settle("u", None, "m", 300, 120)
+    assert budget.buckets["u"].tokens == 880
+    assert budget.stats()["top_usage"][0]["tokens"] == 120
+
+
+def test_overrun_leaves_the_bucket_in_debt(budget):
+    budget.reserve("u", None, 300)
+    budget.settle("u", None, "m", 300, 1500)
+    assert budget.buckets["u"].tokens == -500
+    assert not budget.reserve("u", None, 1).allowed
+
+
+def test_full_refund_of_a_free_request(budget):
+    budget.reserve("u", None, 300)
+    budget.settle("u", None, "m", 300, 0)
+    assert budget.buckets["u"].tokens == 1000
+    assert budget.stats()["top_usage"] == []
+
+
+def test_cache_hit_is_refunded_in_full(client, token, fake_ollama, monkeypatch):
+    monkeypatch.setitem(settings.TOKEN_BUDGET_USER_OVERRIDES, "demo", 100000)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/v1/infer", json={"prompt": "budget probe"}, headers=headers).headers["X-Cache"] == "MISS"
+    after_miss = token_budget.buckets["demo"].tokens
+    assert client.post("/v1/infer", json={"prompt": "budget probe"}, headers=headers).headers["X-Cache"] == "HIT"
+    # Refill only adds, so a charged hit would show up as a drop
+    assert token_budget.buckets["demo"].tokens >= after_miss
+    assert 100000 - after_miss == pytest.approx(5 + len("echo budget probe".split()), abs=1)
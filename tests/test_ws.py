@@ -0,0 +1,72 @@
+import orjson
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+
+def test_header_auth_and_interleaved_prompts(client, token):
+    with client.websocket_connect("/v1/ws", headers={"Authorization": f"Bearer {token}"}) as ws:
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"id": 1, "prompt": "one two"})
+        ws.send_json({"id": "b", "prompt": "three", "stream": False})
+        done = {}
+        tokens = []
+        while len(done) < 2:
+            message = ws.receive_json()
+            if message["type"] == "token":
+                tokens.append(message["token"])
+            else:
+                assert message["type"] == "done", message
+                done[message["id"]] = message
+        assert "".join(tokens).split() == ["echo", "one", "two"]
+        assert done["b"]["response"] == "echo three"
+
+
+def test_first_message_auth_as_text(client, token):
+    with client.websocket_connect("/v1/ws") as ws:
+        ws.send_text(orjson.dumps({"type": "auth", "token": token}).decode())
+        ready = ws.receive_json()
+        assert ready["type"] == "ready" and ready["user"] == "demo"
+
+
+def test_first_message_auth_as_binary_frame(client, token):
+    with client.websocket_connect("/v1/ws") as ws:
+        ws.send_bytes(orjson.dumps({"type": "auth", "token": token}))
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_bytes(orjson.dumps({"id": 1, "prompt": "hi", "stream": False}))
+        assert ws.receive_json()["response"] == "echo hi"
+
+
+@pytest.mark.parametrize("frame", [b"not json", orjson.dumps({"type": "auth", "token": "bogus"})])
+def test_bad_binary_auth_closes_with_policy_violation(client, frame):
+    with client.websocket_connect("/v1/ws") as ws:
+        ws.send_bytes(frame)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1008
+
+
+def test_message_size_is_counted_in_bytes(client, token, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "WS_MAX_MESSAGE_BYTES", 100)
+    with client.websocket_connect("/v1/ws", headers={"Authorization": f"Bearer {token}"}) as ws:
+        ws.receive_json()
+        # 60 characters, 120 bytes
+        ws.send_text(orjson.dumps({"id": 1, "prompt": "é" * 60}).decode())
+        assert ws.receive_json()["status"] == 413
+
+
+def test_in_flight_limit_and_duplicate_ids(client, token, fake_ollama, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "WS_MAX_IN_FLIGHT", 1)
+    fake_ollama.delay = 0.05
+    with client.websocket_connect("/v1/ws", headers={"Authorization": f"Bearer {token}"}) as ws:
+        ws.receive_json()
+        ws.send_json({"id": 1, "prompt": "slow prompt"})
+        ws.send_json({"id": 1, "prompt": "again"})
+        ws.send_json({"id": 2, "prompt": "another"})
+        errors = {}
+        while len(errors) < 2:
+            message = ws.receive_json()
+            if message["type"] == "error":
+                errors[message["status"]] = message
+        assert set(errors) == {409, 429}